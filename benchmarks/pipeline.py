@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    End-to-end benchmark of the fritzinfluxdb data pipeline.
+
+    The real FritzBoxHandler, FritzBoxLuaHandler and InfluxHandler are connected to the local FritzBox and
+    InfluxDB simulators. First all services are polled for a number of rounds and the measurements get written
+    to the InfluxDB simulator (poll latency and write throughput). Afterwards the responses of the last round
+    are processed repeatedly without any network involved to get the throughput of each pipeline stage
+    (parse, extract, build, serialize). A final pass with tracemalloc enabled reports allocations per point.
+
+    The result is written as JSON and can be compared against a previous run to detect regressions.
+
+    usage: python3 -m benchmarks.pipeline --hosts 500 --devices 50 --output report.json --compare baseline.json
+"""
+
+import asyncio
+import configparser
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tracemalloc
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from datetime import datetime
+
+import pytz
+
+from benchmarks.report import StageTimer, latency_summary, peak_rss_kb, compare_reports
+from fritzinfluxdb.classes.fritzbox.handler import FritzBoxHandler, FritzBoxLuaHandler
+from fritzinfluxdb.classes.influxdb.handler import InfluxHandler
+from fritzinfluxdb.log import get_logger
+from simulator.common import FaultInjection
+from simulator.fritzbox import FritzBoxSimulator, FritzBoxSimulatorData
+from simulator.influxdb import InfluxDBSimulator
+
+log = get_logger()
+
+base_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class PipelineBenchmark:
+    """
+        runs the collectors and the writer against the simulators and measures each stage
+    """
+
+    def __init__(self, args):
+
+        self.args = args
+
+        self.fritzbox_simulator = FritzBoxSimulator(
+            FritzBoxSimulatorData(hosts=args.hosts, devices=args.devices, log_lines=args.log_lines, calls=args.calls,
+                                  fw_version=args.fw_version, link_type=args.link_type, seed=args.seed),
+            FaultInjection(latency=args.latency, seed=args.seed), tr064_port=0, http_port=0
+        )
+        self.influxdb_simulator = InfluxDBSimulator(FaultInjection(latency=args.influxdb_latency, seed=args.seed),
+                                                    port=0)
+
+        self.tr069_handler = None
+        self.lua_handler = None
+        self.influx_handler = None
+
+        # raw responses of the last poll round used for the offline stages
+        self.tr069_responses = list()
+        self.lua_responses = list()
+
+        self.poll_latencies = {"tr069": list(), "lua": list()}
+        self.stages = {
+            "tr069_parse": StageTimer("tr069_parse", "responses"),
+            "tr069_extract": StageTimer("tr069_extract"),
+            "lua_parse": StageTimer("lua_parse", "responses"),
+            "lua_extract": StageTimer("lua_extract"),
+            "build": StageTimer("build"),
+            "serialize": StageTimer("serialize"),
+            "write": StageTimer("write")
+        }
+        self.memory = dict()
+
+    def setup(self):
+
+        self.fritzbox_simulator.start()
+        self.influxdb_simulator.start()
+
+        config = configparser.ConfigParser()
+        config.read_dict({
+            "fritzbox": {
+                "hostname": self.fritzbox_simulator.address,
+                "port": f"{self.fritzbox_simulator.tr064_port}",
+                "username": self.fritzbox_simulator.username,
+                "password": self.fritzbox_simulator.password,
+                "cache_enabled": "false"
+            },
+            "influxdb": {
+                "version": f"{self.args.influxdb_version}",
+                "hostname": self.influxdb_simulator.address,
+                "port": f"{self.influxdb_simulator.port}",
+                "database": "fritzbox",
+                "bucket": "fritzbox",
+                "organisation": self.influxdb_simulator.organisation.get("name"),
+                "token": "benchmark"
+            }
+        })
+
+        self.tr069_handler = FritzBoxHandler(config)
+        self.tr069_handler.connect()
+
+        self.lua_handler = FritzBoxLuaHandler(self.tr069_handler.config)
+        # the Lua handler always uses the default http port
+        self.lua_handler.url = f"http://{self.fritzbox_simulator.address}:{self.fritzbox_simulator.http_port}"
+        self.lua_handler.connect()
+
+        self.influx_handler = InfluxHandler(config, user_agent="fritzinfluxdb-benchmark")
+        self.influx_handler.connect()
+
+        for handler in [self.tr069_handler, self.lua_handler, self.influx_handler]:
+            if handler.init_successful is False:
+                raise RuntimeError(f"Unable to connect {handler.__class__.__name__} to simulator")
+
+        # initial discovery run
+        for handler in [self.tr069_handler, self.lua_handler]:
+            for service in handler.services:
+                handler.query_service_data(service)
+            handler.current_result_list = list()
+            handler.discovery_done = True
+
+    def teardown(self):
+
+        for handler in [self.tr069_handler, self.lua_handler, self.influx_handler]:
+            if handler is not None:
+                handler.close()
+
+        self.fritzbox_simulator.stop()
+        self.influxdb_simulator.stop()
+
+    def record_responses(self):
+        """
+        keep the raw responses of every request made by the FritzBox handlers
+        """
+
+        current_service = dict()
+
+        def record_soap_response(response, fc_service, action_name):
+            self.tr069_responses.append((current_service.get("tr069"), fc_service, action_name, response))
+            return original_parse_response(response, fc_service, action_name)
+
+        def record_lua_response(*args, **kwargs):
+            response = original_request(*args, **kwargs)
+            self.lua_responses.append((current_service.get("lua"), response))
+            return response
+
+        original_parse_response = self.tr069_handler.session.soaper.parse_response
+        original_request = self.lua_handler.session.request
+
+        self.tr069_handler.session.soaper.parse_response = record_soap_response
+        self.lua_handler.session.request = record_lua_response
+
+        return current_service
+
+    def poll(self):
+        """
+        request all available services like the task loops do and write all measurements to InfluxDB
+        """
+
+        current_service = self.record_responses()
+
+        for poll_round in range(self.args.rounds):
+
+            # only keep responses of the last round
+            self.tr069_responses.clear()
+            self.lua_responses.clear()
+
+            # every round has to request the simulator, not the response caches
+            self.lua_handler.response_cache.clear()
+            self.tr069_handler.action_results.clear()
+
+            measurements = list()
+            for name, handler in [("tr069", self.tr069_handler), ("lua", self.lua_handler)]:
+
+                handler.current_result_list = list()
+                for service in [x for x in handler.services if x.available is True]:
+
+                    # make sure the service gets requested
+                    service.last_query = None
+                    service.next_query = None
+
+                    current_service[name] = service
+                    with StageTimer(name).measure() as timer:
+                        handler.query_service_data(service)
+                    self.poll_latencies[name].extend(timer.samples)
+
+                measurements.extend(handler.current_result_list)
+
+            asyncio.run(self.write(measurements))
+
+            log.debug(f"Poll round {poll_round + 1}/{self.args.rounds}: {len(measurements)} measurements")
+
+    async def write(self, measurements):
+
+        influx_handler = self.influx_handler
+        influx_handler.buffer.extend(measurements)
+
+        stage = self.stages.get("write")
+        with stage.measure():
+            while len(influx_handler.buffer) > 0:
+                buffer_size = len(influx_handler.buffer)
+                influx_handler.last_write_retry = None
+                await influx_handler.write_data()
+
+                if len(influx_handler.buffer) >= buffer_size:
+                    log.error(f"Writing to InfluxDB simulator failed, dropping {buffer_size} measurements")
+                    influx_handler.buffer.clear()
+                    break
+
+        stage.add_items(len(measurements))
+
+    def run_pipeline(self):
+        """
+        run all offline stages once
+
+        Returns
+        -------
+        list: of serialized line protocol lines
+        """
+
+        # parse
+        stage = self.stages.get("tr069_parse")
+        tr069_results = list()
+        with stage.measure():
+            for service, fc_service, action_name, response in self.tr069_responses:
+                tr069_results.append((service, self.parse_soap_response(response, fc_service, action_name)))
+        stage.add_items(len(tr069_results))
+
+        stage = self.stages.get("lua_parse")
+        lua_results = list()
+        with stage.measure():
+            for service, response in self.lua_responses:
+                lua_results.append((service, service.response_parser(response)))
+        stage.add_items(len(lua_results))
+
+        # extract
+        stage = self.stages.get("tr069_extract")
+        self.tr069_handler.current_result_list = list()
+        with stage.measure():
+            for service, result in tr069_results:
+                self.tr069_handler.extract_values(service, result)
+        stage.add_items(len(self.tr069_handler.current_result_list))
+
+        stage = self.stages.get("lua_extract")
+        self.lua_handler.current_result_list = list()
+        for service, _ in lua_results:
+            # tracked log entries would be skipped after the first iteration
+            service.tracked_measurements = set()
+        with stage.measure():
+            for service, result in lua_results:
+                self.lua_handler.extract_values(service, result)
+        stage.add_items(len(self.lua_handler.current_result_list))
+
+        measurements = self.tr069_handler.current_result_list + self.lua_handler.current_result_list
+
+        # build InfluxDB points
+        stage = self.stages.get("build")
+        with stage.measure():
+            points = [self.influx_handler.convert_measurement(x) for x in measurements]
+        stage.add_items(len(points))
+
+        # serialize to line protocol, this includes building the points again
+        stage = self.stages.get("serialize")
+        with stage.measure():
+            lines = self.influx_handler.serialize_measurements(measurements).split("\n")
+        stage.add_items(len(points))
+
+        return lines
+
+    def parse_soap_response(self, response, fc_service, action_name):
+        # call the original method, not the recording wrapper
+        return type(self.tr069_handler.session.soaper).parse_response(
+            self.tr069_handler.session.soaper, response, fc_service, action_name)
+
+    def measure_memory(self):
+        """
+        run the offline pipeline once with tracemalloc enabled
+        """
+
+        # don't add the tracemalloc pass to the stage timings
+        stages = self.stages
+        self.stages = {name: StageTimer(name) for name in stages.keys()}
+
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+
+        lines = self.run_pipeline()
+        measurements = self.tr069_handler.current_result_list + self.lua_handler.current_result_list
+
+        snapshot_after = tracemalloc.take_snapshot()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stages = stages
+
+        allocated_blocks = sum(x.count_diff for x in snapshot_after.compare_to(snapshot_before, "filename"))
+        num_points = max(len(measurements), 1)
+
+        self.memory = {
+            "points": len(measurements),
+            "lines": len(lines),
+            "allocated_blocks_per_point": round(allocated_blocks / num_points, 2),
+            "peak_allocated_bytes_per_point": round(peak_bytes / num_points, 1)
+        }
+
+    def run(self):
+
+        self.setup()
+        try:
+            self.poll()
+
+            for _ in range(self.args.iterations):
+                self.run_pipeline()
+
+            self.measure_memory()
+        finally:
+            self.teardown()
+
+        self.memory["peak_rss_kb"] = peak_rss_kb()
+
+    def report(self) -> dict:
+
+        return {
+            "benchmark": "pipeline",
+            "fritzinfluxdb_version": get_version(),
+            "git_revision": get_git_revision(),
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.now(pytz.utc).isoformat(timespec="seconds"),
+            "parameters": {
+                "hosts": self.args.hosts,
+                "devices": self.args.devices,
+                "log_lines": self.args.log_lines,
+                "calls": self.args.calls,
+                "fw_version": self.args.fw_version,
+                "link_type": self.args.link_type,
+                "influxdb_version": self.args.influxdb_version,
+                "rounds": self.args.rounds,
+                "iterations": self.args.iterations,
+                "latency": self.args.latency,
+                "influxdb_latency": self.args.influxdb_latency
+            },
+            "poll_latency": {name: latency_summary(values) for name, values in self.poll_latencies.items()},
+            "stages": {name: stage.as_dict() for name, stage in self.stages.items()},
+            "memory": self.memory,
+            "simulators": {
+                "fritzbox": self.fritzbox_simulator.stats.as_dict(),
+                "influxdb": self.influxdb_simulator.write_stats.as_dict()
+            }
+        }
+
+
+def get_version():
+    """
+    read the version from the main script as it can't be imported
+    """
+
+    # noinspection PyBroadException
+    try:
+        with open(os.path.join(base_dir, "fritzinfluxdb.py")) as script:
+            return re.search(r'__version__ = "(.+)"', script.read()).group(1)
+    except Exception:
+        return None
+
+
+def get_git_revision():
+
+    # noinspection PyBroadException
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=base_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_command_line():
+    """
+    parse command line arguments of the pipeline benchmark
+
+    Returns
+    -------
+    ArgumentParser object: with parsed command line arguments
+    """
+
+    parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("--hosts", default=100, type=int,
+                        help="number of simulated network hosts")
+    parser.add_argument("--devices", default=20, type=int,
+                        help="number of simulated home automation devices")
+    parser.add_argument("--log-lines", default=200, type=int,
+                        help="number of simulated log lines")
+    parser.add_argument("--calls", default=50, type=int,
+                        help="number of simulated calls")
+    parser.add_argument("--fw-version", default="7.57",
+                        help="FritzOS version of the simulated FritzBox")
+    parser.add_argument("--link-type", default="DSL", choices=["DSL", "Cable"],
+                        help="link type of the simulated FritzBox")
+    parser.add_argument("--influxdb-version", default=2, type=int, choices=[1, 2],
+                        help="InfluxDB API version to write to")
+    parser.add_argument("--rounds", default=10, type=int,
+                        help="number of times all services are polled")
+    parser.add_argument("--iterations", default=50, type=int,
+                        help="number of times the offline pipeline stages are run")
+    parser.add_argument("--latency", default=0, type=int,
+                        help="latency in milliseconds added to every FritzBox request")
+    parser.add_argument("--influxdb-latency", default=0, type=int,
+                        help="latency in milliseconds added to every InfluxDB request")
+    parser.add_argument("--seed", default=1, type=int,
+                        help="seed for the simulated data")
+    parser.add_argument("--output", default=None,
+                        help="file to write the JSON report to, default: stdout")
+    parser.add_argument("--compare", default=None,
+                        help="JSON report of a previous run to compare this run against")
+    parser.add_argument("--tolerance", default=10.0, type=float,
+                        help="change in percent accepted before a metric is reported as regression")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="turn on debug logging")
+
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse_command_line()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose is True else logging.WARNING,
+                        format="%(asctime)s - %(levelname)s: %(message)s", stream=sys.stderr)
+
+    benchmark = PipelineBenchmark(args)
+    benchmark.run()
+
+    report = benchmark.report()
+
+    if args.output is not None:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare is None:
+        return
+
+    with open(args.compare) as compare_file:
+        regressions = compare_reports(json.load(compare_file), report, args.tolerance)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression.get('metric')}: {regression.get('baseline')} -> "
+              f"{regression.get('current')} ({regression.get('change_percent'):+}%)", file=sys.stderr)
+
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# EOF
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import math
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class StageTimer:
+    """
+        accumulates the time spent in a single pipeline stage and the number of items it processed
+    """
+
+    def __init__(self, name: str, unit: str = "points"):
+
+        self.name = name
+        self.unit = unit
+        self.seconds = 0.0
+        self.items = 0
+        self.samples = list()
+
+    @contextmanager
+    def measure(self):
+        """
+        time the enclosed block, items processed have to be added with add_items()
+        """
+
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            duration = time.perf_counter() - start
+            self.seconds += duration
+            self.samples.append(duration)
+
+    def add_items(self, num_items: int) -> None:
+
+        self.items += num_items
+
+    def as_dict(self) -> dict:
+
+        return {
+            "unit": self.unit,
+            "items": self.items,
+            "seconds": round(self.seconds, 6),
+            "items_per_second": round(self.items / self.seconds, 1) if self.seconds > 0 else None
+        }
+
+
+def percentile(values: list, percent: float):
+    """
+    returns the percentile of a list of values using the nearest-rank method
+
+    Parameters
+    ----------
+    values: list
+        list of numbers
+    percent: float
+        percentile to return (0 - 100)
+
+    Returns
+    -------
+    float: the percentile value or None if the list is empty
+    """
+
+    if len(values) == 0:
+        return None
+
+    sorted_values = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+
+    return sorted_values[rank - 1]
+
+
+def latency_summary(values: list) -> dict:
+    """
+    summarize a list of latencies in seconds, all results are returned in milliseconds
+    """
+
+    def to_ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "count": len(values),
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "mean_ms": to_ms(sum(values) / len(values) if len(values) > 0 else None),
+        "max_ms": to_ms(max(values) if len(values) > 0 else None)
+    }
+
+
+def peak_rss_kb():
+    """
+    returns the peak resident set size of this process in KiB or None if it can't be determined
+    """
+
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes, Linux KiB
+    if sys.platform == "darwin":
+        max_rss = max_rss / 1024
+
+    return int(max_rss)
+
+
+# metrics to compare between two reports. True if a higher value is better
+compared_metrics = {
+    "items_per_second": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_kb": False,
+    "allocated_blocks_per_point": False,
+    "peak_allocated_bytes_per_point": False
+}
+
+
+def flatten_report(data: dict, prefix: str = "") -> dict:
+    """
+    returns all comparable values of a report as a flat dict with dotted keys
+    """
+
+    result = dict()
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if len(prefix) > 0 else key
+        if isinstance(value, dict):
+            result.update(flatten_report(value, path))
+        elif key in compared_metrics and isinstance(value, (int, float)):
+            result[path] = value
+
+    return result
+
+
+def compare_reports(baseline: dict, current: dict, tolerance: float) -> list:
+    """
+    compares the metrics of two benchmark reports
+
+    Parameters
+    ----------
+    baseline: dict
+        the report to compare against
+    current: dict
+        the report of the current run
+    tolerance: float
+        change in percent which is still accepted before a metric counts as regression
+
+    Returns
+    -------
+    list: of dicts describing each metric which got worse by more than the tolerance
+    """
+
+    baseline_values = flatten_report(baseline)
+    current_values = flatten_report(current)
+
+    regressions = list()
+    for path, baseline_value in baseline_values.items():
+
+        current_value = current_values.get(path)
+        if current_value is None or baseline_value == 0:
+            continue
+
+        change = (current_value - baseline_value) / baseline_value * 100
+        higher_is_better = compared_metrics.get(path.split(".")[-1])
+
+        if (higher_is_better is True and change < -tolerance) or (higher_is_better is False and change > tolerance):
+            regressions.append({
+                "metric": path,
+                "baseline": baseline_value,
+                "current": current_value,
+                "change_percent": round(change, 1)
+            })
+
+    return regressions
+
+# EOF
@@ -25,7 +25,11 @@ from fritzinfluxdb.cli_parser import parse_command_line
 from fritzinfluxdb.log import setup_logging
 from fritzinfluxdb.configparser import import_config
 from fritzinfluxdb.classes.fritzbox.handler import FritzBoxHandler, FritzBoxLuaHandler
-from fritzinfluxdb.classes.influxdb.handler import InfluxHandler, InfluxLogAndConfigWriter
+from fritzinfluxdb.classes.influxdb.handler import InfluxHandler, InfluxLogAndConfigWriter, InfluxInternalMetricsWriter
+from fritzinfluxdb.classes.prometheus.handler import PrometheusHandler
+from fritzinfluxdb.classes.profiler import get_profiler
+from fritzinfluxdb.classes.watchdog import get_watchdog
+from fritzinfluxdb.classes.common import BoundedQueue
 
 __version__ = "1.2.4"
 __version_date__ = "2024-10-15"
@@ -80,7 +84,12 @@ def main():
     # parse command line arguments
     args = parse_command_line(__version__, __description__, __version_date__, __url__, default_config)
 
-    log_queue = asyncio.Queue()
+    # the event loop needs to exist before any queue is created
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # logs can't block the logging call, the oldest records are discarded if the queue is full
+    log_queue = BoundedQueue("log")
     log = setup_logging("DEBUG" if args.verbose > 0 else "INFO", args.daemon, log_queue)
 
     log.propagate = False
@@ -107,22 +116,43 @@ def main():
         influx_log_writer
     ]
 
+    if influx_connection.config.internal_metrics_interval > 0:
+        handler_list.append(InfluxInternalMetricsWriter(fritzbox_connection.config,
+                                                        influx_connection.config.internal_metrics_interval,
+                                                        influx_connection.config.internal_metrics_measurement_name))
+
+    prometheus_endpoint = PrometheusHandler(config, log_queue)
+    if prometheus_endpoint.config.enabled is True or prometheus_endpoint.config.parser_error is True:
+        handler_list.append(prometheus_endpoint)
+
     for handler in handler_list:
         if handler.config.parser_error is True:
             exit(1)
 
     log.info("Successfully parsed config")
 
+    log_queue.max_size = influx_connection.config.queue_size
+
+    # feed recorded FritzBox responses instead of requesting the FritzBox
+    replay_handler_list = list()
+    if fritzbox_connection.config.replay_file is not None:
+        replay_handler_list = [fritzbox_connection, fritzbox_lua_connection]
+
     # init connection on all handlers
     influx_connection.connect()
-    fritzbox_connection.connect()
 
-    # Lua handler is only useful with FritzBox FW >= 7.X
-    if fritzbox_connection.config.fw_version is not None and int(fritzbox_connection.config.fw_version[0]) >= 7:
-        fritzbox_lua_connection.connect()
+    if len(replay_handler_list) > 0:
+        for handler in replay_handler_list:
+            handler.init_replay()
     else:
-        log.info("Disabling queries via Lua. Fritz!OS version must be at least 7.XX")
-        handler_list.remove(fritzbox_lua_connection)
+        fritzbox_connection.connect()
+
+        # Lua handler is only useful with FritzBox FW >= 7.X
+        if fritzbox_connection.config.fw_version is not None and int(fritzbox_connection.config.fw_version[0]) >= 7:
+            fritzbox_lua_connection.connect()
+        else:
+            log.info("Disabling queries via Lua. Fritz!OS version must be at least 7.XX")
+            handler_list.remove(fritzbox_lua_connection)
 
     init_errors = False
     for handler in handler_list:
@@ -138,27 +168,40 @@ def main():
              f"Model: {fritzbox_connection.config.model} ({fritzbox_connection.config.link_type}) - "
              f"FW: {fritzbox_connection.config.fw_version}")
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
     for fb_signal in [signal.SIGHUP, signal.SIGTERM, signal.SIGINT]:
         loop.add_signal_handler(
             fb_signal, lambda s=fb_signal: asyncio.create_task(shutdown(s, loop, log)))
 
-    queue = asyncio.Queue()
+    queue = BoundedQueue("measurements", influx_connection.config.queue_size, influx_connection.config.overflow_policy)
+
+    watchdog = get_watchdog()
+
+    profiler = get_profiler()
+    if args.profile is not None and profiler.start(args.profile, args.profile_mode) is False:
+        exit(1)
 
     log.info("Starting main loop")
 
     try:
         for handler in handler_list:
-            task = loop.create_task(handler.task_loop(queue))
+            if handler in replay_handler_list:
+                task = loop.create_task(handler.replay_task_loop(queue))
+            else:
+                task = loop.create_task(handler.task_loop(queue))
             task.add_done_callback(handle_task_result)
+
+        # measure the event loop lag and report which handler blocked the loop
+        loop.create_task(watchdog.task_loop()).add_done_callback(handle_task_result)
+
         loop.run_forever()
     finally:
         loop.close()
         fritzbox_connection.close()
         fritzbox_lua_connection.close()
         influx_connection.close()
+        prometheus_endpoint.close()
+        profiler.stop()
+        watchdog.stop()
         log.info(f"Successfully shutdown {__description__}")
 
     exit(exit_code)
@@ -7,15 +7,19 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
+import asyncio
 import pytz
+from collections import deque
 from datetime import datetime
 import configparser
 import os
 
 from fritzinfluxdb.common import do_error_exit
+from fritzinfluxdb.classes.metrics import get_metrics
 from fritzinfluxdb.log import get_logger
 
 log = get_logger()
+metrics = get_metrics()
 
 
 class WritePrecision(object):
@@ -24,6 +28,13 @@ class WritePrecision(object):
     US = "us"
 
 
+class MeasurementPriority(object):
+    # periodically sampled values which will be reported again with the next request
+    LOW = 0
+    # events which are only reported once (logs, calls)
+    HIGH = 10
+
+
 class FritzMeasurement:
     """
         This class holds measurements which should be sanitized to this specification
@@ -33,18 +44,26 @@ class FritzMeasurement:
     default_box_tag_key = "box"
     default_timestamp_precision = WritePrecision.S
 
-    __slots__ = ("name", "value", "box_tag", "timestamp", "additional_tags", "timestamp_precision")
+    __slots__ = ("name", "value", "box_tag", "timestamp", "additional_tags", "timestamp_precision",
+                 "measurement_name", "priority")
 
     def __init__(self, key, value,
                  data_type=None, box_tag=None,
                  additional_tags=None, timestamp=None,
-                 timestamp_precision=None):
+                 timestamp_precision=None, measurement_name=None,
+                 priority=MeasurementPriority.LOW):
 
         # name and primary tag should always be present
         self.name = str(key)
         self.box_tag = str(box_tag)
         self.value = None
 
+        # InfluxDB measurement to write to if it should differ from the configured measurement name
+        self.measurement_name = measurement_name
+
+        # measurements with the lowest priority are discarded first if queues overflow
+        self.priority = priority
+
         if data_type is not None:
             # noinspection PyBroadException
             try:
@@ -132,6 +151,152 @@ class FritzMeasurement:
         return hash(self.__repr__())
 
 
+# valid policies to handle new items if a BoundedQueue is full
+overflow_policies = ["drop_oldest", "drop_lowest_priority", "block"]
+
+
+class BoundedQueue(asyncio.Queue):
+    """
+        asyncio.Queue with a max size and a policy how to handle new items if the queue is full.
+        Items can be single objects or batches (lists) of objects, the size of the queue is the
+        number of queued objects.
+
+        policies:
+            drop_oldest: discard the oldest items
+            drop_lowest_priority: discard the oldest items with the lowest priority. A new item with a
+                                  lower priority than all queued items is discarded instead.
+                                  Items with the highest priority are returned first.
+            block: 'put()' waits until items got removed, 'put_nowait()' discards the oldest items
+    """
+
+    def __init__(self, name: str, max_size: int = 0, overflow_policy: str = "drop_oldest"):
+
+        if overflow_policy not in overflow_policies:
+            raise ValueError(f"invalid overflow policy '{overflow_policy}'")
+
+        self.name = name
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.size = 0
+
+        super().__init__()
+
+    def _init(self, maxsize):
+
+        # one FIFO queue per priority
+        self.queues = dict()
+
+    def _format(self):
+
+        return f"name={self.name!r} max_size={self.max_size} overflow_policy={self.overflow_policy} size={self.size}"
+
+    @staticmethod
+    def item_size(item) -> int:
+
+        return len(item) if isinstance(item, list) else 1
+
+    def get_priority(self, item) -> int:
+
+        if self.overflow_policy != "drop_lowest_priority":
+            return MeasurementPriority.LOW
+
+        # batches are split by priority in put_batch()
+        if isinstance(item, list):
+            item = item[0] if len(item) > 0 else None
+
+        return getattr(item, "priority", MeasurementPriority.LOW)
+
+    def _put(self, item):
+
+        priority = self.get_priority(item)
+        if priority not in self.queues:
+            self.queues[priority] = deque()
+
+        self.queues[priority].append(item)
+        self.size += self.item_size(item)
+
+    def _get(self):
+
+        priority = max(self.queues)
+        item = self.queues[priority].popleft()
+        if len(self.queues[priority]) == 0:
+            del self.queues[priority]
+
+        self.size -= self.item_size(item)
+
+        return item
+
+    def qsize(self):
+
+        return self.size
+
+    def empty(self):
+
+        return self.size == 0 and len(self.queues) == 0
+
+    def full(self):
+
+        return 0 < self.max_size <= self.size
+
+    def needs_space(self, item_size: int) -> bool:
+
+        if self.max_size <= 0 or len(self.queues) == 0:
+            return False
+
+        # put() already waited for a free slot, a batch is allowed to exceed the max size
+        if self.overflow_policy == "block":
+            return self.full()
+
+        return self.size + item_size > self.max_size
+
+    def put_nowait(self, item):
+
+        item_size = self.item_size(item)
+
+        while self.needs_space(item_size) is True:
+            lowest_priority = min(self.queues)
+
+            if self.get_priority(item) < lowest_priority:
+                metrics.increment("queue_dropped_total", item_size, queue=self.name)
+                return
+
+            dropped_item = self.queues[lowest_priority].popleft()
+            if len(self.queues[lowest_priority]) == 0:
+                del self.queues[lowest_priority]
+            self.size -= self.item_size(dropped_item)
+            self.task_done()
+
+            metrics.increment("queue_dropped_total", self.item_size(dropped_item), queue=self.name)
+
+        super().put_nowait(item)
+
+    async def put(self, item):
+
+        if self.overflow_policy == "block":
+            return await super().put(item)
+
+        return self.put_nowait(item)
+
+    async def put_batch(self, items: list):
+        """
+        put a list of items as batch into the queue. The batch is split by priority if the
+        lowest priority items should be discarded first.
+        """
+
+        if len(items) == 0:
+            return
+
+        if self.overflow_policy != "drop_lowest_priority":
+            return await self.put(items)
+
+        batches = dict()
+        for item in items:
+            batches.setdefault(getattr(item, "priority", MeasurementPriority.LOW), list()).append(item)
+
+        for batch in batches.values():
+            await self.put(batch)
+
+
 class ConfigBase:
     """
         Base class to parse config data
@@ -218,6 +383,13 @@ class ConfigBase:
                     log.error(f"Unable to parse '{config_value}' for '{config_option}' as int")
                     config_value = var_default
 
+            elif config_value is not None and var_type == float:
+                try:
+                    config_value = float(config_value)
+                except ValueError:
+                    log.error(f"Unable to parse '{config_value}' for '{config_option}' as float")
+                    config_value = var_default
+
             else:
                 if config_value is None:
                     config_value = var_default
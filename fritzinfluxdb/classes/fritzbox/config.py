@@ -8,10 +8,13 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import configparser
+import os
 import pytz
 
 from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.common import ConfigBase
+from fritzinfluxdb.classes.fritzbox.load_controller import FritzBoxLoadController
+from fritzinfluxdb.classes.fritzbox.recorder import FritzBoxResponseRecorder
 
 log = get_logger()
 
@@ -66,6 +69,59 @@ class FritzBoxConfig(ConfigBase):
         "type": str,
         "default": "Europe/Berlin"
     }
+    aligned_intervals = {
+        "type": bool,
+        "default": False
+    }
+    adaptive_intervals = {
+        "type": bool,
+        "default": False
+    }
+    adaptive_max_interval = {
+        "type": int,
+        "default": 600
+    }
+    adaptive_cpu_threshold = {
+        "type": int,
+        "default": 80
+    }
+    full_update_interval = {
+        "type": int,
+        "default": 0
+    }
+    partial_update_max_requests = {
+        "type": int,
+        "default": 20
+    }
+    counter_deltas = {
+        "type": bool,
+        "default": False
+    }
+    cache_enabled = {
+        "type": bool,
+        "alt": "use_cache",
+        "default": True
+    }
+    cache_directory = {
+        "type": str,
+        "default": None
+    }
+    rediscovery_interval = {
+        "type": int,
+        "default": 86400
+    }
+    record_file = {
+        "type": str,
+        "default": None
+    }
+    replay_file = {
+        "type": str,
+        "default": None
+    }
+    replay_speed = {
+        "type": float,
+        "default": 1.0
+    }
 
     config_section_name = "fritzbox"
 
@@ -77,6 +133,13 @@ class FritzBoxConfig(ConfigBase):
         self.model = None
         self.link_type = None
 
+        # shared between all FritzBox handlers
+        self.load_controller = FritzBoxLoadController(self)
+        self.response_recorder = None
+
+        if self.record_file is not None and len(self.record_file) > 0:
+            self.response_recorder = FritzBoxResponseRecorder(self)
+
     def parse_config(self, config_data: configparser.ConfigParser):
 
         super().parse_config(config_data)
@@ -99,6 +162,26 @@ class FritzBoxConfig(ConfigBase):
             log.error(f"Defined FritzBox time zone '{self.timezone}' is invalid/unknown")
             self.parser_error = True
 
+        if self.full_update_interval < 0:
+            log.error(f"FritzBox full_update_interval must not be negative: {self.full_update_interval}")
+            self.parser_error = True
+
+        if self.partial_update_max_requests < 0:
+            log.error(f"FritzBox partial_update_max_requests must not be negative: "
+                      f"{self.partial_update_max_requests}")
+            self.parser_error = True
+
+        if self.cache_directory is None or len(self.cache_directory) == 0:
+            self.cache_directory = os.path.join(os.path.expanduser("~"), ".fritzconnection")
+
+        # an empty replay file disables the replay mode
+        if self.replay_file is not None and len(self.replay_file) == 0:
+            self.replay_file = None
+
+        if self.replay_file is not None and not os.path.isfile(self.replay_file):
+            log.error(f"FritzBox replay_file '{self.replay_file}' does not exist or is not a file")
+            self.parser_error = True
+
         # set TR-069 TLS port if undefined
         if self.tls_enabled is True and self.port == self.__class__.port.get("default"):
             self.port += 443
@@ -112,7 +195,8 @@ class FritzBoxConfig(ConfigBase):
 
         # noinspection PyBroadException
         try:
-            _, major, minor = f"{version}".split(".")
+            # accepts the full version string (154.07.57) as well as the short version (7.57)
+            major, minor = f"{version}".split(".")[-2:]
             self._fw_version = f"{int(major)}.{int(minor)}"
         except Exception:
             pass
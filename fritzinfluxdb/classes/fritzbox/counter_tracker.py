@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+from datetime import datetime, timedelta
+from typing import Hashable, Optional, Tuple
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+
+class CounterTracker:
+    """
+        keeps the last value of cumulative counters (i.e. energy meters) to derive the increase
+        and the rate of each counter between two consecutive values.
+
+        A counter which decreases is considered to be reset (i.e. device reset or replaced). The increase
+        since the reset is the current value of the counter. Counters with a known width in bits which
+        decrease are considered to have wrapped around, unless the device rebooted since the last value
+        or the increase across the wrap would be implausibly large.
+    """
+
+    # seconds the boot time derived from the uptime may vary without a reboot
+    boot_time_tolerance = 60
+
+    def __init__(self):
+
+        self.last_values = dict()
+        self.boot_time = None
+
+    def set_boot_time(self, boot_time: datetime) -> None:
+        """
+        set the time the device (re)booted. All counters read before are considered to be reset.
+
+        Parameters
+        ----------
+        boot_time: datetime
+            the boot time, i.e. derived from the uptime of the device
+        """
+
+        if self.boot_time is not None and \
+                boot_time - self.boot_time < timedelta(seconds=self.boot_time_tolerance):
+            return
+
+        if self.boot_time is not None:
+            log.info(f"Device reboot detected at {boot_time}, counters read before are considered reset")
+
+        self.boot_time = boot_time
+
+    def decreased(self, key: Hashable, value: float) -> bool:
+        """
+        returns True if the value is lower than the last value of the counter, i.e. it has been reset or wrapped
+        """
+
+        last_value = self.last_values.get(key)
+
+        return last_value is not None and value < last_value[0]
+
+    def update(self, key: Hashable, value: float, timestamp: datetime,
+               bits: int = None) -> Optional[Tuple[float, float, bool]]:
+        """
+        add a new counter value
+
+        Parameters
+        ----------
+        key: Hashable
+            unique key of the counter
+        value: float
+            the current value of the counter
+        timestamp: datetime
+            the time the value has been read
+        bits: int
+            the width of the counter in bits to detect counter wraps, None if the counter doesn't wrap
+
+        Returns
+        -------
+        tuple: increase since the last value, seconds since the last value, True if the counter has been reset.
+               None if this is the first value of the counter or the timestamp didn't advance.
+        """
+
+        last_value = self.last_values.get(key)
+
+        if last_value is not None and timestamp <= last_value[1]:
+            return
+
+        self.last_values[key] = value, timestamp
+
+        if last_value is None:
+            return
+
+        previous_value, previous_timestamp = last_value
+
+        rebooted = self.boot_time is not None and previous_timestamp < self.boot_time
+
+        if rebooted is False and value >= previous_value:
+            return value - previous_value, (timestamp - previous_timestamp).total_seconds(), False
+
+        # a wrap around is only plausible if the counter advanced less than half of its range
+        if rebooted is False and bits is not None and value + 2 ** bits - previous_value < 2 ** (bits - 1):
+            log.debug(f"Counter '{key}' wrapped around from {previous_value} to {value}")
+            return value + 2 ** bits - previous_value, (timestamp - previous_timestamp).total_seconds(), False
+
+        log.debug(f"Counter '{key}' has been reset from {previous_value} to {value}")
+
+        return value, (timestamp - previous_timestamp).total_seconds(), True
+
+# EOF
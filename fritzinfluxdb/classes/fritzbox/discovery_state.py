@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import os
+import json
+from typing import Dict, Optional
+
+from fritzinfluxdb.log import get_logger
+from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
+
+log = get_logger()
+
+
+class FritzBoxDiscoveryState:
+    """
+        persists the results of the service discovery (availability of services, actions and Lua pages)
+        of a FritzBox handler to a state file. A saved state is only used again if it has been written
+        for the same FritzBox model, firmware version and link type.
+    """
+
+    file_suffix = "discovery.json"
+    state_version = 1
+
+    def __init__(self, config: FritzBoxConfig, handler_key: str):
+
+        self.config = config
+
+        host_name = f"{config.hostname}".replace(".", "_").replace(":", "_")
+        self.path = os.path.join(f"{config.cache_directory}", f"{host_name}_{handler_key}_{self.file_suffix}")
+
+    @property
+    def box_identity(self) -> Dict:
+        return {
+            "model": self.config.model,
+            "fw_version": self.config.fw_version,
+            "link_type": self.config.link_type
+        }
+
+    def load(self) -> Optional[Dict]:
+        """
+        read saved discovery state
+
+        Returns
+        -------
+        dict: the saved services state or None if no matching state was found
+        """
+
+        if not os.path.isfile(self.path):
+            return
+
+        # noinspection PyBroadException
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except Exception as e:
+            log.warning(f"Unable to read discovery state file '{self.path}': {e}")
+            return
+
+        if not isinstance(data, dict) or data.get("version") != self.state_version:
+            return
+
+        if data.get("box") != self.box_identity:
+            log.debug(f"Discovery state in '{self.path}' belongs to a different model or firmware, ignoring it")
+            return
+
+        services = data.get("services")
+        if not isinstance(services, dict):
+            return
+
+        return services
+
+    def save(self, services: Dict) -> None:
+        """
+        write discovery state to state file
+
+        Parameters
+        ----------
+        services: dict
+            the discovery state of all services of a handler
+        """
+
+        data = {
+            "version": self.state_version,
+            "box": self.box_identity,
+            "services": services
+        }
+
+        temp_path = f"{self.path}.tmp"
+
+        # noinspection PyBroadException
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            log.warning(f"Unable to write discovery state file '{self.path}': {e}")
+            return
+
+        log.debug(f"Saved discovery state to '{self.path}'")
+
+# EOF
@@ -8,6 +8,9 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import asyncio
+import time
+import pytz
+from datetime import datetime, timedelta
 
 import urllib3
 import requests
@@ -19,14 +22,25 @@ from fritzconnection import FritzConnection
 from fritzconnection.core.exceptions import FritzConnectionException, FritzServiceError, FritzActionError
 
 from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
+from fritzinfluxdb.classes.fritzbox.counter_tracker import CounterTracker
+from fritzinfluxdb.classes.fritzbox.discovery_state import FritzBoxDiscoveryState
+from fritzinfluxdb.classes.fritzbox.keepalive import KeepAliveAdapter
+from fritzinfluxdb.classes.fritzbox.recorder import FritzBoxResponseReplay
 from fritzinfluxdb.log import get_logger
 from fritzinfluxdb.classes.fritzbox.service_handler import FritzBoxTR069Service, FritzBoxLuaService
 import fritzinfluxdb.classes.fritzbox.service_definitions as service_definitions
 from fritzinfluxdb.classes.common import FritzMeasurement
+from fritzinfluxdb.classes.scheduler import Scheduler
+from fritzinfluxdb.classes.metrics import get_metrics
+from fritzinfluxdb.classes.profiler import get_profiler
+from fritzinfluxdb.classes.watchdog import get_watchdog
 from fritzinfluxdb.common import grab
 from fritzinfluxdb.classes.fritzbox.model import FritzBoxModel
 
 log = get_logger()
+metrics = get_metrics()
+profiler = get_profiler()
+watchdog = get_watchdog()
 
 
 class FritzBoxHandlerBase:
@@ -40,6 +54,18 @@ class FritzBoxHandlerBase:
     services = None
     discovery_done = False
 
+    # key used to name the discovery state file of this handler
+    discovery_state_key = None
+
+    # seconds to wait before requesting a service again after a failed request
+    failed_request_retry_interval = 1
+
+    # max seconds to sleep if no service is due
+    max_idle_sleep = 60
+
+    # seconds the offset of the time grid of a schedule group is spread across
+    schedule_group_period = 3600
+
     def __init__(self, config):
         if isinstance(config, FritzBoxConfig):
             self.config = config
@@ -52,6 +78,27 @@ class FritzBoxHandlerBase:
 
         self.version = None
 
+        self.discovery_state = None
+        self.last_discovery = None
+        self.discovered_box_identity = None
+
+        self.scheduler = Scheduler(self.name)
+
+        # timestamp to use for measurements without their own timestamp
+        self.current_timestamp = None
+
+        # last values of cumulative counters to derive their increase and rate
+        self.counter_tracker = CounterTracker()
+
+        # number of requests sent to the FritzBox, requests answered from a cache are not counted
+        self.num_requests = 0
+
+        # number of the current run of the task loop, all services due at the same time are requested in one run
+        self.current_pass = 0
+
+        if self.config.cache_enabled is True and self.discovery_state_key is not None:
+            self.discovery_state = FritzBoxDiscoveryState(self.config, self.discovery_state_key)
+
     def add_services(self, class_name, service_definition):
         """
         Adds services from config to handler
@@ -77,42 +124,523 @@ class FritzBoxHandlerBase:
         # stub for the default function
         pass
 
+    def replay_record(self, _, __):
+        # stub for the default function
+        pass
+
+    def extract_values(self, _, __):
+        # stub for the default function
+        pass
+
+    def extract_service_values(self, service, data):
+        """
+        extract all measurements from the data returned by a service and track how long it took
+
+        Parameters
+        ----------
+        service: FritzBoxTR069Service, FritzBoxLuaService
+            the requested service
+        data: dict, list
+            the returned data
+        """
+
+        num_results = len(self.current_result_list)
+
+        with metrics.timer("service_extract_duration_seconds", handler=self.discovery_state_key, service=service.name):
+            self.extract_values(service, data)
+
+        metrics.increment("service_measurements_total", len(self.current_result_list) - num_results,
+                          handler=self.discovery_state_key, service=service.name)
+
+        now = time.time()
+        metrics.set_gauge("service_last_success_timestamp_seconds", now,
+                          handler=self.discovery_state_key, service=service.name)
+        metrics.set_gauge("last_success_timestamp_seconds", now, handler=self.discovery_state_key)
+
+    def add_counter_measurements(self, metric: FritzMeasurement, counter_key, rate_factor: float = 1,
+                                 bits: int = None):
+        """
+        adds the increase of a cumulative counter since its last value as '<name>_delta' and the
+        increase per second multiplied by rate_factor as '<name>_rate'. A detected counter reset
+        is reported as '<name>_reset'.
+
+        Parameters
+        ----------
+        metric: FritzMeasurement
+            the measurement of the counter value
+        counter_key: Hashable
+            key to identify the counter, i.e. the device identifier
+        rate_factor: float
+            factor to convert the increase per second to the desired rate unit
+        bits: int
+            the width of the counter in bits to detect counter wraps, None if the counter doesn't wrap
+        """
+
+        if type(metric.value) not in [int, float]:
+            return
+
+        # the time stamp of the measurement is truncated to full seconds, which would distort short intervals
+        timestamp = self.current_timestamp or datetime.now(pytz.utc)
+
+        result = self.counter_tracker.update((metric.name, counter_key), metric.value, timestamp, bits)
+
+        if result is None:
+            return
+
+        increase, seconds, reset = result
+
+        def add_measurement(name, value, data_type):
+            self.current_result_list.append(
+                FritzMeasurement(name, value, data_type=data_type, box_tag=self.config.box_tag,
+                                 additional_tags=metric.additional_tags, timestamp=metric.timestamp,
+                                 priority=metric.priority)
+            )
+
+        add_measurement(f"{metric.name}_delta", increase, float)
+        add_measurement(f"{metric.name}_rate", increase / seconds * rate_factor, float)
+
+        if reset is True:
+            add_measurement(f"{metric.name}_reset", 1, int)
+
+    def init_replay(self):
+        """
+        prepare this handler to replay recorded responses instead of connecting to the FritzBox
+        """
+
+        record = FritzBoxResponseReplay(self.config.replay_file).first_record()
+
+        if record is None:
+            log.error(f"No recorded responses found in FritzBox replay file '{self.config.replay_file}'")
+            return
+
+        self.config.model = record.get("model")
+        self.config.fw_version = record.get("fw_version")
+        self.config.link_type = record.get("link_type")
+
+        self.init_successful = True
+
+    def load_discovery_state(self):
+        """
+        restores the results of a previous service discovery for the same FritzBox model and firmware.
+        If a matching state was found, the initial discovery run is skipped.
+        """
+
+        if self.discovery_state is None:
+            return
+
+        saved_services = self.discovery_state.load()
+
+        if saved_services is None:
+            return
+
+        # the saved state needs to cover all currently defined services
+        if len([x for x in self.services if x.discovery_key not in saved_services.keys()]) > 0:
+            log.debug(f"Saved {self.name} discovery state is incomplete, running discovery")
+            return
+
+        for service in self.services:
+            service.set_discovery_state(saved_services.get(service.discovery_key))
+
+        num_available = len([x for x in self.services if x.available is True])
+        log.info(f"Restored {self.name} discovery state ({num_available}/{len(self.services)} services available). "
+                 f"Skipping service discovery")
+
+        self.discovery_done = True
+        self.last_discovery = datetime.now(pytz.utc)
+        self.discovered_box_identity = self.discovery_state.box_identity
+
+    def save_discovery_state(self):
+
+        if self.discovery_state is None:
+            return
+
+        self.discovery_state.save({x.discovery_key: x.get_discovery_state() for x in self.services})
+
+    def rediscovery_due(self):
+        """
+        checks if the service discovery should be performed again. This is the case if the configured
+        rediscovery interval passed or the firmware of the FritzBox changed.
+        """
+
+        if self.discovery_done is False:
+            return False
+
+        if self.discovery_state is not None and self.discovered_box_identity != self.discovery_state.box_identity:
+            log.info(f"FritzBox model or firmware changed, performing new {self.name} service discovery")
+            return True
+
+        if self.config.rediscovery_interval <= 0 or self.last_discovery is None:
+            return False
+
+        if (datetime.now(pytz.utc) - self.last_discovery).total_seconds() >= self.config.rediscovery_interval:
+            log.debug(f"Performing {self.name} service discovery to validate available services")
+            return True
+
+        return False
+
+    def reset_discovery(self):
+
+        for service in self.services:
+            service.reset_discovery_state()
+
+        self.scheduler.clear()
+        self.discovery_done = False
+
+    def group_deadline(self, service, interval: float, after: float) -> float:
+        """
+        returns the next deadline after the given timestamp on the time grid shared by all services
+        of the schedule group of the service. Services with intervals which are multiples of each other
+        are due at the same time.
+        """
+
+        # the offset of the grid is stable but differs between FritzBoxes and groups
+        offset = self.scheduler.phase_offset(f"{self.config.box_tag}:{service.schedule_group}",
+                                             self.schedule_group_period)
+
+        return self.scheduler.aligned_deadline(interval, after - offset) + offset
+
+    def schedule_service(self, service, deadline: float):
+
+        service.next_query = datetime.fromtimestamp(deadline, pytz.utc)
+        self.scheduler.schedule(service, deadline)
+
+    def schedule_services(self):
+        """
+        adds all available services to the scheduler. Services which have been queried already
+        are spread across their interval to avoid requesting all services at the same time.
+        """
+
+        self.scheduler.clear()
+
+        now = time.time()
+        for service in self.services:
+
+            if service.available is False:
+                continue
+
+            if service.last_query is None:
+                deadline = now
+            elif self.config.aligned_intervals is True:
+                deadline = self.scheduler.aligned_deadline(service.interval, now)
+            elif service.schedule_group is not None:
+                deadline = self.group_deadline(service, service.interval, now)
+            else:
+                deadline = service.last_query.timestamp() + \
+                           self.scheduler.phase_offset(f"{self.config.box_tag}:{service.discovery_key}",
+                                                       service.interval)
+
+            self.schedule_service(service, deadline)
+
+    def reschedule_service(self, service, previous_query, previous_deadline):
+        """
+        schedule the next query of a service after it has been requested
+
+        Parameters
+        ----------
+        service: FritzBoxTR069Service, FritzBoxLuaService
+            the service which has been requested
+        previous_query: datetime
+            the time of the last successful query before this request
+        previous_deadline: float
+            the time this request was scheduled for
+        """
+
+        if service.available is False:
+            service.next_query = None
+            return
+
+        # interval might be stretched if the FritzBox is busy
+        interval = self.config.load_controller.get_interval(service.interval)
+
+        # next wall clock multiple of the interval, regardless if the request was successful
+        if self.config.aligned_intervals is True:
+            now = time.time()
+            deadline = self.scheduler.aligned_deadline(interval, previous_deadline)
+            if deadline <= now:
+                next_deadline = self.scheduler.aligned_deadline(interval, now)
+                log.warning(f"{self.name} service '{service.name}' skipped "
+                            f"{round((next_deadline - deadline) / interval)} interval(s), "
+                            f"request took too long")
+                deadline = next_deadline
+
+        # the request failed, try again soon
+        elif service.last_query is None or service.last_query == previous_query:
+            deadline = time.time() + self.failed_request_retry_interval
+
+        # next grid point of the group, without jitter to stay in the same scheduling pass
+        elif service.schedule_group is not None:
+            deadline = self.group_deadline(service, interval, service.last_query.timestamp() + interval / 2)
+        else:
+            deadline = service.last_query.timestamp() + interval + self.scheduler.jitter(interval)
+
+        self.schedule_service(service, deadline)
+
     async def task_loop(self, queue):
         """
         common task loop which is called in fritzinfluxdb.py
 
         Parameters
         ----------
-        queue: asyncio.Queue
-            the result queue object to write measurements to so the influx handler can pick them up
+        queue: BoundedQueue
+            the result queue object to write batches of measurements to so the influx handler can pick them up
 
         """
+
+        self.load_discovery_state()
+
+        if self.discovery_done is True:
+            self.schedule_services()
+
         while True:
 
+            if self.rediscovery_due() is True:
+                self.reset_discovery()
+
+            self.current_pass += 1
             self.current_result_list = list()
-            for service in self.services:
-                self.query_service_data(service)
+
+            if self.discovery_done is False:
+                # query every service during discovery
+                for service in self.services:
+                    with watchdog.activity(self.name, service.name), \
+                         profiler.profile(f"{self.discovery_state_key}_{service.name}"):
+                        self.query_service_data(service)
+            else:
+                for service in self.scheduler.pop_due():
+                    previous_query = service.last_query
+                    previous_deadline = service.next_query.timestamp()
+
+                    service.lateness = time.time() - previous_deadline
+                    log.debug(f"{self.name} service '{service.name}' started {service.lateness:.3f}s "
+                              f"after its scheduled time")
+                    metrics.observe("service_lateness_seconds", max(service.lateness, 0),
+                                    handler=self.discovery_state_key, service=service.name)
+
+                    # use scheduled time as timestamp to get evenly spaced measurements
+                    if self.config.aligned_intervals is True:
+                        self.current_timestamp = service.next_query
+
+                    request_start = time.monotonic()
+                    num_requests = self.num_requests
+                    with watchdog.activity(self.name, service.name), \
+                         profiler.profile(f"{self.discovery_state_key}_{service.name}"):
+                        self.query_service_data(service)
+                    service.duration = time.monotonic() - request_start
+                    self.current_timestamp = None
+
+                    # responses served from a cache don't tell anything about the load of the FritzBox
+                    if service.last_query != previous_query and self.num_requests != num_requests:
+                        self.config.load_controller.add_latency_sample(service.discovery_key, service.duration)
+
+                    self.reschedule_service(service, previous_query, previous_deadline)
 
             for result in self.current_result_list:
                 log.debug(result)
-                await queue.put(result)
+                self.config.load_controller.add_measurement(result)
 
-            await asyncio.sleep(1)
+            # hand over all measurements of this run at once
+            await queue.put_batch(self.current_result_list)
 
             # first discovery run is done
-            self.discovery_done = True
+            if self.discovery_done is False:
+                self.discovery_done = True
+                self.last_discovery = datetime.now(pytz.utc)
+                if self.discovery_state is not None:
+                    self.discovered_box_identity = self.discovery_state.box_identity
+                self.save_discovery_state()
+                self.schedule_services()
+
+            await self.scheduler.sleep_until_next_deadline(max_sleep=self.max_idle_sleep)
+
+    async def replay_task_loop(self, queue):
+        """
+        task loop which feeds recorded responses instead of requesting the FritzBox. The measurements
+        get the time stamp of the recorded response.
+
+        Parameters
+        ----------
+        queue: BoundedQueue
+            the result queue object to write batches of measurements to so the influx handler can pick them up
+        """
+
+        services = {x.discovery_key: x for x in self.services}
+        replay_speed = self.config.replay_speed
+
+        log.info(f"Replaying {self.name} responses from '{self.config.replay_file}'")
+
+        first_record_time = None
+        replay_start = time.monotonic()
+        num_records = 0
+        for record in FritzBoxResponseReplay(self.config.replay_file).records(self.discovery_state_key):
+
+            service = services.get(record.get("service"))
+            if service is None:
+                log.debug(f"Skipping recorded response of unknown {self.name} service '{record.get('service')}'")
+                continue
+
+            # keep the recorded time between responses, a replay speed of 0 replays as fast as possible
+            if first_record_time is None:
+                first_record_time = record.get("time")
+            if replay_speed > 0:
+                await asyncio.sleep(max(replay_start + (record.get("time") - first_record_time) / replay_speed -
+                                        time.monotonic(), 0))
+
+            self.current_result_list = list()
+            self.current_timestamp = datetime.fromtimestamp(record.get("time"), pytz.utc)
+
+            with watchdog.activity(self.name, service.name), \
+                 profiler.profile(f"{self.discovery_state_key}_{service.name}"):
+                self.replay_record(service, record)
+
+            self.current_timestamp = None
+            num_records += 1
+
+            for result in self.current_result_list:
+                log.debug(result)
+
+            await queue.put_batch(self.current_result_list)
+
+            # give other tasks a chance to run if replayed as fast as possible
+            await asyncio.sleep(0)
+
+        log.info(f"Finished replaying {num_records} {self.name} responses")
 
 
 class FritzBoxHandler(FritzBoxHandlerBase):
 
     name = "FritzBox TR-069"
+    discovery_state_key = "tr069"
+
+    # max number of persistent connections to the FritzBox, actions are called one after another
+    keepalive_pool_size = 1
 
     def __init__(self, config):
 
         super().__init__(config)
 
+        # successful action results of the current scheduling pass, see call_action()
+        self.action_results = dict()
+
         self.add_services(FritzBoxTR069Service, service_definitions.tr069_services)
 
+        self.link_equivalent_actions()
+
+    @staticmethod
+    def action_key(service_name: str, action_name: str, params: dict) -> tuple:
+        """
+        returns the key of an action call. Service names are normalized the same way fritzconnection does,
+        'WANCommonIFC', 'WANCommonIFC:1' and 'WANCommonIFC1' address the same service.
+        """
+
+        service_name = service_name.replace(":", "")
+        if not service_name[-1].isdigit():
+            service_name += "1"
+
+        return service_name, action_name, tuple(sorted((k, f"{v}") for k, v in params.items()))
+
+    def link_equivalent_actions(self):
+        """
+        find actions which are requested by more than one service, either as identical service, action and
+        params or defined as 'equivalent_actions'. Services sharing actions are put in the same schedule group
+        to be requested in the same scheduling pass. Each of these actions is only executed once per pass
+        and the result is shared with all other services requesting it.
+        """
+
+        actions = dict()
+        for service in self.services:
+            for action in service.actions:
+                actions.setdefault(self.action_key(service.name, action.name, action.params), list()).append(
+                    (service, action))
+
+        for service in self.services:
+            for action in service.actions:
+                equivalent_services = [x.name for x, y in actions.get(
+                    self.action_key(service.name, action.name, action.params)) if x is not service]
+
+                for equivalent_service_name in service.equivalent_actions.get(action.name, list()):
+                    if self.action_key(equivalent_service_name, action.name, action.params) not in actions:
+                        log.warning(f"Equivalent action '{equivalent_service_name}' '{action.name}' of {self.name} "
+                                    f"service '{service.name}' is not defined")
+                        continue
+
+                    equivalent_services.append(equivalent_service_name)
+
+                    # the equivalent action can use the result of this action as well
+                    for _, equivalent_action in actions.get(
+                            self.action_key(equivalent_service_name, action.name, action.params)):
+                        if service.name not in equivalent_action.equivalent_services:
+                            equivalent_action.equivalent_services.append(service.name)
+
+                for equivalent_service_name in equivalent_services:
+                    if equivalent_service_name not in action.equivalent_services:
+                        action.equivalent_services.append(equivalent_service_name)
+
+                if len(action.equivalent_services) > 0:
+                    log.debug(f"{self.name} action '{service.name}' '{action.name}' shares its result with: "
+                              f"{', '.join(action.equivalent_services)}")
+
+        # merge all services which share actions directly or indirectly into one schedule group
+        services = {x.name: x for x in self.services}
+        for service in self.services:
+            for action in service.actions:
+                linked_services = [service] + [services[x] for x in action.equivalent_services if x in services]
+                if len(linked_services) < 2:
+                    continue
+
+                groups = set(x.schedule_group or x.name for x in linked_services)
+                group = min(groups)
+                for linked_service in self.services:
+                    if linked_service in linked_services or linked_service.schedule_group in groups:
+                        linked_service.schedule_group = group
+
+    def call_action(self, service_name: str, action_name: str, params: dict = None,
+                    equivalent_services: list = None, share_result: bool = False, consumer: str = None):
+        """
+        call a TR-069 action. If 'share_result' is set, a successful result of the same or an equivalent
+        action which has been requested by a different consumer in the current scheduling pass is returned instead.
+
+        Parameters
+        ----------
+        service_name: str
+            name of the service
+        action_name: str
+            name of the action
+        params: dict
+            params of the action
+        equivalent_services: list
+            names of services which return the same result for this action
+        share_result: bool
+            use the result of a different consumer of the current scheduling pass
+        consumer: str
+            name of the consumer of the result
+
+        Returns
+        -------
+        dict: the result of the action call
+        """
+
+        params = params or dict()
+        keys = [self.action_key(x, action_name, params) for x in [service_name] + (equivalent_services or list())]
+
+        for key in keys:
+            cached_result = self.action_results.get(key)
+
+            # a consumer never gets its own previous result
+            if share_result is True and cached_result is not None and cached_result[2] != consumer and \
+                    cached_result[0] == self.current_pass:
+                metrics.increment("tr069_action_cache_hits_total", service=service_name, action=action_name)
+                return cached_result[1]
+
+        self.num_requests += 1
+        with metrics.timer("service_request_duration_seconds", handler=self.discovery_state_key,
+                           service=service_name):
+            call_result = self.session.call_action(service_name, action_name, **params)
+
+        if call_result is not None:
+            self.action_results[keys[0]] = (self.current_pass, call_result, consumer)
+
+        return call_result
+
     def connect(self):
 
         if self.init_successful is True:
@@ -120,15 +648,41 @@ class FritzBoxHandler(FritzBoxHandlerBase):
 
         log.debug(f"Initiating new {self.name} session")
 
+        connection_params = {
+            "address": self.config.hostname,
+            "port": self.config.port,
+            "user": self.config.username,
+            "password": self.config.password,
+            "timeout": (self.config.connect_timeout, self.config.connect_timeout * 4),
+            "use_tls": self.config.tls_enabled
+        }
+
+        # the service descriptions (tr64desc.xml and all SCPD files) are cached on disk.
+        # The cache is verified against the model name and firmware version of the box
+        # and gets reloaded from the FritzBox if either of them changed.
+        if self.config.cache_enabled is True:
+            connection_params["use_cache"] = True
+            connection_params["verify_cache"] = True
+            connection_params["cache_format"] = "json"
+            connection_params["cache_directory"] = self.config.cache_directory
+
         try:
-            self.session = FritzConnection(
-                address=self.config.hostname,
-                port=self.config.port,
-                user=self.config.username,
-                password=self.config.password,
-                timeout=(self.config.connect_timeout, self.config.connect_timeout * 4),
-                use_tls=self.config.tls_enabled
-            )
+            try:
+                self.session = FritzConnection(**connection_params)
+            except OSError as e:
+                # requests connection errors are OSErrors as well, only retry on file system errors
+                if connection_params.get("use_cache") is not True or \
+                        isinstance(e, requests.exceptions.RequestException):
+                    raise e
+                log.warning(f"Unable to use {self.name} description cache, loading descriptions from FritzBox: {e}")
+                connection_params["use_cache"] = False
+                self.session = FritzConnection(**connection_params)
+
+            # all further actions share a persistent connection (and TLS session) to the FritzBox
+            protocol = "https://" if self.config.tls_enabled is True else "http://"
+            self.session.session.adapters[protocol].close()
+            self.session.session.mount(protocol, KeepAliveAdapter(self.discovery_state_key,
+                                                                  pool_maxsize=self.keepalive_pool_size))
 
             self.version = self.session.system_version
 
@@ -158,7 +712,7 @@ class FritzBoxHandler(FritzBoxHandlerBase):
         # get link type
         # noinspection PyBroadException
         try:
-            link_info = self.session.call_action("WANCommonIFC", "GetCommonLinkProperties")
+            link_info = self.call_action("WANCommonIFC", "GetCommonLinkProperties", consumer="connect")
             link_type = FritzBoxModel.get_link_type(self.config.model, link_info.get("NewWANAccessType"))
             self.config.link_type = link_type
         except BaseException:
@@ -169,10 +723,171 @@ class FritzBoxHandler(FritzBoxHandlerBase):
         self.init_successful = True
 
     def close(self):
-        self.session.session.close()
+        if self.session is not None:
+            adapter = self.session.session.adapters.get("https://" if self.config.tls_enabled is True else "http://")
+            if isinstance(adapter, KeepAliveAdapter) and adapter.num_requests > 0:
+                log.debug(f"{self.name} sent {adapter.num_requests} requests on {adapter.num_connections} "
+                          f"connections, connection reuse ratio: {adapter.reuse_ratio:.2f}")
+            self.session.session.close()
+        if self.config.response_recorder is not None:
+            self.config.response_recorder.close()
         if self.init_successful is True:
             log.info(f"Closed {self.name} connection")
 
+    def extract_values(self, service, call_result):
+        """
+        converts the result of a single action call into measurements
+
+        Parameters
+        ----------
+        service: FritzBoxTR069Service
+            the service the action belongs to
+        call_result: dict
+            the values returned by the action call
+        """
+
+        for key, value in call_result.items():
+            log.debug(f"{self.name} result: {key} = {value}")
+            metric_name = service.value_instances.get(key)
+
+            if metric_name is None:
+                continue
+
+            data_type = None
+
+            # support setting a data type by appending it to the metric name by a double colon
+            if ":" in metric_name:
+                metric_data_type = metric_name.split(":")[1]
+                metric_name = metric_name.split(":")[0]
+
+                data_type = {
+                    "str": str,
+                    "int": int,
+                    "float": float,
+                    "bool": bool
+                }.get(metric_data_type)
+
+                if data_type is None:
+                    log.warning(f"Unknown data type '{metric_data_type}' for metric '{key}' "
+                                f"in service '{service.name}'")
+
+            metric = FritzMeasurement(metric_name, value, box_tag=self.config.box_tag, data_type=data_type,
+                                      timestamp=self.current_timestamp, priority=service.priority)
+
+            self.current_result_list.append(metric)
+
+            counter_bits = service.counters.get(key)
+            if counter_bits is not None and self.config.counter_deltas is True:
+                # a decreased counter either wrapped around or the FritzBox rebooted since the last value.
+                # The uptime is only requested with DeviceInfo, which might be due after this service.
+                if self.counter_tracker.decreased((metric.name, (service.name, key)), metric.value):
+                    self.refresh_boot_time()
+
+                self.add_counter_measurements(metric, (service.name, key), bits=counter_bits)
+
+        if service.series is not None:
+            self.extract_series(service, call_result)
+
+        # special case: track reboots to tell counter resets from counter wraps
+        if service.name == "DeviceInfo" and "NewUpTime" in call_result:
+            self.set_boot_time(call_result.get("NewUpTime"))
+
+    def set_boot_time(self, uptime):
+        """
+        pass the boot time derived from the uptime in seconds to the counter tracker
+        """
+
+        # noinspection PyBroadException
+        try:
+            uptime = timedelta(seconds=int(uptime))
+        except Exception:
+            return
+
+        self.counter_tracker.set_boot_time((self.current_timestamp or datetime.now(pytz.utc)) - uptime)
+
+    def refresh_boot_time(self):
+        """
+        request the current uptime of the FritzBox to detect a reboot before counter values are compared
+        """
+
+        # recorded responses are replayed in order, the uptime is updated with the next DeviceInfo record
+        if self.config.replay_file is not None or self.session is None:
+            return
+
+        try:
+            device_info = self.call_action("DeviceInfo", "GetInfo", consumer="counters")
+        except Exception as e:
+            log.debug(f"Unable to request {self.name} uptime: {e}")
+            return
+
+        if isinstance(device_info, dict):
+            self.set_boot_time(device_info.get("NewUpTime"))
+
+    def extract_series(self, service, call_result):
+        """
+        expands the comma separated sample histories of a call result into measurements, oldest first.
+        The newest sample gets the time stamp of the call, each older sample is 'interval' seconds older.
+        Samples which have already been reported by the previous call are skipped.
+
+        Parameters
+        ----------
+        service: FritzBoxTR069Service
+            the service the action belongs to
+        call_result: dict
+            the values returned by the action call
+        """
+
+        interval = service.series.get("interval")
+        newest_timestamp = (self.current_timestamp or datetime.now(pytz.utc)).timestamp()
+        last_timestamp = service.last_series_timestamp
+
+        if last_timestamp is not None:
+            # stay on the sample grid of the previous call to match overlapping samples exactly
+            newest_timestamp = last_timestamp + round((newest_timestamp - last_timestamp) / interval) * interval
+
+            if newest_timestamp <= last_timestamp:
+                return
+
+        num_samples = 0
+        for key, metric_name in service.series.get("value_instances").items():
+
+            value = call_result.get(key)
+            if value is None:
+                continue
+
+            samples = [x.strip() for x in f"{value}".split(",")]
+
+            new_samples = list()
+            for index, sample in enumerate(samples):
+
+                timestamp = newest_timestamp - index * interval
+                if last_timestamp is not None and timestamp <= last_timestamp:
+                    break
+
+                # noinspection PyBroadException
+                try:
+                    new_samples.append((timestamp, int(sample)))
+                except Exception:
+                    continue
+
+            # add the oldest sample first, the rollups expect the measurements of a series in chronological order
+            for timestamp, sample in reversed(new_samples):
+                self.current_result_list.append(
+                    FritzMeasurement(metric_name, sample, box_tag=self.config.box_tag, data_type=int,
+                                     timestamp=datetime.fromtimestamp(timestamp, pytz.utc),
+                                     priority=service.priority)
+                )
+
+            num_samples = max(num_samples, len(samples))
+
+        if num_samples > 0:
+            service.last_series_timestamp = newest_timestamp
+
+    def replay_record(self, service, record):
+
+        if isinstance(record.get("result"), dict):
+            self.extract_service_values(service, record.get("result"))
+
     def query_service_data(self, service):
 
         def service_invalid_log(log_message):
@@ -201,9 +916,10 @@ class FritzBoxHandler(FritzBoxHandlerBase):
                 log.debug(f"Skipping disabled service action: {service.name} - {action.name}")
                 continue
 
-            # add parameters
+            # add parameters, every service has to prove its actions are available during discovery
             try:
-                call_result = self.session.call_action(service.name, action.name, **action.params)
+                call_result = self.call_action(service.name, action.name, action.params, action.equivalent_services,
+                                               share_result=self.discovery_done, consumer=service.name)
             except FritzServiceError:
                 service_invalid_log(f"Requested invalid service: {service.name}")
                 if self.discovery_done is False:
@@ -238,36 +954,13 @@ class FritzBoxHandler(FritzBoxHandlerBase):
                 debug_msg += f" ({action.params})"
             log.debug(debug_msg)
 
+            if self.config.response_recorder is not None:
+                self.config.response_recorder.record_tr069(service, action, call_result)
+
             # set time stamp of this query
             service.set_last_query_now()
 
-            for key, value in call_result.items():
-                log.debug(f"{self.name} result: {key} = {value}")
-                metric_name = service.value_instances.get(key)
-
-                if metric_name is not None:
-
-                    data_type = None
-
-                    # support setting a data type by appending it to the metric name by a double colon
-                    if ":" in metric_name:
-                        metric_data_type = metric_name.split(":")[1]
-                        metric_name = metric_name.split(":")[0]
-
-                        data_type = {
-                            "str": str,
-                            "int": int,
-                            "float": float,
-                            "bool": bool
-                        }.get(metric_data_type)
-
-                        if data_type is None:
-                            log.warning(f"Unknown data type '{metric_data_type}' for metric '{key}' "
-                                        f"in service '{service.name}'")
-
-                    self.current_result_list.append(
-                        FritzMeasurement(metric_name, value, box_tag=self.config.box_tag, data_type=data_type)
-                    )
+            self.extract_service_values(service, call_result)
 
             # special case: update firmware version when requested
             if service.name == "DeviceInfo" and action.name == "GetInfo":
@@ -284,6 +977,10 @@ class FritzBoxHandler(FritzBoxHandlerBase):
 class FritzBoxLuaHandler(FritzBoxHandlerBase):
 
     name = "FritzBox Lua"
+    discovery_state_key = "lua"
+
+    # seconds a successful response is reused for requests of other services with the same url and params
+    response_cache_ttl = 5
 
     def __init__(self, config):
         super().__init__(config)
@@ -291,6 +988,15 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         self.url = None
         self.sid = None
 
+        # recent successful responses and their parsed results, see request()
+        self.response_cache = dict()
+
+        # results of filter functions and data paths during the extraction of a single response
+        self.extract_cache = dict()
+
+        # names of services which request their complete data as a partial update would need too many requests
+        self.partial_update_fallbacks = set()
+
         # disable TLS insecure warnings if user explicitly switched off validation
         if bool(self.config.verify_tls) is False:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -364,10 +1070,51 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
 
         log.info(f"Successfully established {self.name} session")
 
+        metrics.increment("lua_logins_total")
+
         self.sid = sid
         self.init_successful = True
 
-    def request(self, service_to_request, additional_params):
+    def request(self, service_to_request, additional_params, partial_remaining: int = None):
+        """
+        request a Lua service
+
+        Parameters
+        ----------
+        service_to_request: FritzBoxLuaService
+            the service to request
+        additional_params: dict
+            params to add to the request
+        partial_remaining: int
+            number of requests left of a partial update, the response is returned as text.
+            None for requests of the complete service data.
+
+        Returns
+        -------
+        the parsed response data or None if the request failed
+        """
+
+        response_parser = service_to_request.response_parser
+        if partial_remaining is not None:
+            response_parser = FritzBoxLuaService.response_parser
+
+        # services requesting the same page within the cache ttl share the response and the parsed result
+        cache_key = (service_to_request.method, service_to_request.url_path,
+                     tuple(sorted((k, f"{v}") for k, v in (additional_params or dict()).items())))
+
+        cache_entry = self.response_cache.get(cache_key)
+        if cache_entry is not None and time.monotonic() - cache_entry.get("time") < self.response_cache_ttl:
+            metrics.increment("lua_response_cache_hits_total", service=service_to_request.name)
+
+            if self.config.response_recorder is not None:
+                self.config.response_recorder.record_lua(service_to_request, cache_entry.get("response"),
+                                                         additional_params, partial_remaining)
+
+            if response_parser not in cache_entry.get("results"):
+                cache_entry["results"][response_parser] = \
+                    self.process_response(service_to_request, cache_entry.get("response"), response_parser)
+
+            return cache_entry["results"][response_parser]
 
         if self.sid is None:
             self.connect()
@@ -393,20 +1140,115 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         data_url = f"{self.url}{service_to_request.url_path}"
 
         # perform request
+        self.num_requests += 1
         try:
-            response = self.session.request(service_to_request.method, data_url, **call_attributes)
+            with metrics.timer("service_request_duration_seconds", handler=self.discovery_state_key,
+                               service=service_to_request.name):
+                response = self.session.request(service_to_request.method, data_url, **call_attributes)
         except Exception as e:
             log.error(f"Unable to perform request to '{data_url}': {e}")
             return
 
+        if self.config.response_recorder is not None:
+            self.config.response_recorder.record_lua(service_to_request, response, additional_params,
+                                                     partial_remaining)
+
+        result = self.process_response(service_to_request, response, response_parser)
+
+        # drop expired entries and only cache successful responses
+        now = time.monotonic()
+        self.response_cache = {k: v for k, v in self.response_cache.items()
+                               if now - v.get("time") < self.response_cache_ttl}
+
+        if result is not None and response.status_code == 200:
+            self.response_cache[cache_key] = {
+                "time": now,
+                "response": response,
+                "results": {response_parser: result}
+            }
+
+        return result
+
+    def request_partial_update(self, service):
+        """
+        perform the partial update requests of a service and merge the responses into its last complete result
+
+        Parameters
+        ----------
+        service: FritzBoxLuaService
+            the service to update
+
+        Returns
+        -------
+        the updated result or None if the complete data needs to be requested
+        """
+
+        partial_requests = service.partial_requests_function(service.last_full_result)
+
+        if len(partial_requests) == 0:
+            return
+
+        # each request costs the FritzBox about as much as requesting the complete data once
+        max_requests = self.config.partial_update_max_requests
+        if 0 < max_requests < len(partial_requests):
+            # tell once that the partial updates are not used, the number of devices rarely changes
+            log_handler = log.debug if service.name in self.partial_update_fallbacks else log.info
+            log_handler(f"Partial update of {self.name} service '{service.name}' needs {len(partial_requests)} "
+                        f"requests (partial_update_max_requests = {max_requests}), requesting complete data")
+            self.partial_update_fallbacks.add(service.name)
+            return
+
+        self.partial_update_fallbacks.discard(service.name)
+
+        for index, params in enumerate(partial_requests):
+
+            content = self.request(service, additional_params=params,
+                                   partial_remaining=len(partial_requests) - index - 1)
+
+            if content is None:
+                log.debug(f"Partial update of {self.name} service '{service.name}' failed, "
+                          f"requesting complete data")
+                service.last_full_result = None
+                return
+
+            service.partial_update_function(service.last_full_result, params, content)
+
+        metrics.increment("service_partial_updates_total", handler=self.discovery_state_key, service=service.name)
+
+        return service.last_full_result
+
+    def process_response(self, service_to_request, response, response_parser=None):
+        """
+        parse the response of a Lua request
+
+        Parameters
+        ----------
+        service_to_request: FritzBoxLuaService
+            the requested service
+        response: requests.Response
+            the response returned by the FritzBox
+        response_parser: callable
+            parser to use instead of the response parser of the service
+
+        Returns
+        -------
+        the parsed response data or None if the request failed
+        """
+
+        if response_parser is None:
+            response_parser = service_to_request.response_parser
+
         # check for invalid session
         if "<html" in f"{response.content}"[0:100]:
+            metrics.increment("lua_session_expired_total")
             self.sid = None
             return
 
         # noinspection PyBroadException
         try:
-            result = service_to_request.response_parser(response)
+            with metrics.timer("service_parse_duration_seconds", handler=self.discovery_state_key,
+                               service=service_to_request.name):
+                result = response_parser(response)
         except Exception as e:
             log.error(f"{self.name} request parsing for '{service_to_request.name}' failed: {e}")
             return
@@ -429,9 +1271,67 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
 
     def close(self):
         self.session.close()
+        if self.config.response_recorder is not None:
+            self.config.response_recorder.close()
         if self.init_successful is True:
             log.info(f"Closed {self.name} connection")
 
+    def replay_record(self, service, record):
+
+        response = FritzBoxResponseReplay.build_response(record)
+        partial_update = record.get("partial_update")
+
+        if partial_update is None:
+            result = self.process_response(service, response)
+
+            if result is not None:
+                service.set_full_result(result)
+                self.extract_service_values(service, result)
+            return
+
+        # partial updates can only be merged into a previously replayed complete result
+        if service.last_full_result is None:
+            return
+
+        content = self.process_response(service, response, FritzBoxLuaService.response_parser)
+        if content is not None:
+            service.partial_update_function(service.last_full_result, partial_update.get("params"), content)
+
+        if partial_update.get("remaining") == 0:
+            self.extract_service_values(service, service.last_full_result)
+
+    def extract_values(self, service, result):
+        """
+        extract all metrics of a service from the parsed response
+
+        Parameters
+        ----------
+        service: FritzBoxLuaService
+            the requested service
+        result: dict, list
+            the parsed response data
+        """
+
+        try:
+            for metric_name, metric_params in service.value_instances.items():
+                self.extract_value(service, result, metric_name, metric_params)
+        finally:
+            # release all references to the response data
+            self.extract_cache = dict()
+
+    def cached(self, key: tuple, data, function):
+        """
+        return the result of function for data, evaluated only once per data object and key during the
+        extraction of a response. The cache keeps a reference to data so its id can't be reused meanwhile.
+        """
+
+        cache_key = key + (id(data),)
+        cache_entry = self.extract_cache.get(cache_key)
+        if cache_entry is None:
+            cache_entry = self.extract_cache[cache_key] = (data, function())
+
+        return cache_entry[1]
+
     def extract_value(self, service, data, metric_name, metric_params):
 
         # read config
@@ -443,18 +1343,23 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         tags_function = metric_params.get("tags_function")                      # needs to return a dict
         timestamp_function = metric_params.get("timestamp_function")            # needs to return a datetime
         exclude_filter_function = metric_params.get("exclude_filter_function")  # needs to return a bool
+        counter_params = metric_params.get("counter")                           # cumulative counter settings
 
         # define defaults
         metric_value = None
-        timestamp = None
+        timestamp = self.current_timestamp
         metric_tags = dict()
 
-        # noinspection PyBroadException
-        try:
-            if exclude_filter_function(data) is True:
-                return
-        except Exception:
-            pass
+        def is_excluded():
+            # noinspection PyBroadException
+            try:
+                return exclude_filter_function(data) is True
+            except Exception:
+                return False
+
+        if exclude_filter_function is not None and self.cached(("filter", exclude_filter_function), data,
+                                                               is_excluded) is True:
+            return
 
         if data_path is not None and value_function is not None:
             log.error("Attributes 'data_path' and 'value_function' cant be defined for the same entry"
@@ -470,7 +1375,9 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
                 pass
 
         elif data_path is not None:
-            metric_value = grab(data, data_path, fallback="" if data_type is str else None)
+            fallback = "" if data_type is str else None
+            metric_value = self.cached(("path", data_path, fallback), data,
+                                       lambda: grab(data, data_path, fallback=fallback))
 
         # try to add tags
         if isinstance(data_tags, dict):
@@ -505,7 +1412,7 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
                           f"for '{metric_name}' to '{data_type}': {e}")
 
             metric = FritzMeasurement(metric_name, metric_value, data_type=data_type, box_tag=self.config.box_tag,
-                                      additional_tags=metric_tags, timestamp=timestamp)
+                                      additional_tags=metric_tags, timestamp=timestamp, priority=service.priority)
 
             # check if measurement is tracked and already reported
             if service.skip_tracked_measurement(metric) is True:
@@ -515,6 +1422,20 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
             service.add_tracked_measurement(metric)
 
             self.current_result_list.append(metric)
+
+            if counter_params is not None and self.config.counter_deltas is True:
+                counter_key = None
+                # noinspection PyBroadException
+                try:
+                    counter_key = counter_params.get("key_function")(data)
+                except Exception:
+                    pass
+
+                if counter_key is None:
+                    counter_key = tuple(sorted(metric_tags.items()))
+
+                self.add_counter_measurements(metric, counter_key, counter_params.get("rate_factor", 1))
+
             return
 
         if type(metric_value) != data_type:
@@ -562,8 +1483,16 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
                 service.available = False
                 return
 
-        # request data
-        result = self.request(service, additional_params=service.params)
+        result = None
+        if service.partial_update_due(self.config.full_update_interval):
+            result = self.request_partial_update(service)
+
+        # request complete data
+        if result is None:
+            result = self.request(service, additional_params=service.params)
+
+            if result is not None and self.config.full_update_interval > 0:
+                service.set_full_result(result)
 
         if result is None:
             message_handler = log.info
@@ -586,8 +1515,6 @@ class FritzBoxLuaHandler(FritzBoxHandlerBase):
         # set time stamp of this query
         service.set_last_query_now()
 
-        # Request every param
-        for metric_name, metric_params in service.value_instances.items():
-            self.extract_value(service, result, metric_name, metric_params)
+        self.extract_service_values(service, result)
 
         return
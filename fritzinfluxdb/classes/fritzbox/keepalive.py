@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import ssl
+import weakref
+
+from requests.adapters import HTTPAdapter
+
+from fritzinfluxdb.classes.metrics import get_metrics
+
+metrics = get_metrics()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+        SSL context which resumes the TLS session of the previous connection for every new connection.
+        A resumed session skips the certificate exchange and key agreement of a full handshake.
+    """
+
+    # name of the handler to label the metrics with
+    handler_name = None
+
+    tls_session = None
+
+    def wrap_socket(self, sock, *args, session=None, **kwargs):
+
+        if session is None:
+            session = self.tls_session
+
+        ssl_sock = super().wrap_socket(sock, *args, session=session, **kwargs)
+
+        metrics.increment("tls_handshakes_total", handler=self.handler_name,
+                          resumed=f"{ssl_sock.session_reused}".lower())
+
+        self.update_session(ssl_sock)
+
+        return ssl_sock
+
+    def update_session(self, ssl_sock: ssl.SSLSocket) -> None:
+        """
+        remember the session of the socket to resume it with the next connection. With TLS 1.3 the
+        session ticket is only sent after the handshake, so this is called again once a response has been received.
+        """
+
+        session = ssl_sock.session
+        if session is None:
+            return
+
+        if self.tls_session is None or session.has_ticket is True or self.tls_session.has_ticket is False:
+            self.tls_session = session
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+        HTTP adapter which keeps a small pool of persistent connections to the FritzBox so consecutive
+        requests reuse the same TCP connection (and TLS session) instead of connecting again.
+
+        New connections and requests are counted to report how many requests reused an existing connection.
+    """
+
+    def __init__(self, handler_name: str, pool_maxsize: int = 1, **kwargs):
+        """
+        Parameters
+        ----------
+        handler_name: str
+            name of the handler to label the metrics with
+        pool_maxsize: int
+            max number of persistent connections to keep
+        """
+
+        self.handler_name = handler_name
+        self.ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.ssl_context.handler_name = handler_name
+        # certificates are verified (or not) according to the 'verify' setting of the session
+        self.ssl_context.check_hostname = False
+
+        self.num_connections = 0
+        self.num_requests = 0
+
+        # sockets of all connections which have been used so far
+        self.known_sockets = weakref.WeakSet()
+
+        super().__init__(pool_connections=1, pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+
+        kwargs["ssl_context"] = self.ssl_context
+
+        super().init_poolmanager(*args, **kwargs)
+
+    @property
+    def reuse_ratio(self) -> float:
+        """
+        share of requests which have been sent on an already established connection
+        """
+
+        if self.num_requests == 0:
+            return 0
+
+        return max(self.num_requests - self.num_connections, 0) / self.num_requests
+
+    def send(self, request, *args, **kwargs):
+
+        response = super().send(request, *args, **kwargs)
+
+        self.num_requests += 1
+        metrics.increment("http_requests_total", handler=self.handler_name)
+
+        # the connection is still checked out until the response has been read
+        sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+
+        if sock is not None and sock not in self.known_sockets:
+            self.known_sockets.add(sock)
+            self.num_connections += 1
+            metrics.increment("http_connections_total", handler=self.handler_name)
+
+        metrics.set_gauge("http_connection_reuse_ratio", self.reuse_ratio, handler=self.handler_name)
+
+        if isinstance(sock, ssl.SSLSocket):
+            self.ssl_context.update_session(sock)
+
+        return response
+
+# EOF
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import time
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+
+class FritzBoxLoadController:
+    """
+        Adapts the request intervals of all services to the load of the FritzBox.
+
+        The load is estimated from the request latency (compared to the fastest latency seen for
+        each service) and the CPU utilization reported by the FritzBox itself. If the FritzBox is busy,
+        all intervals get stretched, if it is idle again, the intervals are tightened step by step
+        until they reach the interval defined for each service.
+    """
+
+    # name of the measurement which reports the FritzBox CPU utilization
+    cpu_utilization_metric_name = "cpu_utilization"
+
+    # CPU utilization in percent below which the FritzBox is considered idle
+    cpu_idle_threshold = 50
+
+    # request latency compared to the baseline latency to consider the FritzBox busy or idle
+    latency_busy_ratio = 3.0
+    latency_idle_ratio = 1.5
+
+    # smoothing factor of the latency ratio
+    latency_smoothing = 0.2
+
+    # rate at which the baseline latency of a service moves up to the current latency
+    baseline_adaption = 0.01
+
+    # factors to stretch and tighten the interval factor with
+    stretch_factor = 1.5
+    tighten_factor = 0.8
+
+    # min seconds between two adjustments of the interval factor
+    min_adjust_interval = 30
+
+    def __init__(self, config):
+
+        self.config = config
+
+        self.enabled = bool(config.adaptive_intervals)
+        self.max_interval = config.adaptive_max_interval
+        self.cpu_busy_threshold = config.adaptive_cpu_threshold
+
+        self.interval_factor = 1.0
+        self.cpu_utilization = None
+        self.latency_ratio = 1.0
+        self.latency_baseline = dict()
+        self.last_adjustment = 0
+
+    def add_latency_sample(self, key: str, seconds: float) -> None:
+        """
+        add the duration of a request
+
+        Parameters
+        ----------
+        key: str
+            key of the requested service
+        seconds: float
+            duration of the request
+        """
+
+        if self.enabled is False or seconds <= 0:
+            return
+
+        baseline = self.latency_baseline.get(key)
+        if baseline is None or seconds < baseline:
+            baseline = seconds
+        else:
+            baseline += (seconds - baseline) * self.baseline_adaption
+
+        self.latency_baseline[key] = baseline
+
+        self.latency_ratio += (seconds / baseline - self.latency_ratio) * self.latency_smoothing
+
+        self.update()
+
+    def add_measurement(self, measurement) -> None:
+        """
+        checks if the measurement reports the FritzBox cpu utilization and uses it to estimate the load
+        """
+
+        if self.enabled is False or measurement.name != self.cpu_utilization_metric_name:
+            return
+
+        # noinspection PyBroadException
+        try:
+            self.cpu_utilization = int(measurement.value)
+        except Exception:
+            return
+
+        self.update()
+
+    def update(self) -> None:
+        """
+        stretch or tighten the request intervals depending on the current load of the FritzBox
+        """
+
+        if time.monotonic() - self.last_adjustment < self.min_adjust_interval:
+            return
+
+        cpu_busy = self.cpu_utilization is not None and self.cpu_utilization >= self.cpu_busy_threshold
+        cpu_idle = self.cpu_utilization is None or self.cpu_utilization <= self.cpu_idle_threshold
+
+        max_factor = max(self.max_interval / max(self.config.request_interval, 1), 1.0)
+
+        new_factor = self.interval_factor
+        if cpu_busy is True or self.latency_ratio >= self.latency_busy_ratio:
+            new_factor = min(self.interval_factor * self.stretch_factor, max_factor)
+        elif cpu_idle is True and self.latency_ratio <= self.latency_idle_ratio:
+            new_factor = max(self.interval_factor * self.tighten_factor, 1.0)
+
+        if new_factor == self.interval_factor:
+            return
+
+        load_description = f"cpu utilization: {self.cpu_utilization}%, latency ratio: {self.latency_ratio:.2f}"
+        if new_factor > self.interval_factor:
+            log.info(f"FritzBox seems to be busy ({load_description}). "
+                     f"Stretching request intervals by factor {new_factor:.2f}")
+        else:
+            log.info(f"FritzBox load decreased ({load_description}). "
+                     f"Setting request interval factor to {new_factor:.2f}")
+
+        self.interval_factor = new_factor
+        self.last_adjustment = time.monotonic()
+
+    def get_interval(self, interval: float) -> float:
+        """
+        returns the adapted request interval for the given service interval.
+        The adapted interval is never lower then the given interval and never higher
+        then the configured max interval.
+        """
+
+        if self.enabled is False or self.interval_factor == 1.0:
+            return interval
+
+        return max(min(interval * self.interval_factor, self.max_interval), interval)
+
+# EOF
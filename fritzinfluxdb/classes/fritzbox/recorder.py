@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import base64
+import gzip
+import json
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator
+
+import requests
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+
+def encode_value(value):
+    """
+    JSON encoder for values returned by fritzconnection which can't be serialized by default
+    """
+
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+
+    return f"{value}"
+
+
+def decode_value(data: Dict):
+
+    if "__datetime__" in data:
+        return datetime.fromisoformat(data.get("__datetime__"))
+
+    return data
+
+
+class FritzBoxResponseRecorder:
+    """
+        writes the raw responses of all FritzBox requests to a gzip compressed archive with one JSON
+        record per line. Shared between all FritzBox handlers.
+    """
+
+    # max seconds recorded responses are kept in the compression buffer before they are written to disk
+    flush_interval = 10
+
+    def __init__(self, config):
+        """
+        Parameters
+        ----------
+        config: FritzBoxConfig
+            the FritzBox config with the 'record_file' to write to
+        """
+
+        self.config = config
+        self.path = config.record_file
+        self.file = None
+        self.last_flush = 0
+        self.num_records = 0
+
+    def open(self) -> bool:
+
+        if self.file is not None:
+            return True
+
+        # append a new gzip member to an existing archive
+        try:
+            self.file = gzip.open(self.path, "at", encoding="utf-8")
+        except OSError as e:
+            log.error(f"Unable to open FritzBox record file '{self.path}': {e}")
+            self.path = None
+            return False
+
+        log.info(f"Recording FritzBox responses to '{self.path}'")
+
+        return True
+
+    def write(self, record: Dict) -> None:
+
+        if self.path is None or self.open() is False:
+            return
+
+        record = {
+            "time": time.time(),
+            "model": self.config.model,
+            "fw_version": self.config.fw_version,
+            "link_type": self.config.link_type,
+            **record
+        }
+
+        try:
+            self.file.write(json.dumps(record, default=encode_value) + "\n")
+
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+        except OSError as e:
+            log.error(f"Unable to write to FritzBox record file '{self.path}': {e}")
+            self.close()
+            self.path = None
+            return
+
+        self.num_records += 1
+
+    def record_tr069(self, service, action, call_result: Dict) -> None:
+        """
+        record the result of a TR-069 action call
+
+        Parameters
+        ----------
+        service: FritzBoxTR069Service
+            the requested service
+        action: FritzBoxAction
+            the requested action
+        call_result: dict
+            the result of the action call
+        """
+
+        self.write({
+            "handler": "tr069",
+            "service": service.discovery_key,
+            "action": action.name,
+            "params": action.params,
+            "result": call_result
+        })
+
+    def record_lua(self, service, response: requests.Response, params: Dict = None,
+                   partial_remaining: int = None) -> None:
+        """
+        record the raw response of a Lua request
+
+        Parameters
+        ----------
+        service: FritzBoxLuaService
+            the requested service
+        response: requests.Response
+            the response returned by the FritzBox
+        params: dict
+            the params of the request (without session id)
+        partial_remaining: int
+            number of requests left of a partial update, None for requests of the complete service data
+        """
+
+        record = {
+            "handler": "lua",
+            "service": service.discovery_key,
+            "status_code": response.status_code,
+            "reason": response.reason,
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding
+        }
+
+        try:
+            record["content"] = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            record["content"] = base64.b64encode(response.content).decode("ascii")
+            record["content_encoding"] = "base64"
+
+        if partial_remaining is not None:
+            record["partial_update"] = {"params": params, "remaining": partial_remaining}
+
+        self.write(record)
+
+    def close(self) -> None:
+
+        if self.file is None:
+            return
+
+        # noinspection PyBroadException
+        try:
+            self.file.close()
+        except Exception as e:
+            log.error(f"Unable to close FritzBox record file '{self.path}': {e}")
+
+        log.info(f"Recorded {self.num_records} FritzBox responses to '{self.path}'")
+
+        self.file = None
+
+
+class FritzBoxResponseReplay:
+    """
+        reads the records of an archive written by FritzBoxResponseRecorder
+    """
+
+    def __init__(self, path: str):
+
+        self.path = path
+
+    def records(self, handler_key: str = None) -> Iterator[Dict]:
+        """
+        returns all records of the archive in the order they have been recorded
+
+        Parameters
+        ----------
+        handler_key: str
+            only return records of this handler ('tr069' or 'lua')
+        """
+
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    # noinspection PyBroadException
+                    try:
+                        record = json.loads(line, object_hook=decode_value)
+                    except Exception:
+                        log.warning(f"Skipping invalid record in FritzBox replay file '{self.path}'")
+                        continue
+
+                    if handler_key is None or record.get("handler") == handler_key:
+                        yield record
+
+        # the archive of an interrupted recording is missing the end of the last gzip member
+        except (EOFError, zlib.error) as e:
+            log.warning(f"FritzBox replay file '{self.path}' is truncated: {e}")
+        except OSError as e:
+            log.error(f"Unable to read FritzBox replay file '{self.path}': {e}")
+
+    def first_record(self):
+
+        return next(self.records(), None)
+
+    @staticmethod
+    def build_response(record: Dict) -> requests.Response:
+        """
+        create a requests.Response object from a recorded Lua response
+        """
+
+        content = record.get("content") or ""
+        if record.get("content_encoding") == "base64":
+            content = base64.b64decode(content)
+        else:
+            content = content.encode("utf-8")
+
+        response = requests.Response()
+        response.status_code = record.get("status_code")
+        response.reason = record.get("reason")
+        response.encoding = record.get("encoding")
+        response._content = content
+        if record.get("content_type") is not None:
+            response.headers["Content-Type"] = record.get("content_type")
+
+        return response
+
+# EOF
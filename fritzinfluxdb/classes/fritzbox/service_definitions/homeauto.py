@@ -12,9 +12,11 @@
     https://avm.de/fileadmin/user_upload/Global/Service/Schnittstellen/AHA-HTTP-Interface.pdf
 """
 
-import xmltodict
 import random
 from datetime import datetime
+from functools import lru_cache
+from io import BytesIO
+from xml.etree.ElementTree import iterparse
 
 from fritzinfluxdb.common import grab, in_test_mode
 from fritzinfluxdb.classes.fritzbox.service_handler import FritzBoxLuaURLPath
@@ -161,60 +163,150 @@ def get_ha_alert_state(data):
     return force_int(data, "alert.state")
 
 
-def decode_function_bitmask(bitmask: int):
+# filters shared by many metrics, the Lua handler evaluates them only once per device list and device
+def exclude_filter_no_devices(data):
+
+    return "device" not in data.get("devicelist").keys()
+
+
+def exclude_filter_no_hkr(data):
+
+    return "hkr" not in data.keys()
+
+
+def exclude_filter_no_switch(data):
+
+    return "switch" not in data.keys()
+
+
+def exclude_filter_no_colorcontrol(data):
+
+    return "colorcontrol" not in data.keys()
+
+
+def exclude_filter_no_etsiunitinfo(data):
+
+    return "etsiunitinfo" not in data.keys()
+
+
+@lru_cache(maxsize=None)
+def decode_function_bitmask(bitmask: str):
+    """
+    returns the device classes of a function bitmask. The result is cached as there are only a few
+    different bitmasks even on installations with many devices.
+    """
 
-    return_values = list()
     # noinspection PyBroadException
     try:
         binary_value = int(bitmask)
     except Exception:
-        return return_values
+        return tuple()
 
-    for bit_shift, value in home_automation_device_classes.items():
+    return tuple(value for bit_shift, value in home_automation_device_classes.items() if binary_value & 1 << bit_shift)
 
-        if binary_value & 1 << bit_shift:
-            return_values.append(value)
 
-    return return_values
+def element_to_dict(element):
+    """
+    converts a xml element into the same structure xmltodict would return. Attributes are prefixed
+    with '@', elements with text only become strings, empty elements None and repeated elements lists.
+    """
+
+    result = {f"@{key}": value for key, value in element.attrib.items()}
 
+    for child in element:
+        value = element_to_dict(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif isinstance(result[child.tag], list):
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
 
-def reformat_homeauto_device_list(data):
+    text = element.text.strip() if element.text is not None else ""
 
-    device_list = data.get("devicelist")
+    if len(result) == 0:
+        return text if len(text) > 0 else None
 
-    devices_by_id = {x.get("@id"): x for x in device_list.get("device", [])}
+    if len(text) > 0:
+        result["#text"] = text
 
-    hun_fun_device_id = 0  # these need to be skipped and only scraped for the @fwversion
-    hun_fun_unit_id = 13   # these ones are kept
+    return result
 
-    new_device_list = list()
-    for device in device_list.get("device", []):
 
-        device_functions = decode_function_bitmask(device.get("@functionbitmask"))
+def parse_homeauto_device_list(content: bytes):
+    """
+    parses the device list incrementally. Each device is converted to a dict as soon as it has been read
+    and the xml element is discarded afterwards. Groups are skipped.
 
-        # add function list
-        device["@devicefunctions"] = device_functions
+    HAN-FUN devices are only used to add their firmware version to their HAN-FUN units.
 
-        if home_automation_device_classes[hun_fun_device_id] in device_functions:
+    Parameters
+    ----------
+    content: bytes
+        the getdevicelistinfos xml response
+
+    Returns
+    -------
+    dict: device list in the same structure as returned by xmltodict
+    """
+
+    hun_fun_device_class = home_automation_device_classes[0]  # these are skipped and only scraped for the @fwversion
+    hun_fun_unit_class = home_automation_device_classes[13]   # these ones are kept
+
+    device_list = dict()
+    devices = list()
+    firmware_by_id = dict()
+    hun_fun_units = list()
+
+    depth = 0
+    for event, element in iterparse(BytesIO(content), events=("start", "end")):
+
+        if event == "start":
+            depth += 1
+            if depth == 1:
+                device_list = {f"@{key}": value for key, value in element.attrib.items()}
             continue
 
-        if home_automation_device_classes[hun_fun_unit_id] in device_functions:
+        depth -= 1
 
-            parent_unit_id = grab(device, "etsiunitinfo.etsideviceid")
-            if parent_unit_id is None:
-                continue
+        # only handle direct children of the device list
+        if depth != 1:
+            continue
 
-            device["etsiunitinfo"]["unittype"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.unittype"), "")
-            device["etsiunitinfo"]["interfaces"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.interfaces"), "")
+        if element.tag == "device":
+            firmware_by_id[element.get("id")] = element.get("fwversion")
 
-            hun_fun_device_fw = devices_by_id.get(parent_unit_id, dict()).get("@fwversion")
-            if hun_fun_device_fw is not None:
-                device["@fwversion"] = hun_fun_device_fw
+            device_functions = decode_function_bitmask(element.get("functionbitmask"))
 
-        new_device_list.append(device)
+            if hun_fun_device_class not in device_functions:
+                device = element_to_dict(element)
+                device["@devicefunctions"] = device_functions
 
-    data["devicelist"]["device"] = new_device_list
-    return data
+                if hun_fun_unit_class in device_functions:
+                    hun_fun_units.append(device)
+
+                devices.append(device)
+
+        element.clear()
+
+    # HAN-FUN devices are not necessarily listed before their units
+    for device in hun_fun_units:
+
+        parent_unit_id = grab(device, "etsiunitinfo.etsideviceid")
+        if parent_unit_id is None:
+            devices.remove(device)
+            continue
+
+        device["etsiunitinfo"]["unittype"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.unittype"), "")
+        device["etsiunitinfo"]["interfaces"] = hun_fun_unit_types.get(grab(device, "etsiunitinfo.interfaces"), "")
+
+        hun_fun_device_fw = firmware_by_id.get(parent_unit_id)
+        if hun_fun_device_fw is not None:
+            device["@fwversion"] = hun_fun_device_fw
+
+    device_list["device"] = devices
+
+    return {"devicelist": device_list}
 
 
 def prepare_response_data(response):
@@ -242,7 +334,58 @@ def prepare_response_data(response):
     else:
         content = response.content
 
-    return reformat_homeauto_device_list(xmltodict.parse(content, force_list=('device',)))
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    return parse_homeauto_device_list(content)
+
+
+# per device commands to request frequently changing values between two complete device lists
+# and the device list element and value they update
+partial_update_commands = {
+    "getswitchpower": ("powermeter", "power"),
+    "getswitchenergy": ("powermeter", "energy"),
+    "getswitchstate": ("switch", "state"),
+    "gettemperature": ("temperature", "celsius")
+}
+
+
+def homeauto_partial_update_requests(data):
+    """
+    returns the params of all per device requests for the partial update of a device list.
+    Only present devices which have a power meter, a switch or a temperature sensor are requested.
+    """
+
+    partial_requests = list()
+    for device in grab(data, "devicelist.device", fallback=list()):
+
+        ain = device.get("@identifier")
+        if ain is None or device.get("present") != "1":
+            continue
+
+        for command, (element, _) in partial_update_commands.items():
+            if isinstance(device.get(element), dict):
+                partial_requests.append({"switchcmd": command, "ain": ain})
+
+    return partial_requests
+
+
+def merge_homeauto_partial_update(data, params, content):
+    """
+    merge the response of a per device request into the device list
+    """
+
+    element, key = partial_update_commands.get(params.get("switchcmd"), (None, None))
+    value = f"{content}".strip()
+
+    # the FritzBox returns 'inval' if the value is unknown
+    if element is None or not value.lstrip("-").isdigit():
+        return
+
+    for device in grab(data, "devicelist.device", fallback=list()):
+        if device.get("@identifier") == params.get("ain") and isinstance(device.get(element), dict):
+            device[element][key] = value
+            return
 
 
 lua_services.append(
@@ -255,6 +398,8 @@ lua_services.append(
             "switchcmd": "getdevicelistinfos"
         },
         "response_parser": prepare_response_data,
+        "partial_requests_function": homeauto_partial_update_requests,
+        "partial_update_function": merge_homeauto_partial_update,
         "value_instances": {
             # Base Data
             "ha_fw_version": {
@@ -266,7 +411,7 @@ lua_services.append(
                     "tags_function": lambda data: {"name": data.get("name")},
                     "data_path": "@fwversion"
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_product_name": {
                 "data_path": "devicelist.device",
@@ -277,7 +422,7 @@ lua_services.append(
                     "tags_function": lambda data: {"name": data.get("name")},
                     "data_path": "@productname"
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_manufacturer": {
                 "data_path": "devicelist.device",
@@ -288,7 +433,7 @@ lua_services.append(
                     "tags_function": lambda data: {"name": data.get("name")},
                     "data_path": "@manufacturer"
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_devicefunctions": {
                 "data_path": "devicelist.device",
@@ -299,7 +444,7 @@ lua_services.append(
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: ", ".join(data.get("@devicefunctions"))
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             "ha_device_present": {
@@ -311,7 +456,7 @@ lua_services.append(
                     "tags_function": lambda data: {"name": data.get("name")},
                     "data_path": "present"
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Battery data
@@ -325,7 +470,7 @@ lua_services.append(
                     "data_path": "battery",
                     "exclude_filter_function": lambda data: "battery" not in data.keys()
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_battery_low": {
                 "data_path": "devicelist.device",
@@ -337,7 +482,7 @@ lua_services.append(
                     "data_path": "batterylow",
                     "exclude_filter_function": lambda data: "batterylow" not in data.keys()
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Temperature
@@ -353,7 +498,7 @@ lua_services.append(
                         grab(data, "temperature.celsius") is None or grab(data, "temperature.offset") is None
                     )
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_temperature_celsius": {
                 "data_path": "devicelist.device",
@@ -367,7 +512,7 @@ lua_services.append(
                     ),
                     "exclude_filter_function": lambda data: grab(data, "temperature.celsius") is None
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_temperature_offset": {
                 "data_path": "devicelist.device",
@@ -381,7 +526,7 @@ lua_services.append(
                     ),
                     "exclude_filter_function": lambda data: grab(data, "temperature.offset") is None
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Power
@@ -395,7 +540,7 @@ lua_services.append(
                     "value_function": get_ha_powermeter_power,
                     "exclude_filter_function": lambda data: grab(data, "powermeter.power") is None
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_powermeter_energy": {
                 "data_path": "devicelist.device",
@@ -405,9 +550,14 @@ lua_services.append(
                     "type": float,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": get_ha_powermeter_energy,
-                    "exclude_filter_function": lambda data: grab(data, "powermeter.energy") is None
+                    "exclude_filter_function": lambda data: grab(data, "powermeter.energy") is None,
+                    # derive consumed Wh per interval and the average power in W (Wh per second * 3600)
+                    "counter": {
+                        "key_function": lambda data: data.get("@identifier"),
+                        "rate_factor": 3600
+                    }
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_powermeter_voltage": {
                 "data_path": "devicelist.device",
@@ -419,7 +569,7 @@ lua_services.append(
                     "value_function": get_ha_powermeter_voltage,
                     "exclude_filter_function": lambda data: grab(data, "powermeter.voltage") is None
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Switch data
@@ -431,9 +581,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": get_ha_switch_state,
-                    "exclude_filter_function": lambda data: "switch" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_switch
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_switch_mode": {
                 "data_path": "devicelist.device",
@@ -443,9 +593,9 @@ lua_services.append(
                     "type": str,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: grab(data, "switch.mode", fallback=""),
-                    "exclude_filter_function": lambda data: "switch" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_switch
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_switch_lock": {
                 "data_path": "devicelist.device",
@@ -455,9 +605,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "switch.lock"),
-                    "exclude_filter_function": lambda data: "switch" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_switch
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_switch_devicelock": {
                 "data_path": "devicelist.device",
@@ -467,9 +617,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "switch.devicelock"),
-                    "exclude_filter_function": lambda data: "switch" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_switch
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_simpleonoff_state": {
                 "data_path": "devicelist.device",
@@ -481,7 +631,7 @@ lua_services.append(
                     "value_function": lambda data: force_int(data, "simpleonoff.state"),
                     "exclude_filter_function": lambda data: "simpleonoff" not in data.keys()
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_levelcontrol_level": {
                 "data_path": "devicelist.device",
@@ -493,7 +643,7 @@ lua_services.append(
                     "value_function": lambda data: force_int(data, "levelcontrol.levelpercentage"),
                     "exclude_filter_function": lambda data: "levelcontrol" not in data.keys()
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # HUN-FUN device data
@@ -505,9 +655,9 @@ lua_services.append(
                     "type": str,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: grab(data, "etsiunitinfo.interfaces"),
-                    "exclude_filter_function": lambda data: "etsiunitinfo" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_etsiunitinfo
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_hun_fun_unittype": {
                 "data_path": "devicelist.device",
@@ -517,9 +667,9 @@ lua_services.append(
                     "type": str,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: grab(data, "etsiunitinfo.unittype"),
-                    "exclude_filter_function": lambda data: "etsiunitinfo" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_etsiunitinfo
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Colorcontrol
@@ -531,9 +681,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "colorcontrol.current_mode"),
-                    "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_colorcontrol
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_colorcontrol_hue": {
                 "data_path": "devicelist.device",
@@ -542,9 +692,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "colorcontrol.hue"),
-                    "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_colorcontrol
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_colorcontrol_saturation": {
                 "data_path": "devicelist.device",
@@ -553,9 +703,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "colorcontrol.saturation"),
-                    "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_colorcontrol
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_colorcontrol_temperature": {
                 "data_path": "devicelist.device",
@@ -564,9 +714,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "colorcontrol.temperature"),
-                    "exclude_filter_function": lambda data: "colorcontrol" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_colorcontrol
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Alarm
@@ -579,7 +729,7 @@ lua_services.append(
                     "value_function": get_ha_alert_state,
                     "exclude_filter_function": lambda data: "alert" not in data.keys()
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
 
             # Heating
@@ -593,9 +743,9 @@ lua_services.append(
                     "value_function": lambda data: (
                         avm_temp_map(force_int(data, "hkr.tist"), 0, 120, 0, 60)
                     ),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_tsoll": {
                 "data_path": "devicelist.device",
@@ -607,9 +757,9 @@ lua_services.append(
                     "value_function": lambda data: (
                         avm_temp_map(force_int(data, "hkr.tsoll", 253), 16, 56, 8, 28)
                     ),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_komfort": {
                 "data_path": "devicelist.device",
@@ -621,9 +771,9 @@ lua_services.append(
                     "value_function": lambda data: (
                         avm_temp_map(force_int(data, "hkr.komfort", 253), 16, 56, 8, 28)
                     ),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_absenk": {
                 "data_path": "devicelist.device",
@@ -635,9 +785,9 @@ lua_services.append(
                     "value_function": lambda data: (
                         avm_temp_map(force_int(data, "hkr.absenk", 253), 16, 56, 8, 28)
                     ),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_lock": {
                 "data_path": "devicelist.device",
@@ -647,9 +797,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.lock"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_devicelock": {
                 "data_path": "devicelist.device",
@@ -659,9 +809,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.devicelock"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_errorcode": {
                 "data_path": "devicelist.device",
@@ -671,9 +821,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.errorcode"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_windowopenactiv": {
                 "data_path": "devicelist.device",
@@ -683,9 +833,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.windowopenactiv"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_windowopenactiveendtime": {
                 "data_path": "devicelist.device",
@@ -695,9 +845,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.windowopenactiveendtime"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_boostactive": {
                 "data_path": "devicelist.device",
@@ -707,9 +857,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.boostactive"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_boostactiveendtime": {
                 "data_path": "devicelist.device",
@@ -719,9 +869,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.boostactiveendtime"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_batterylow": {
                 "data_path": "devicelist.device",
@@ -731,9 +881,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.batterylow"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_battery": {
                 "data_path": "devicelist.device",
@@ -743,9 +893,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.battery"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_nextchange_endperiod": {
                 "data_path": "devicelist.device",
@@ -755,9 +905,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.nextchange.endperiod"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_nextchange_tchange": {
                 "data_path": "devicelist.device",
@@ -769,9 +919,9 @@ lua_services.append(
                     "value_function": lambda data: (
                         avm_temp_map(force_int(data, "hkr.nextchange.tchange"), 16, 56, 8, 28)
                     ),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_summeractive": {
                 "data_path": "devicelist.device",
@@ -781,9 +931,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.summeractive"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
             "ha_heating_holidayactive": {
                 "data_path": "devicelist.device",
@@ -793,9 +943,9 @@ lua_services.append(
                     "type": int,
                     "tags_function": lambda data: {"name": data.get("name")},
                     "value_function": lambda data: force_int(data, "hkr.holidayactive"),
-                    "exclude_filter_function": lambda data: "hkr" not in data.keys()
+                    "exclude_filter_function": exclude_filter_no_hkr
                 },
-                "exclude_filter_function": lambda data: "device" not in data.get("devicelist").keys()
+                "exclude_filter_function": exclude_filter_no_devices
             },
         }
     })
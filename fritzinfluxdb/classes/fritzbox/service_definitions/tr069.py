@@ -26,6 +26,10 @@ tr069_services.extend([
             "NewLayer1UpstreamMaxBitRate": "upstreammax:int",
             "NewPhysicalLinkStatus": "physicallinkstatus:str",
             "NewX_AVM_DE_WANAccessType": "physicallinktype:str"
+        },
+        "counters": {
+            "NewX_AVM_DE_TotalBytesSent64": 64,
+            "NewX_AVM_DE_TotalBytesReceived64": 64
         }
     },
     {
@@ -47,6 +51,10 @@ tr069_services.extend([
     {
         "name": "WANCommonInterfaceConfig:1",
         "actions": ["GetCommonLinkProperties"],
+        # the upnp IGD service returns the same link properties, only one of them needs to be requested
+        "equivalent_actions": {
+            "GetCommonLinkProperties": ["WANCommonIFC"]
+        },
         "value_instances": {
             "NewLayer1DownstreamMaxBitRate": "downstreamphysicalmax:int",
             "NewLayer1UpstreamMaxBitRate": "upstreamphysicalmax:int"
@@ -67,6 +75,32 @@ tr069_services.extend([
             "NewLayer1UpstreamMaxBitRate": "upstreamphysicalmax:int"
         }
     },
+    {
+        # same service and action as above, requested less frequently to only expand the sample histories.
+        # The online monitor returns the history of the last 20 samples, one request per minute is sufficient
+        "name": "WANCommonInterfaceConfig1",
+        "actions": [
+            {
+                "name": "X_AVM-DE_GetOnlineMonitor",
+                "params": {
+                    "NewSyncGroupIndex": 0
+                }
+            }
+        ],
+        "interval": 60,
+        "series": {
+            "interval": 5,
+            "value_instances": {
+                "Newds_current_bps": "online_monitor_downstream_bps",
+                "Newmc_current_bps": "online_monitor_multicast_bps",
+                "Newus_current_bps": "online_monitor_upstream_bps",
+                "Newprio_realtime_bps": "online_monitor_upstream_realtime_bps",
+                "Newprio_high_bps": "online_monitor_upstream_high_bps",
+                "Newprio_default_bps": "online_monitor_upstream_default_bps",
+                "Newprio_low_bps": "online_monitor_upstream_low_bps"
+            }
+        }
+    },
     {
         "name": "DeviceInfo",
         "actions": ["GetInfo"],
@@ -84,6 +118,10 @@ tr069_services.extend([
         "value_instances": {
             "NewBytesReceived": "lan_totalbytesreceived:int",
             "NewBytesSent": "lan_totalbytessent:int"
+        },
+        "counters": {
+            "NewBytesReceived": 32,
+            "NewBytesSent": 32
         }
     },
     {
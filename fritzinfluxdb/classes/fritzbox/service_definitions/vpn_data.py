@@ -19,6 +19,21 @@ def prepare_json_response_data(response):
     return response.json()
 
 
+def exclude_filter_no_ipsec_users_legacy(data):
+
+    return not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+
+
+def exclude_filter_no_ipsec_users(data):
+
+    return not isinstance(grab(data, "data.init.userConnections"), dict)
+
+
+def exclude_filter_no_wireguard_connections(data):
+
+    return not isinstance(grab(data, "data.init.boxConnections"), dict)
+
+
 lua_services.append({
         "name": "VPN Users",
         "os_min_versions": "7.29",
@@ -47,7 +62,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users_legacy
             },
             "vpn_user_active": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -57,7 +72,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users_legacy
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -67,7 +82,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("virtualAddress"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users_legacy
             },
             "vpn_user_remote_address": {
                 "data_path": "data.vpnInfo.userConnections",
@@ -77,7 +92,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("address"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users_legacy
             },
             "vpn_user_num_active": {
                 "type": int,
@@ -90,7 +105,7 @@ lua_services.append({
                 "tags": {
                     "vpn_type": "IPSec"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.vpnInfo.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users_legacy
             }
         }
     }
@@ -123,7 +138,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users
             },
             "vpn_user_active": {
                 "data_path": "data.init.userConnections",
@@ -133,7 +148,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.init.userConnections",
@@ -143,7 +158,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("virtualAddress"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users
             },
             "vpn_user_remote_address": {
                 "data_path": "data.init.userConnections",
@@ -153,7 +168,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("address"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "IPSec"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users
             },
             "vpn_user_num_active": {
                 "type": int,
@@ -166,7 +181,7 @@ lua_services.append({
                 "tags": {
                     "vpn_type": "IPSec"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.userConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_ipsec_users
             }
         }
     }
@@ -200,7 +215,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("connected"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_wireguard_connections
             },
             "vpn_user_active": {
                 "data_path": "data.init.boxConnections",
@@ -210,7 +225,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("active"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_wireguard_connections
             },
             "vpn_user_virtual_address": {
                 "data_path": "data.init.boxConnections",
@@ -220,7 +235,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("remoteNet"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_wireguard_connections
             },
             "vpn_user_remote_address": {
                 "data_path": "data.init.boxConnections",
@@ -230,7 +245,7 @@ lua_services.append({
                     "value_function": lambda data: data.get("remoteIp"),
                     "tags_function": lambda data: {"name": data.get("name"), "vpn_type": "WireGuard"}
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_wireguard_connections
             },
             "vpn_user_num_active": {
                 "type": int,
@@ -243,7 +258,7 @@ lua_services.append({
                 "tags": {
                     "vpn_type": "WireGuard"
                 },
-                "exclude_filter_function": lambda data: not isinstance(grab(data, "data.init.boxConnections"), dict)
+                "exclude_filter_function": exclude_filter_no_wireguard_connections
             }
         }
     }
@@ -7,13 +7,14 @@
 #  For a copy, see file LICENSE.txt included in this
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
+import copy
 from typing import Union, AnyStr, Dict
 import pytz
 from datetime import datetime
 
 from fritzinfluxdb.common import do_error_exit
 from fritzinfluxdb.log import get_logger
-from fritzinfluxdb.classes.common import FritzMeasurement
+from fritzinfluxdb.classes.common import FritzMeasurement, MeasurementPriority
 
 log = get_logger()
 
@@ -25,6 +26,9 @@ class FritzBoxAction:
 
     available = True
 
+    # names of other services which execute the same action with the same result
+    equivalent_services = None
+
     def __init__(self, action: Union[AnyStr, Dict] = None) -> None:
 
         if action is None:
@@ -42,6 +46,8 @@ class FritzBoxAction:
         if self.name is None:
             do_error_exit("FritzBoxAction name was not defined in action parameter")
 
+        self.equivalent_services = list()
+
 
 class FritzBoxService:
     """
@@ -53,7 +59,18 @@ class FritzBoxService:
     name = None
     value_instances = None
     interval = 10
+    priority = MeasurementPriority.LOW
     last_query = None
+    next_query = None
+
+    # seconds between scheduled and actual start of the last request
+    lateness = None
+
+    # seconds the last request took
+    duration = None
+
+    # services of the same schedule group share their request time grid to be due in the same scheduling pass
+    schedule_group = None
 
     def __init__(self, service_data: Dict = None):
 
@@ -65,6 +82,7 @@ class FritzBoxService:
         self.params = service_data.get("params")
         self.value_instances = dict()
         self.interval = service_data.get("interval", self.interval)
+        self.priority = service_data.get("priority", self.priority)
 
         if self.name is None:
             do_error_exit(f"{self.__class__.name} instance has no name")
@@ -100,11 +118,40 @@ class FritzBoxService:
         if self.available is False:
             return False
 
+        # service is scheduled
+        if self.next_query is not None:
+            return datetime.now(pytz.utc) >= self.next_query
+
         if self.last_query and (datetime.now(pytz.utc)-self.last_query).total_seconds() < self.interval:
             return False
 
         return True
 
+    @property
+    def discovery_key(self):
+        """
+        unique key of this service used to persist the discovery state
+        """
+        return self.name
+
+    def get_discovery_state(self) -> Dict:
+        """
+        returns the discovery results of this service
+        """
+        return {"available": self.available}
+
+    def set_discovery_state(self, state: Dict) -> None:
+        """
+        restores previously saved discovery results of this service
+        """
+        self.available = bool(state.get("available", True))
+
+    def reset_discovery_state(self) -> None:
+        """
+        enables this service again to be validated with the next discovery run
+        """
+        self.available = True
+
 
 class FritzBoxTR069Service(FritzBoxService):
     """
@@ -120,9 +167,23 @@ class FritzBoxTR069Service(FritzBoxService):
         self.actions = list()
         self.link_type = service_data.get("link_type")  # defines for which link type this service is valid for
 
+        # cumulative counters of this service and their width in bits
+        self.counters = service_data.get("counters", dict())
+
+        # values which contain a comma separated history of samples (newest first) taken every 'interval' seconds
+        self.series = service_data.get("series")
+        self.last_series_timestamp = None
+
+        if self.series is not None and (not isinstance(self.series.get("interval"), int) or
+                                        not isinstance(self.series.get("value_instances"), dict)):
+            do_error_exit(f"FritzBoxTR069Service '{self.name}' 'series' needs an 'interval' and 'value_instances'")
+
         for action in service_data.get("actions", list()):
             self.add_action(action)
 
+        # actions of other services which return the same values, i.e. the same action of the upnp IGD service
+        self.equivalent_actions = service_data.get("equivalent_actions", dict())
+
     def add_action(self, action: Union[AnyStr, Dict] = None) -> None:
 
         if action is None:
@@ -136,6 +197,31 @@ class FritzBoxTR069Service(FritzBoxService):
         else:
             self.actions.append(action_instance)
 
+    def get_discovery_state(self) -> Dict:
+
+        state = super().get_discovery_state()
+        state["actions"] = {action.name: action.available for action in self.actions}
+
+        return state
+
+    def set_discovery_state(self, state: Dict) -> None:
+
+        super().set_discovery_state(state)
+
+        action_states = state.get("actions")
+        if not isinstance(action_states, dict):
+            return
+
+        for action in self.actions:
+            action.available = bool(action_states.get(action.name, True))
+
+    def reset_discovery_state(self) -> None:
+
+        super().reset_discovery_state()
+
+        for action in self.actions:
+            action.available = True
+
 
 class FritzBoxLuaURLPath:
     data = "/data.lua"
@@ -182,8 +268,24 @@ class FritzBoxLuaService(FritzBoxService):
 
         # used for services parsing log entries
         self.track_measurements = bool(service_data.get("track", False))
+
+        # tracked measurements (logs, calls) are only reported once and get lost if discarded
+        if self.track_measurements is True and "priority" not in service_data:
+            self.priority = MeasurementPriority.HIGH
         self.tracked_measurements = set()
 
+        # services which support partial updates only request their complete data every 'full_update_interval'
+        # seconds. In between only the requests returned by 'partial_requests_function' are performed and
+        # merged into the last complete result using the 'partial_update_function'
+        self.partial_requests_function = service_data.get("partial_requests_function")
+        self.partial_update_function = service_data.get("partial_update_function")
+        self.last_full_result = None
+        self.last_full_update = None
+
+        if (self.partial_requests_function is None) != (self.partial_update_function is None):
+            do_error_exit(f"FritzBoxLuaService '{self.name}' instance needs to define 'partial_requests_function' "
+                          f"and 'partial_update_function'")
+
     def validate_value_instances(self):
         """
         validate if necessary information has been provided
@@ -198,6 +300,11 @@ class FritzBoxLuaService(FritzBoxService):
             if metric_params.get("type") is None:
                 do_error_exit(f"FritzBoxLuaService '{self.name}' metric {metric_name} has no 'type' defined")
 
+    @property
+    def discovery_key(self):
+        # multiple services with the same name exist for different Fritz!OS versions
+        return f"{self.name} ({self.os_min_versions} - {self.os_max_versions or 'latest'})"
+
     def skip_tracked_measurement(self, measurement: FritzMeasurement):
         """
         check if measurement has already been generated. This is helpful reading logs and only add logs
@@ -217,6 +324,28 @@ class FritzBoxLuaService(FritzBoxService):
         if self.track_measurements is True:
             self.tracked_measurements.add(hash(measurement))
 
+    def set_full_result(self, result):
+        """
+        keep the complete result to merge partial updates into it until the next full update is due
+        """
+
+        if self.partial_requests_function is None:
+            return
+
+        # partial updates are merged in place, the result itself might be shared by the response cache
+        self.last_full_result = copy.deepcopy(result)
+        self.last_full_update = datetime.now(pytz.utc)
+
+    def partial_update_due(self, full_update_interval: int) -> bool:
+        """
+        determines if only a partial update should be requested instead of the complete data
+        """
+
+        if self.partial_requests_function is None or full_update_interval <= 0 or self.last_full_result is None:
+            return False
+
+        return (datetime.now(pytz.utc) - self.last_full_update).total_seconds() < full_update_interval
+
     @staticmethod
     def response_parser(response):
         """
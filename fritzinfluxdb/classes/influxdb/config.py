@@ -10,10 +10,18 @@
 import configparser
 
 from fritzinfluxdb.log import get_logger
-from fritzinfluxdb.classes.common import ConfigBase
+from fritzinfluxdb.classes.common import ConfigBase, overflow_policies
 
 log = get_logger()
 
+# units of durations like '15m'
+duration_units = {
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400
+}
+
 
 class InfluxDBConfig(ConfigBase):
     """
@@ -51,6 +59,26 @@ class InfluxDBConfig(ConfigBase):
         "type": int,
         "default": 365
     }
+    internal_metrics_interval = {
+        "type": int,
+        "default": 0
+    }
+    internal_metrics_measurement_name = {
+        "type": str,
+        "default": "fritzinfluxdb_internal"
+    }
+    queue_size = {
+        "type": int,
+        "default": 10_000
+    }
+    overflow_policy = {
+        "type": str,
+        "default": "drop_oldest"
+    }
+    rollup_tiers = {
+        "type": str,
+        "default": None
+    }
 
     # version 1 parameters
     username = {
@@ -105,3 +133,31 @@ class InfluxDBConfig(ConfigBase):
             if getattr(self, key) is None or len(getattr(self, key)) == 0:
                 self.parser_error = True
                 log.error(f"InfluxDB {key} not defined")
+
+        if self.queue_size < 1:
+            log.error("InfluxDB queue_size must be at least 1")
+            self.parser_error = True
+
+        if self.overflow_policy not in overflow_policies:
+            log.error(f"Invalid InfluxDB overflow_policy '{self.overflow_policy}', "
+                      f"must be one of: {', '.join(overflow_policies)}")
+            self.parser_error = True
+
+        # parse comma separated list of durations (i.e. '1m, 15m, 1h') to list of tier name and seconds
+        tiers = list()
+        for tier_name in [x.strip() for x in f"{self.rollup_tiers or ''}".split(",") if len(x.strip()) > 0]:
+            # noinspection PyBroadException
+            try:
+                duration = int(tier_name[:-1]) * duration_units[tier_name[-1]]
+            except Exception:
+                duration = 0
+
+            if duration <= 0:
+                log.error(f"Invalid InfluxDB rollup tier '{tier_name}', must be a number followed by "
+                          f"one of: {', '.join(duration_units)}")
+                self.parser_error = True
+                continue
+
+            tiers.append((tier_name, duration))
+
+        self.rollup_tiers = tiers
@@ -8,6 +8,7 @@
 #  repository or visit: <https://opensource.org/licenses/MIT>.
 
 import asyncio
+import time
 import pytz
 from datetime import datetime
 from http.client import HTTPConnection
@@ -19,18 +20,27 @@ import requests
 from influxdb import InfluxDBClient as InfluxDBClientV1
 from influxdb.exceptions import InfluxDBClientError
 # InfluxDB version 2.x client
-from influxdb_client import InfluxDBClient as InfluxDBClientV2, BucketRetentionRules, DBRPCreate, DBRPsService
+from influxdb.line_protocol import make_lines
+from influxdb_client import InfluxDBClient as InfluxDBClientV2, BucketRetentionRules, DBRPCreate, DBRPsService, \
+    Point
 from influxdb_client.rest import ApiException
 from influxdb_client.client.write_api import SYNCHRONOUS
 from influxdb_client.domain.write_precision import WritePrecision
 
 from fritzinfluxdb.classes.influxdb.config import InfluxDBConfig
+from fritzinfluxdb.classes.influxdb.rollup import RollupEngine
 from fritzinfluxdb.log import get_logger
-from fritzinfluxdb.classes.common import FritzMeasurement
+from fritzinfluxdb.classes.common import FritzMeasurement, MeasurementPriority, BoundedQueue
+from fritzinfluxdb.classes.metrics import get_metrics
+from fritzinfluxdb.classes.profiler import get_profiler
+from fritzinfluxdb.classes.watchdog import get_watchdog
 
 from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
 
 log = get_logger()
+metrics = get_metrics()
+profiler = get_profiler()
+watchdog = get_watchdog()
 
 
 class InfluxHandler:
@@ -52,6 +62,9 @@ class InfluxHandler:
     # max number of measurements written with each InfluxDB write
     max_measurements_per_write = 1_000
 
+    # histogram buckets to track the number of measurements written with each InfluxDB write
+    write_batch_size_buckets = (1, 10, 50, 100, 250, 500, 1_000)
+
     # percentage of filled buffer to start issue warnings
     max_measurements_buffer_warning = 80
 
@@ -62,6 +75,9 @@ class InfluxHandler:
     # max interval between write retries
     max_retry_interval = 120
 
+    # the number of seconds to collect measurements before writing them to InfluxDB
+    write_interval = 1
+
     # keep track if this instance was initiated successfully
     init_successful = False
 
@@ -85,6 +101,10 @@ class InfluxHandler:
         self.current_max_measurements_buffer_warning = self.max_measurements_buffer_warning
         self.current_measurements_per_write = self.max_measurements_per_write
 
+        self.rollup = None
+        if len(self.config.rollup_tiers) > 0:
+            self.rollup = RollupEngine(self.config.measurement_name, self.config.rollup_tiers)
+
         if self.config.version == 1:
 
             self.session_v1 = InfluxDBClientV1(
@@ -319,12 +339,33 @@ class InfluxHandler:
             return
 
         return {
-            "measurement": self.config.measurement_name,
+            "measurement": measurement.measurement_name or self.config.measurement_name,
             "tags": measurement.tags,
             "time": measurement.timestamp,
             "fields": {measurement.name: measurement.value}
         }
 
+    def serialize_measurements(self, measurements):
+        """
+        convert measurements to InfluxDB line protocol
+
+        Parameters
+        ----------
+        measurements: list
+            list of FritzMeasurement objects
+
+        Returns
+        -------
+        str: the line protocol representation of all measurements
+        """
+
+        data = [x for x in [self.convert_measurement(x) for x in measurements] if x is not None]
+
+        if self.config.version == 1:
+            return make_lines({"points": data}, precision="u").rstrip("\n")
+
+        return "\n".join([Point.from_dict(x, write_precision=WritePrecision.US).to_line_protocol() for x in data])
+
     def permitted_to_write_data(self):
 
         # permit writing if no last write retry is known
@@ -360,14 +401,19 @@ class InfluxHandler:
         log.debug(f"Trying to write a maximum of '{self.current_measurements_per_write}' measurements to InfluxDB")
         local_buffer = self.buffer[0:self.current_measurements_per_write]
 
-        # convert FritzMeasurement to list of dicts
-        data = [self.convert_measurement(x) for x in local_buffer]
+        # convert FritzMeasurement to line protocol
+        data = self.serialize_measurements(local_buffer)
+
+        # the previous write failed
+        if self.last_write_retry is not None:
+            metrics.increment("influx_write_retries_total")
 
         write_successful = False
         self.last_write_retry = datetime.now(pytz.utc)
+        write_start = time.perf_counter()
         try:
             if self.config.version == 1:
-                write_successful = self.session_v1.write_points(data, time_precision="u")
+                write_successful = self.session_v1.write_points(data, time_precision="u", protocol="line")
             elif self.config.version == 2:
                 self.session_v2_write_api.write(bucket=self.config.bucket, record=data,
                                                 write_precision=WritePrecision.US)
@@ -417,7 +463,14 @@ class InfluxHandler:
             self.out_of_retention_period_range = False
             self.current_measurements_per_write = self.max_measurements_per_write
 
+        metrics.observe("influx_write_duration_seconds", time.perf_counter() - write_start)
+
         if write_successful is True:
+            metrics.increment("influx_writes_total")
+            metrics.increment("influx_write_bytes_total", len(data.encode("utf-8")))
+            metrics.increment("influx_points_written_total", len(local_buffer))
+            metrics.observe("influx_write_batch_size", len(local_buffer), buckets=self.write_batch_size_buckets)
+
             if self.connection_lost is True:
                 log.info(f"Connection to influxDB '{self.config.hostname}' restored.")
                 log.info(f"Flushing '{len(self.buffer)}' measurements to InfluxDB")
@@ -433,9 +486,13 @@ class InfluxHandler:
             self.set_num_current_measurements_to_write(self.current_measurements_per_write * 4)
 
         else:
+            metrics.increment("influx_write_errors_total")
+
             if self.connection_lost is True:
                 self.current_retry_interval *= 2
 
+        metrics.set_gauge("influx_connection_lost", int(self.connection_lost))
+
     def set_num_current_measurements_to_write(self, num_measurements: int):
 
         if not isinstance(num_measurements, int):
@@ -455,15 +512,15 @@ class InfluxHandler:
 
         percent_buffer_usage = 100 / max_length * length
 
+        metrics.set_gauge("influx_buffer_size", length)
+        metrics.set_gauge("influx_buffer_usage_percent", percent_buffer_usage)
+
         buffer_warning_message = f"InfluxDB measurement buffer currently at {percent_buffer_usage:0.2f}% " \
-                                 f"(current {length}/max {max_length}). If buffer is full the oldest " \
-                                 f"messages will be discarded."
+                                 f"(current {length}/max {max_length}). If buffer is full measurements will " \
+                                 f"be discarded (overflow policy: {self.config.overflow_policy})."
 
         if length > max_length:
-            log.critical(f"InfluxDB measurement buffer length '{length}' "
-                         f"exceeded the maximum of {max_length} items. "
-                         f"Discarding oldest {length - max_length} measurements.")
-            self.buffer[:] = self.buffer[0 - max_length:]
+            self.trim_buffer()
 
         elif percent_buffer_usage >= self.current_max_measurements_buffer_warning:
             log.warning(buffer_warning_message)
@@ -471,22 +528,111 @@ class InfluxHandler:
         elif percent_buffer_usage < self.max_measurements_buffer_warning:
             self.current_max_measurements_buffer_warning = self.max_measurements_buffer_warning
 
-    async def task_loop(self, queue):
+    def trim_buffer(self):
+        """
+        discard measurements exceeding the max buffer size according to the configured overflow policy
+        """
+
+        length = len(self.buffer)
+        max_length = self.max_measurements_buffer_size
+
+        if length <= max_length:
+            return
+
+        num_discard = length - max_length
+
+        if self.config.overflow_policy == "drop_lowest_priority":
+            log.critical(f"InfluxDB measurement buffer length '{length}' "
+                         f"exceeded the maximum of {max_length} items. "
+                         f"Discarding {num_discard} measurements with the lowest priority.")
+
+            # discard the oldest measurements of the lowest priority
+            discard = set(id(x) for x in sorted(self.buffer, key=lambda m: (m.priority, m.timestamp))[:num_discard])
+            self.buffer[:] = [x for x in self.buffer if id(x) not in discard]
+        else:
+            log.critical(f"InfluxDB measurement buffer length '{length}' "
+                         f"exceeded the maximum of {max_length} items. "
+                         f"Discarding oldest {num_discard} measurements.")
+            self.buffer[:] = self.buffer[0 - max_length:]
+
+        metrics.increment("queue_dropped_total", num_discard, queue="buffer")
+
+    def add_to_buffer(self, measurements: list):
+        """
+        add a batch of measurements and the aggregates of all completed rollup windows to the buffer
+        """
+
+        self.buffer.extend(measurements)
+
+        if self.rollup is not None:
+            self.buffer.extend(self.rollup.add(measurements))
+
+    def seconds_until_next_write(self):
+        """
+        returns the number of seconds until the buffer should be written to InfluxDB again
+        """
+
+        if self.last_write_retry is None:
+            return self.write_interval
+
+        retry_interval = min(self.current_retry_interval, self.max_retry_interval)
+        seconds_since_last_retry = (datetime.now(pytz.utc) - self.last_write_retry).total_seconds()
+
+        return max(retry_interval - seconds_since_last_retry, self.write_interval)
+
+    def transfer_queue(self, queue: BoundedQueue):
+        """
+        move all queued measurements to the buffer and discard measurements exceeding the buffer size
+        """
+
+        while queue.empty() is False:
+            # leave measurements in the queue to block the collectors until the buffer has space again
+            if self.config.overflow_policy == "block" and len(self.buffer) >= self.max_measurements_buffer_size:
+                break
+
+            # add batch of measurements to instance buffer
+            self.add_to_buffer(queue.get_nowait())
+
+        # discard measurements before writing to keep the memory usage within the buffer size
+        self.trim_buffer()
+
+    async def collect_measurements(self, queue: BoundedQueue, seconds: float):
+        """
+        wait 'seconds' until the next write while moving queued measurements to the buffer.
+        While InfluxDB is unavailable the buffer absorbs the measurements instead of the much smaller queue.
+        """
+
+        deadline = time.monotonic() + seconds
 
         while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            await asyncio.sleep(min(remaining, self.write_interval))
+            self.transfer_queue(queue)
 
-            # transfer items to instance buffer
-            while queue.empty() is False:
-                # add measurements to instance buffer
-                self.buffer.append(await queue.get())
+    async def task_loop(self, queue: BoundedQueue):
+
+        while True:
+
+            # wait for new measurements if buffer is empty
+            if len(self.buffer) == 0:
+                self.add_to_buffer(await queue.get())
+
+                # collect measurements for a short while to write them in one batch
+                await asyncio.sleep(self.write_interval)
+
+            self.transfer_queue(queue)
 
             # write data from buffer to InfluxDB
-            await self.write_data()
+            with watchdog.activity(self.name, "write"), profiler.profile("influxdb_write"):
+                await self.write_data()
             await self.check_buffer()
 
             log.debug(f"Current InfluxDB measurement buffer length: {len(self.buffer)}")
-            if self.out_of_retention_period_range is False:
-                await asyncio.sleep(1)
+            if self.out_of_retention_period_range is False and len(self.buffer) > 0:
+                await self.collect_measurements(queue, self.seconds_until_next_write())
 
 
 class InfluxLogAndConfigWriter:
@@ -560,13 +706,15 @@ class InfluxLogAndConfigWriter:
                                 },
                                 data_type=str,
                                 timestamp=log_timestamp,
-                                timestamp_precision=WritePrecision.US)
+                                timestamp_precision=WritePrecision.US,
+                                priority=MeasurementPriority.HIGH)
 
     def get_timezone_setting_measurement(self):
 
         return FritzMeasurement(self.timezone_measurement_name, self.config.timezone,
                                 box_tag=self.config.box_tag,
-                                data_type=str)
+                                data_type=str,
+                                priority=MeasurementPriority.HIGH)
 
     def is_time_to_write_timezone_setting(self):
 
@@ -579,27 +727,128 @@ class InfluxLogAndConfigWriter:
 
         return False
 
-    async def task_loop(self, output_queue: asyncio.Queue):
+    def seconds_until_timezone_setting_write(self):
 
-        while True:
+        if self.last_timezone_setting_write is None:
+            return 0
 
-            while self.log_queue.empty() is False:
-                formatted_log_record = self.format_log_record(await self.log_queue.get())
+        seconds_since_last_write = (datetime.now(pytz.utc) - self.last_timezone_setting_write).total_seconds()
 
-                if formatted_log_record is None:
-                    continue
+        return max(self.timezone_setting_write_interval - seconds_since_last_write, 0)
 
-                log.debug(formatted_log_record)
+    async def task_loop(self, output_queue: BoundedQueue):
 
-                await output_queue.put(formatted_log_record)
+        while True:
 
             # write timezone setting to influx queue
             if self.is_time_to_write_timezone_setting():
                 timezone_measurement = self.get_timezone_setting_measurement()
                 log.debug(timezone_measurement)
-                await output_queue.put(timezone_measurement)
+                await output_queue.put_batch([timezone_measurement])
                 self.last_timezone_setting_write = datetime.now(pytz.utc)
 
-            await asyncio.sleep(1)
+            # sleep until a new log record arrives or the timezone setting needs to be written again
+            try:
+                log_record = await asyncio.wait_for(self.log_queue.get(),
+                                                    timeout=self.seconds_until_timezone_setting_write())
+            except asyncio.TimeoutError:
+                continue
+
+            log_records = [log_record]
+            while self.log_queue.empty() is False:
+                log_records.append(self.log_queue.get_nowait())
+
+            measurements = list()
+            for log_record in log_records:
+                formatted_log_record = self.format_log_record(log_record)
+
+                if formatted_log_record is None:
+                    continue
+
+                log.debug(formatted_log_record)
+
+                measurements.append(formatted_log_record)
+
+            await output_queue.put_batch(measurements)
+
+
+class InfluxInternalMetricsWriter:
+
+    name = "InfluxInternalMetricsWriter"
+
+    config = None
+
+    # quantiles of histograms written to InfluxDB
+    histogram_quantiles = {
+        "p50": 0.5,
+        "p99": 0.99
+    }
+
+    # keep track if this instance was initiated successfully
+    init_successful = False
+
+    def __init__(self, config: FritzBoxConfig, interval: int, measurement_name: str):
+        """
+        Handler to periodically write the internal metrics of all handlers to the output queue.
+        Histogram quantiles only reflect the values observed since the previous write.
+
+        Parameters
+        ----------
+        config: FritzBoxConfig
+            the current FritzBoxConfig
+        interval: int
+            the interval in seconds to write the metrics in
+        measurement_name: str
+            the InfluxDB measurement name to write the metrics to
+        """
+
+        if not isinstance(config, FritzBoxConfig):
+            raise ValueError("param 'config' needs to be a 'FritzBoxConfig' object")
+
+        self.config = config
+        self.interval = interval
+        self.measurement_name = measurement_name
+
+        self.previous_histogram_counts = dict()
+
+        self.init_successful = True
+
+    def new_measurement(self, name, value, tags, data_type=None):
+
+        return FritzMeasurement(name, value, box_tag=self.config.box_tag, additional_tags=dict(tags),
+                                data_type=data_type, measurement_name=self.measurement_name)
+
+    def get_measurements(self):
+        """
+        returns the current value of all internal metrics as list of FritzMeasurement objects
+        """
+
+        measurements = list()
+
+        for (name, tags), value in list(metrics.counters.items()) + list(metrics.gauges.items()):
+            measurements.append(self.new_measurement(name, value, tags))
+
+        for (name, tags), histogram in metrics.histograms.items():
+            measurements.append(self.new_measurement(f"{name}_count", histogram.count, tags, data_type=int))
+            measurements.append(self.new_measurement(f"{name}_sum", histogram.sum, tags, data_type=float))
+
+            previous_counts = self.previous_histogram_counts.get((name, tags))
+            for quantile_name, quantile in self.histogram_quantiles.items():
+                value = histogram.quantile(quantile, previous_counts)
+                if value is not None:
+                    measurements.append(self.new_measurement(f"{name}_{quantile_name}", value, tags,
+                                                             data_type=float))
+
+            self.previous_histogram_counts[(name, tags)] = list(histogram.counts)
+
+        return measurements
+
+    async def task_loop(self, output_queue: BoundedQueue):
+
+        while True:
+
+            await asyncio.sleep(self.interval)
+
+            await output_queue.put_batch(self.get_measurements())
 
 # EOF
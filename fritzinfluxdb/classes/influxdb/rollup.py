@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+from datetime import datetime
+from typing import List, Tuple
+
+import pytz
+
+from fritzinfluxdb.classes.common import FritzMeasurement
+from fritzinfluxdb.classes.metrics import get_metrics
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+metrics = get_metrics()
+
+
+class RollupWindow:
+    """
+        aggregated values of a single series within one window
+    """
+
+    __slots__ = ("start", "end", "box_tag", "additional_tags", "data_type", "min", "max", "sum", "count",
+                 "last", "last_timestamp")
+
+    def __init__(self, start: float, end: float, measurement: FritzMeasurement):
+
+        self.start = start
+        self.end = end
+        self.box_tag = measurement.box_tag
+        self.additional_tags = measurement.additional_tags
+        self.data_type = type(measurement.value)
+        self.min = measurement.value
+        self.max = measurement.value
+        self.sum = 0
+        self.count = 0
+        self.last = measurement.value
+        self.last_timestamp = measurement.timestamp
+
+    def add(self, measurement: FritzMeasurement):
+
+        value = measurement.value
+
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if measurement.timestamp >= self.last_timestamp:
+            self.last = value
+            self.last_timestamp = measurement.timestamp
+
+        self.sum += value
+        self.count += 1
+
+
+class RollupEngine:
+    """
+        aggregates numeric measurements per series (name and tags) into windows of a fixed duration for each tier.
+        For each completed window the min, max, mean and last value are returned as measurements
+        '<name>_min', '<name>_max', '<name>_mean' and '<name>_last'. They are time stamped with the start of the
+        window and written to the measurement '<measurement_name>_<tier name>'.
+
+        Windows are completed by the time stamps of the measurements, not by the wall clock. This way
+        replayed measurements are aggregated the same way as live measurements.
+    """
+
+    # seconds to wait for late measurements after the end of a window before it is completed
+    grace_period = 60
+
+    def __init__(self, measurement_name: str, tiers: List[Tuple[str, int]]):
+        """
+        Parameters
+        ----------
+        measurement_name: str
+            the InfluxDB measurement name of the raw measurements
+        tiers: list
+            list of tuples with the tier name and the window duration in seconds
+        """
+
+        self.measurement_name = measurement_name
+        self.tiers = tiers
+        self.windows = dict()
+
+        # newest time stamp of all measurements and the earliest time a window can be completed
+        self.watermark = None
+        self.next_expiry = None
+
+    def add(self, measurements: List[FritzMeasurement]) -> List[FritzMeasurement]:
+        """
+        add measurements to the open windows
+
+        Parameters
+        ----------
+        measurements: list
+            list of FritzMeasurement objects
+
+        Returns
+        -------
+        list: the aggregated measurements of all windows which have been completed
+        """
+
+        completed = list()
+
+        for measurement in measurements:
+
+            # only aggregate numeric measurements of the default measurement (no logs or internal metrics)
+            if measurement.measurement_name is not None or type(measurement.value) not in [int, float]:
+                continue
+
+            timestamp = measurement.timestamp.timestamp()
+            if self.watermark is None or timestamp > self.watermark:
+                self.watermark = timestamp
+
+            series = (measurement.name, tuple(sorted(measurement.tags.items())))
+
+            for tier_name, duration in self.tiers:
+
+                start = timestamp - timestamp % duration
+                key = (tier_name, series)
+                window = self.windows.get(key)
+
+                if window is not None and start > window.start:
+                    completed.extend(self.complete(tier_name, series[0], self.windows.pop(key)))
+                    window = None
+
+                elif window is not None and start < window.start:
+                    metrics.increment("rollup_late_measurements_total", tier=tier_name)
+                    continue
+
+                if window is None:
+                    window = self.windows[key] = RollupWindow(start, start + duration, measurement)
+
+                    if self.next_expiry is None or window.end + self.grace_period < self.next_expiry:
+                        self.next_expiry = window.end + self.grace_period
+
+                window.add(measurement)
+
+        if self.next_expiry is not None and self.watermark >= self.next_expiry:
+            completed.extend(self.expire())
+
+        return completed
+
+    def expire(self) -> List[FritzMeasurement]:
+        """
+        complete all windows which ended more than 'grace_period' seconds before the newest measurement
+        """
+
+        completed = list()
+
+        self.next_expiry = None
+        for key, window in list(self.windows.items()):
+
+            if window.end + self.grace_period <= self.watermark:
+                tier_name, (name, _) = key
+                completed.extend(self.complete(tier_name, name, self.windows.pop(key)))
+
+            elif self.next_expiry is None or window.end + self.grace_period < self.next_expiry:
+                self.next_expiry = window.end + self.grace_period
+
+        return completed
+
+    def complete(self, tier_name: str, name: str, window: RollupWindow) -> List[FritzMeasurement]:
+
+        metrics.increment("rollup_windows_total", tier=tier_name)
+
+        timestamp = datetime.fromtimestamp(window.start, pytz.utc)
+        measurement_name = f"{self.measurement_name}_{tier_name}"
+
+        return [
+            FritzMeasurement(f"{name}_{aggregate}", value, data_type=data_type, box_tag=window.box_tag,
+                             additional_tags=window.additional_tags, timestamp=timestamp,
+                             measurement_name=measurement_name)
+            for aggregate, value, data_type in [
+                ("min", window.min, window.data_type),
+                ("max", window.max, window.data_type),
+                ("mean", window.sum / window.count, float),
+                ("last", window.last, window.data_type)
+            ]
+        ]
+
+# EOF
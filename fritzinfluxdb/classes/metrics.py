@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+# default histogram buckets for durations in seconds
+default_duration_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+        counts observed values in cumulative buckets
+    """
+
+    def __init__(self, buckets: Tuple = default_duration_buckets):
+
+        self.buckets = tuple(sorted(buckets))
+        # the last entry counts all values above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        returns a list of tuples with the upper bound of each bucket and the number of values less or equal
+        """
+
+        result = list()
+        total = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((upper_bound, total))
+
+        return result
+
+    def quantile(self, quantile: float, previous_counts: list = None):
+        """
+        estimate a quantile by returning the upper bound of the bucket the quantile falls into
+
+        Parameters
+        ----------
+        quantile: float
+            the quantile to estimate (0.0 - 1.0)
+        previous_counts: list
+            the bucket counts of an earlier snapshot to only respect values observed since then
+
+        Returns
+        -------
+        float: upper bound of the matching bucket, None if no value has been observed
+        """
+
+        counts = self.counts
+        if previous_counts is not None:
+            counts = [current - previous for current, previous in zip(self.counts, previous_counts)]
+
+        total = sum(counts)
+        if total == 0:
+            return None
+
+        rank = quantile * total
+        seen = 0
+        for upper_bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank and count > 0:
+                # values above the highest bucket can't be estimated
+                return upper_bound if upper_bound != float("inf") else self.buckets[-1]
+
+        return self.buckets[-1]
+
+
+class InternalMetrics:
+    """
+        registry for the internal metrics of fritzinfluxdb. Metrics are identified by name and tags.
+    """
+
+    def __init__(self):
+
+        self.counters = dict()
+        self.gauges = dict()
+        self.histograms = dict()
+
+    @staticmethod
+    def key(name: str, tags: Dict) -> Tuple:
+
+        return name, tuple(sorted((k, f"{v}") for k, v in tags.items()))
+
+    def increment(self, name: str, value: float = 1, **tags) -> None:
+        """
+        add value to a counter
+        """
+
+        key = self.key(name, tags)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **tags) -> None:
+        """
+        set a gauge to a value
+        """
+
+        self.gauges[self.key(name, tags)] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple = default_duration_buckets, **tags) -> None:
+        """
+        add value to a histogram
+        """
+
+        key = self.key(name, tags)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **tags):
+        """
+        observe the duration in seconds of the enclosed block
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **tags)
+
+
+internal_metrics = InternalMetrics()
+
+
+def get_metrics() -> InternalMetrics:
+    """
+    common function to retrieve the internal metrics registry in project files
+
+    Returns
+    -------
+    InternalMetrics: the registry shared by all handlers
+    """
+
+    return internal_metrics
+
+# EOF
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+
+profile_modes = ["sampling", "deterministic"]
+
+
+class Profiler:
+    """
+        profiles the hot paths of fritzinfluxdb (service queries incl. value extraction and InfluxDB writes)
+        separately for each profile key.
+
+        modes:
+            sampling: samples the stack of the main thread in a background thread and writes one
+                      '<key>.folded' file per key which can be rendered with flamegraph.pl or speedscope
+            deterministic: uses cProfile and writes one '<key>.pstats' file per key
+    """
+
+    # seconds between two stack samples in sampling mode
+    sample_interval = 0.005
+
+    # seconds between writing the collected profiles to the profile directory
+    dump_interval = 60
+
+    def __init__(self):
+
+        self.mode = None
+        self.directory = None
+        self.current_key = None
+        self.main_thread_id = None
+        self.sampler = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.profiles = dict()
+        self.stacks = dict()
+        self.last_dump = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+
+        return self.mode is not None
+
+    def start(self, directory: str, mode: str = "sampling") -> bool:
+        """
+        start profiling
+
+        Parameters
+        ----------
+        directory: str
+            path to directory to write the profiles to
+        mode: str
+            the profile mode, one of 'sampling' or 'deterministic'
+
+        Returns
+        -------
+        bool: True if profiling has been started
+        """
+
+        if mode not in profile_modes:
+            log.error(f"Unknown profile mode '{mode}', must be one of: {', '.join(profile_modes)}")
+            return False
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            log.error(f"Unable to create profile directory '{directory}': {e}")
+            return False
+
+        self.directory = directory
+        self.mode = mode
+        self.main_thread_id = threading.get_ident()
+        self.last_dump = time.monotonic()
+
+        if self.mode == "sampling":
+            self.sampler = threading.Thread(target=self.sample_loop, name="profile sampler", daemon=True)
+            self.sampler.start()
+
+        log.info(f"Writing {self.mode} profiles to '{self.directory}' every {self.dump_interval} seconds")
+
+        return True
+
+    def stop(self):
+
+        if self.enabled is False:
+            return
+
+        if self.sampler is not None:
+            self.stop_event.set()
+            self.sampler.join()
+            self.sampler = None
+
+        self.dump()
+        self.mode = None
+
+    @contextmanager
+    def profile(self, key: str):
+        """
+        profile the enclosed block under the given key. Nested blocks are attributed to the outer key.
+        """
+
+        if self.enabled is False or self.current_key is not None:
+            yield
+            return
+
+        self.current_key = key
+
+        profile = None
+        if self.mode == "deterministic":
+            profile = self.profiles.get(key)
+            if profile is None:
+                profile = self.profiles[key] = cProfile.Profile()
+            profile.enable()
+
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self.current_key = None
+
+        if time.monotonic() - self.last_dump >= self.dump_interval:
+            self.dump()
+
+    def sample_loop(self):
+
+        while self.stop_event.wait(self.sample_interval) is False:
+
+            key = self.current_key
+            if key is None:
+                continue
+
+            frame = sys._current_frames().get(self.main_thread_id)
+
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                # keep the parent directory to distinguish the different handler.py files
+                file_name = os.sep.join(code.co_filename.split(os.sep)[-2:])
+                stack.append(f"{code.co_name} ({file_name}:{code.co_firstlineno})")
+                frame = frame.f_back
+
+            stack = ";".join(reversed(stack))
+
+            with self.lock:
+                key_stacks = self.stacks.setdefault(key, dict())
+                key_stacks[stack] = key_stacks.get(stack, 0) + 1
+
+    def write_file(self, key: str, suffix: str, write_function):
+
+        # write to a temporary file first to never leave a partially written profile
+        file_name = os.path.join(self.directory, re.sub(r"[^\w.-]+", "_", key) + suffix)
+        try:
+            write_function(f"{file_name}.tmp")
+            os.replace(f"{file_name}.tmp", file_name)
+        except OSError as e:
+            log.error(f"Unable to write profile '{file_name}': {e}")
+
+    def dump(self):
+        """
+        write all profiles collected since the start to the profile directory
+        """
+
+        self.last_dump = time.monotonic()
+
+        for key, profile in self.profiles.items():
+            self.write_file(key, ".pstats", profile.dump_stats)
+
+        with self.lock:
+            stacks = {key: dict(key_stacks) for key, key_stacks in self.stacks.items()}
+
+        for key, key_stacks in stacks.items():
+
+            def write_stacks(file_name):
+                with open(file_name, "w") as f:
+                    for stack, count in sorted(key_stacks.items()):
+                        f.write(f"{stack} {count}\n")
+
+            self.write_file(key, ".folded", write_stacks)
+
+        log.debug(f"Wrote {len(self.profiles) + len(stacks)} profiles to '{self.directory}'")
+
+
+profiler = Profiler()
+
+
+def get_profiler() -> Profiler:
+    """
+    common function to retrieve the profiler in project files
+
+    Returns
+    -------
+    Profiler: the profiler shared by all handlers
+    """
+
+    return profiler
+
+# EOF
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import configparser
+
+from fritzinfluxdb.log import get_logger
+from fritzinfluxdb.classes.common import ConfigBase
+
+log = get_logger()
+
+
+class PrometheusConfig(ConfigBase):
+    """
+        class which defines the Prometheus endpoint config options
+    """
+
+    enabled = {
+        "type": bool,
+        "default": False
+    }
+    listen_address = {
+        "type": str,
+        "alt": "listen",
+        "default": "0.0.0.0"
+    }
+    port = {
+        "type": int,
+        "default": 9864
+    }
+    stalled_after = {
+        "type": int,
+        "default": 300
+    }
+
+    config_section_name = "prometheus"
+
+    def parse_config(self, config_data: configparser.ConfigParser):
+
+        super().parse_config(config_data)
+
+        if not 0 < self.port < 65536:
+            log.error(f"Invalid Prometheus endpoint port '{self.port}'")
+            self.parser_error = True
+
+        if self.stalled_after < 1:
+            log.error("Prometheus endpoint option 'stalled_after' must be at least 1 second")
+            self.parser_error = True
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import json
+import math
+import time
+
+from fritzinfluxdb.classes.prometheus.config import PrometheusConfig
+from fritzinfluxdb.classes.metrics import get_metrics, InternalMetrics
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+metrics = get_metrics()
+
+
+def format_value(value) -> str:
+
+    if isinstance(value, bool):
+        return "1" if value is True else "0"
+
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+
+    return f"{value}"
+
+
+def format_labels(labels) -> str:
+
+    if len(labels) == 0:
+        return ""
+
+    escaped_labels = list()
+    for key, value in labels:
+        value = f"{value}".replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped_labels.append(f'{key}="{value}"')
+
+    return "{" + ",".join(escaped_labels) + "}"
+
+
+def format_metrics(registry: InternalMetrics, prefix: str = "") -> str:
+    """
+    format all metrics of a registry in the Prometheus text exposition format
+
+    Parameters
+    ----------
+    registry: InternalMetrics
+        the metrics registry to format
+    prefix: str
+        prefix to add to every metric name
+
+    Returns
+    -------
+    str: the formatted metrics
+    """
+
+    lines = list()
+
+    for metric_type, values in [("counter", registry.counters), ("gauge", registry.gauges)]:
+        current_name = None
+        for (name, labels), value in sorted(values.items()):
+            if name != current_name:
+                lines.append(f"# TYPE {prefix}{name} {metric_type}")
+                current_name = name
+            lines.append(f"{prefix}{name}{format_labels(labels)} {format_value(value)}")
+
+    current_name = None
+    for (name, labels), histogram in sorted(registry.histograms.items(), key=lambda x: x[0]):
+        if name != current_name:
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            current_name = name
+
+        for upper_bound, count in histogram.cumulative_counts():
+            bucket_labels = labels + (("le", format_value(float(upper_bound))),)
+            lines.append(f"{prefix}{name}_bucket{format_labels(bucket_labels)} {count}")
+
+        lines.append(f"{prefix}{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+        lines.append(f"{prefix}{name}_count{format_labels(labels)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusHandler:
+    """
+        HTTP endpoint on the asyncio event loop which exposes the internal metrics in the Prometheus
+        text format (/metrics) and the health state of the collector (/health).
+    """
+
+    name = "Prometheus endpoint"
+
+    config = None
+
+    # prefix of all exposed metric names
+    metric_prefix = "fritzinfluxdb_"
+
+    # seconds a client has to send its request
+    request_timeout = 5
+
+    # max number of request header lines accepted
+    max_header_lines = 100
+
+    # keep track if this instance was initiated successfully
+    init_successful = False
+
+    def __init__(self, config, log_queue: asyncio.Queue = None):
+
+        self.config = PrometheusConfig(config)
+        self.log_queue = log_queue
+        self.queue = None
+        self.server = None
+        self.start_time = time.time()
+
+        # the server is started within the running event loop, see task_loop
+        self.init_successful = True
+
+    def close(self):
+
+        if self.server is not None:
+            self.server.close()
+            log.info(f"Closed {self.name}")
+
+    def update_gauges(self):
+        """
+        update gauges which are only determined when metrics are requested
+        """
+
+        metrics.set_gauge("start_time_seconds", self.start_time)
+
+        if self.queue is not None:
+            metrics.set_gauge("queue_size", self.queue.qsize(), queue="measurements")
+        if self.log_queue is not None:
+            metrics.set_gauge("queue_size", self.log_queue.qsize(), queue="log")
+
+    def get_health(self):
+        """
+        returns the health state. The collector is stalled if no service returned data for 'stalled_after' seconds.
+
+        Returns
+        -------
+        tuple: True if healthy, dict with details
+        """
+
+        now = time.time()
+
+        last_success = [value for (name, _), value in metrics.gauges.items()
+                        if name == "last_success_timestamp_seconds"]
+
+        seconds_since_last_success = None
+        if len(last_success) > 0:
+            seconds_since_last_success = now - max(last_success)
+            stalled = seconds_since_last_success > self.config.stalled_after
+        else:
+            stalled = now - self.start_time > self.config.stalled_after
+
+        influx_connection_lost = bool(metrics.gauges.get(metrics.key("influx_connection_lost", dict()), 0))
+
+        details = {
+            "stalled": stalled,
+            "seconds_since_last_success": round(seconds_since_last_success, 3)
+            if seconds_since_last_success is not None else None,
+            "influx_connection_lost": influx_connection_lost,
+            "uptime_seconds": round(now - self.start_time, 3)
+        }
+
+        return stalled is False and influx_connection_lost is False, details
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=self.request_timeout)
+
+            # skip the request headers
+            for _ in range(self.max_header_lines):
+                header_line = await asyncio.wait_for(reader.readline(), timeout=self.request_timeout)
+                if header_line in [b"\r\n", b"\n", b""]:
+                    break
+
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            path = path.split("?")[0]
+
+            if method not in ["GET", "HEAD"]:
+                status, content_type, body = "405 Method Not Allowed", "text/plain", "method not allowed\n"
+            elif path == "/metrics":
+                self.update_gauges()
+                status, content_type = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+                body = format_metrics(metrics, self.metric_prefix)
+            elif path == "/health":
+                healthy, details = self.get_health()
+                status = "200 OK" if healthy is True else "503 Service Unavailable"
+                content_type, body = "application/json", json.dumps(details) + "\n"
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+
+            body = body.encode("utf-8")
+            headers = f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n" \
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+
+            writer.write(headers.encode("latin-1"))
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+
+        except (asyncio.TimeoutError, ValueError, ConnectionError) as e:
+            log.debug(f"{self.name} request failed: {e}")
+
+        finally:
+            writer.close()
+
+    async def task_loop(self, queue):
+        """
+        run the HTTP server until the task gets cancelled
+
+        Parameters
+        ----------
+        queue: asyncio.Queue
+            the result queue, only used to report its size
+        """
+
+        self.queue = queue
+
+        try:
+            self.server = await asyncio.start_server(self.handle_connection, self.config.listen_address,
+                                                     self.config.port)
+        except OSError as e:
+            log.error(f"Unable to start {self.name} on {self.config.listen_address}:{self.config.port}: {e}")
+            return
+
+        log.info(f"{self.name} listening on {self.config.listen_address}:{self.config.port}")
+
+        async with self.server:
+            await self.server.serve_forever()
+
+# EOF
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+import zlib
+from typing import Any, List, Optional
+
+
+class Scheduler:
+    """
+        heap based scheduler which keeps track of the deadlines of all scheduled items.
+        Instead of polling in a fixed interval, tasks can sleep exactly until the next item is due.
+
+        Items can be rescheduled at any time, outdated heap entries are discarded once they are popped.
+    """
+
+    # max jitter added to each interval as fraction of the interval
+    max_jitter_ratio = 0.05
+
+    # max jitter in seconds, regardless of the interval
+    max_jitter = 2.0
+
+    # max time in seconds to sleep if no item is scheduled
+    max_sleep = 60
+
+    def __init__(self, name: str = None):
+
+        self.name = name
+        self._heap = list()
+        self._deadlines = dict()
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def clear(self) -> None:
+
+        self._heap = list()
+        self._deadlines = dict()
+
+    def schedule(self, item: Any, deadline: float) -> None:
+        """
+        schedule an item at the given deadline. An already scheduled item will be moved to the new deadline.
+
+        Parameters
+        ----------
+        item: object
+            a hashable object to schedule
+        deadline: float
+            unix timestamp of the time the item is due
+        """
+
+        self._deadlines[item] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), item))
+
+    def unschedule(self, item: Any) -> None:
+
+        self._deadlines.pop(item, None)
+
+    def deadline_of(self, item: Any) -> Optional[float]:
+
+        return self._deadlines.get(item)
+
+    def _discard_outdated_entries(self) -> None:
+
+        while len(self._heap) > 0:
+            deadline, _, item = self._heap[0]
+            if self._deadlines.get(item) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> Optional[float]:
+        """
+        returns the deadline of the next due item or None if nothing is scheduled
+        """
+
+        self._discard_outdated_entries()
+
+        if len(self._heap) == 0:
+            return None
+
+        return self._heap[0][0]
+
+    def pop_due(self, now: float = None) -> List[Any]:
+        """
+        remove all items which are due and return them ordered by their deadline
+
+        Parameters
+        ----------
+        now: float
+            unix timestamp to compare deadlines against, defaults to current time
+
+        Returns
+        -------
+        list: due items
+        """
+
+        if now is None:
+            now = time.time()
+
+        due_items = list()
+        while True:
+            next_deadline = self.next_deadline()
+            if next_deadline is None or next_deadline > now:
+                break
+
+            _, _, item = heapq.heappop(self._heap)
+            del self._deadlines[item]
+            due_items.append(item)
+
+        return due_items
+
+    async def sleep_until_next_deadline(self, max_sleep: float = None) -> None:
+        """
+        sleep until the next item is due
+
+        Parameters
+        ----------
+        max_sleep: float
+            max number of seconds to sleep
+        """
+
+        if max_sleep is None:
+            max_sleep = self.max_sleep
+
+        next_deadline = self.next_deadline()
+
+        if next_deadline is None:
+            sleep_time = max_sleep
+        else:
+            sleep_time = min(max(next_deadline - time.time(), 0), max_sleep)
+
+        await asyncio.sleep(sleep_time)
+
+    @classmethod
+    def jitter(cls, interval: float) -> float:
+        """
+        returns a random offset to add to an interval to avoid synchronized requests
+        """
+
+        max_jitter = min(interval * cls.max_jitter_ratio, cls.max_jitter)
+
+        return random.uniform(-max_jitter, max_jitter)
+
+    @staticmethod
+    def aligned_deadline(interval: float, after: float) -> float:
+        """
+        returns the next wall clock multiple of interval after the given timestamp
+        """
+
+        # small tolerance to prevent returning the same deadline again due to float rounding
+        return (math.floor(after / interval + 1e-6) + 1) * interval
+
+    @staticmethod
+    def phase_offset(key: str, interval: float) -> float:
+        """
+        returns a stable offset between 0 and interval for the given key. Used to spread items
+        with the same interval evenly instead of running them all at the same time.
+        """
+
+        return zlib.crc32(f"{key}".encode("utf-8")) / 0xFFFFFFFF * interval
+
+# EOF
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from fritzinfluxdb.classes.metrics import get_metrics
+from fritzinfluxdb.log import get_logger
+
+log = get_logger()
+metrics = get_metrics()
+
+
+class EventLoopWatchdog:
+    """
+        measures the scheduling lag of the asyncio event loop. If the loop is blocked for longer than
+        'stall_threshold' a monitor thread takes a snapshot of the stack of the event loop thread.
+        The handler and service which blocked the loop and the stack are logged as soon as the loop resumes.
+    """
+
+    name = "Event loop watchdog"
+
+    # seconds between two heartbeats of the event loop
+    probe_interval = 0.25
+
+    # seconds the event loop has to be blocked to be reported as stall
+    stall_threshold = 1.0
+
+    # max number of stack frames to log for a stall
+    max_stack_frames = 25
+
+    def __init__(self):
+
+        self.current_handler = None
+        self.current_service = None
+        self.last_heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.monitor = None
+        self.stop_event = threading.Event()
+        self.stall_snapshot = None
+
+    @contextmanager
+    def activity(self, handler: str, service: str):
+        """
+        mark the enclosed block as executed by handler and service to name them in case of a stall
+        """
+
+        previous_activity = self.current_handler, self.current_service
+        self.current_handler, self.current_service = handler, service
+
+        try:
+            yield
+        finally:
+            self.current_handler, self.current_service = previous_activity
+
+    def monitor_loop(self):
+        """
+        runs in a separate thread as it needs to take the snapshot while the event loop is blocked.
+        The snapshot is logged by the task_loop as the log handlers are not thread safe.
+        """
+
+        while self.stop_event.wait(self.probe_interval) is False:
+
+            blocked = time.monotonic() - self.last_heartbeat - self.probe_interval
+            if blocked < self.stall_threshold or self.stall_snapshot is not None:
+                continue
+
+            stack = list()
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                stack = traceback.format_stack(frame)[-self.max_stack_frames:]
+
+            self.stall_snapshot = self.current_handler, self.current_service, stack
+
+    def stop(self):
+
+        if self.monitor is not None:
+            self.stop_event.set()
+            self.monitor.join()
+            self.monitor = None
+
+    def report_stall(self, lag: float, snapshot: tuple):
+
+        handler, service, stack = snapshot or (None, None, list())
+
+        metrics.increment("event_loop_stalls_total", handler=handler or "unknown", service=service or "unknown")
+
+        if handler is None:
+            message = f"Event loop was blocked for {lag:.3f}s"
+        else:
+            message = f"Event loop was blocked for {lag:.3f}s by {handler} service '{service}'"
+
+        if len(stack) > 0:
+            message += ". Stack snapshot:\n" + "".join(stack).rstrip("\n")
+
+        log.warning(message)
+
+    async def task_loop(self):
+
+        self.loop_thread_id = threading.get_ident()
+        self.last_heartbeat = time.monotonic()
+
+        self.monitor = threading.Thread(target=self.monitor_loop, name="event loop watchdog", daemon=True)
+        self.monitor.start()
+
+        while True:
+
+            await asyncio.sleep(self.probe_interval)
+
+            # the event loop lag is the time a task has to wait longer than requested
+            now = time.monotonic()
+            lag = max(now - self.last_heartbeat - self.probe_interval, 0)
+            self.last_heartbeat = now
+
+            metrics.observe("event_loop_lag_seconds", lag)
+
+            snapshot, self.stall_snapshot = self.stall_snapshot, None
+
+            if lag >= self.stall_threshold:
+                self.report_stall(lag, snapshot)
+
+
+watchdog = EventLoopWatchdog()
+
+
+def get_watchdog() -> EventLoopWatchdog:
+    """
+    common function to retrieve the event loop watchdog in project files
+
+    Returns
+    -------
+    EventLoopWatchdog: the watchdog shared by all handlers
+    """
+
+    return watchdog
+
+# EOF
@@ -52,6 +52,14 @@ def parse_command_line(version=None, self_description=None, version_date=None, u
                         help="turn on verbose output to get debug logging. "
                              "Defining '-vv' will also print out all http calls")
 
+    parser.add_argument("-p", "--profile", metavar="DIRECTORY",
+                        help="profile service queries (incl. value extraction) and InfluxDB writes and "
+                             "periodically write one profile per service to this directory")
+
+    parser.add_argument("--profile-mode", choices=["sampling", "deterministic"], default="sampling",
+                        help="'sampling' writes flame graph compatible folded stacks (*.folded) with low "
+                             "overhead, 'deterministic' writes cProfile statistics (*.pstats)")
+
     args = parser.parse_args()
 
     # fix supplied config file path
@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    local stand-in servers to run fritzinfluxdb without a FritzBox or InfluxDB.
+    Used for load and regression testing of the collectors and the writer.
+"""
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import logging
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("fritzinfluxdb.simulator")
+
+
+class FaultInjection:
+    """
+        adds latency and errors to the responses of a simulator
+    """
+
+    def __init__(self, latency: int = 0, latency_jitter: int = 0, error_rate: float = 0.0, drop_rate: float = 0.0,
+                 seed: int = None):
+        """
+        Parameters
+        ----------
+        latency: int
+            min latency in milliseconds added to each request
+        latency_jitter: int
+            max random latency in milliseconds added on top of latency
+        error_rate: float
+            probability (0.0 - 1.0) of a request to fail
+        drop_rate: float
+            probability (0.0 - 1.0) of a connection to be dropped without sending a response
+        seed: int
+            seed for the random generator to get reproducible runs
+        """
+
+        self.latency = max(latency, 0) / 1000
+        self.latency_jitter = max(latency_jitter, 0) / 1000
+        self.error_rate = min(max(error_rate, 0.0), 1.0)
+        self.drop_rate = min(max(drop_rate, 0.0), 1.0)
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> None:
+        """
+        block the current request for the configured latency
+        """
+
+        with self._lock:
+            sleep_time = self.latency + self._random.uniform(0, self.latency_jitter)
+
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+
+    def should_fail(self) -> bool:
+        """
+        returns True if the current request should be answered with an error
+        """
+
+        if self.error_rate <= 0:
+            return False
+
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def should_drop(self) -> bool:
+        """
+        returns True if the connection of the current request should be dropped
+        """
+
+        if self.drop_rate <= 0:
+            return False
+
+        with self._lock:
+            return self._random.random() < self.drop_rate
+
+
+class SimulatorStats:
+    """
+        thread safe counters of all requests a simulator answered
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.dropped = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.paths = Counter()
+
+    def add_connection(self) -> None:
+
+        with self._lock:
+            self.connections += 1
+
+    def add_request(self, path: str, bytes_received: int, bytes_sent: int, error: bool = False) -> None:
+
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += bytes_received
+            self.bytes_sent += bytes_sent
+            self.paths[path] += 1
+            if error is True:
+                self.errors += 1
+
+    def add_dropped_request(self, path: str, bytes_received: int) -> None:
+
+        with self._lock:
+            self.dropped += 1
+            self.bytes_received += bytes_received
+            self.paths[path] += 1
+
+    def as_dict(self) -> dict:
+
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "requests": self.requests,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "paths": dict(self.paths)
+            }
+
+
+class SimulatorHTTPServer(ThreadingHTTPServer):
+    """
+        threading HTTP server which keeps a reference to the simulator it belongs to
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, request_handler_class, simulator):
+
+        self.simulator = simulator
+
+        super().__init__(server_address, request_handler_class)
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    """
+        base request handler for all simulators. Supports HTTP keep-alive like the real servers.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    # headers and body are written separately, avoid delayed ACKs adding latency to each response
+    disable_nagle_algorithm = True
+
+    request_body = b""
+
+    def setup(self):
+
+        super().setup()
+        self.server.simulator.stats.add_connection()
+
+    @property
+    def simulator(self):
+        return self.server.simulator
+
+    def read_body(self) -> bytes:
+
+        length = int(self.headers.get("Content-Length") or 0)
+
+        self.request_body = self.rfile.read(length) if length > 0 else b""
+
+        return self.request_body
+
+    def send_content(self, status: int, body, content_type: str = "text/plain", headers: dict = None) -> None:
+        """
+        send a complete response including Content-Length to keep the connection reusable
+
+        Parameters
+        ----------
+        status: int
+            http status code
+        body: str, bytes
+            response body
+        content_type: str
+            content type of the response
+        headers: dict
+            additional response headers
+        """
+
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", f"{len(body)}")
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+        self.simulator.stats.add_request(self.path.split("?")[0], len(self.request_body), len(body),
+                                         error=status >= 500)
+
+    def drop_connection(self) -> None:
+        """
+        close the connection without sending a response
+        """
+
+        self.close_connection = True
+
+        # noinspection PyBroadException
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass
+
+        self.simulator.stats.add_dropped_request(self.path.split("?")[0], len(self.request_body))
+
+    def log_message(self, format_string, *args):
+        log.debug(f"{self.address_string()} - {format_string % args}")
+
+
+def run_simulator(simulator) -> None:
+    """
+    run a simulator in the foreground until it gets interrupted
+
+    Parameters
+    ----------
+    simulator: object
+        simulator instance providing start(), stop() and stats
+    """
+
+    simulator.start()
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        log.info(f"Simulator stats: {simulator.stats.as_dict()}")
+
+# EOF
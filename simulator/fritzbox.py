@@ -0,0 +1,1373 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    Local FritzBox stand-in which speaks the TR-064 (SOAP) and Lua endpoints used by fritzinfluxdb.
+
+    The size of the returned data (hosts, home automation devices, log lines, calls) can be scaled
+    to load test the collectors. Latency and errors can be injected into every response.
+
+    fritzinfluxdb expects the Lua interface (and jason_boxinfo.xml) on port 80 (443 with TLS) and
+    TR-064 on the configured FritzBox port. The simulator serves all endpoints on both ports.
+
+    usage: python3 -m simulator.fritzbox --hosts 500 --devices 50 --latency 100
+"""
+
+import hashlib
+import ipaddress
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from xml.sax.saxutils import escape
+from xml.etree.ElementTree import fromstring
+
+from simulator.common import (
+    FaultInjection,
+    SimulatorHTTPServer,
+    SimulatorRequestHandler,
+    SimulatorStats,
+    run_simulator
+)
+
+log = logging.getLogger("fritzinfluxdb.simulator")
+
+# fixture sizes can be scaled within these limits
+min_fixture_size = 1
+max_fixture_size = 5000
+
+invalid_sid = "0000000000000000"
+
+# Lua paths which return data
+data_paths = ["/data.lua", "/webservices/homeautoswitch.lua", "/fon_num/foncalls_list.lua"]
+
+login_page = "<!DOCTYPE html><html><head><title>FRITZ!Box</title></head><body>Login</body></html>"
+
+
+class FritzBoxSimulatorData:
+    """
+        generates all data returned by the simulated FritzBox. Counters and logs evolve with the time
+        the simulator is running, everything else is generated once from the given seed.
+    """
+
+    # seconds between two generated log entries
+    log_entry_spacing = 60
+
+    # seconds between two generated phone calls
+    call_spacing = 1800
+
+    # number of samples in each Lua statistics series
+    series_length = 20
+
+    def __init__(self, hosts: int = 20, devices: int = 10, log_lines: int = 50, calls: int = 20,
+                 fw_version: str = "7.57", link_type: str = "DSL", seed: int = None):
+
+        self.num_hosts = hosts
+        self.num_devices = devices
+        self.num_log_lines = log_lines
+        self.num_calls = calls
+        self.fw_version = fw_version
+        self.link_type = link_type
+
+        self.start_time = time.time()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        major, minor = fw_version.split(".")
+        self.system_version = {
+            "HW": "226",
+            "Major": "154",
+            "Minor": f"{int(major)}",
+            "Patch": f"{int(minor):02d}",
+            "Buildnumber": "106391",
+            "Display": f"154.{int(major):02d}.{int(minor):02d}"
+        }
+        self.software_version = self.system_version.get("Display")
+
+        if link_type == "Cable":
+            self.model = "FRITZ!Box 6690 Cable"
+        else:
+            self.model = "FRITZ!Box 7590"
+
+        self.serial_number = "".join(self._random.choice("0123456789ABCDEF") for _ in range(12))
+
+        self.hosts = [self._generate_host(index) for index in range(hosts)]
+        self.devices = self._generate_devices(devices)
+
+    @property
+    def os_version(self):
+        return tuple(map(int, self.fw_version.split(".")))
+
+    @property
+    def uptime(self) -> int:
+        return int(time.time() - self.start_time) + 86400
+
+    def random_int(self, low: int, high: int) -> int:
+
+        with self._lock:
+            return self._random.randint(low, high)
+
+    def counter(self, base: int, rate: int) -> int:
+        """
+        returns a counter which grows by rate per second since the simulator was started
+        """
+        return base + int((time.time() - self.start_time) * rate)
+
+    def _generate_host(self, index: int) -> dict:
+
+        mac = ":".join(f"{x:02X}" for x in [0x02, 0x00, (index >> 16) & 0xff, (index >> 8) & 0xff, index & 0xff, 0x01])
+        is_wlan = index % 3 != 0
+
+        host = {
+            "UID": f"landevice{1000 + index}",
+            "name": f"host-{index:04d}",
+            "mac": mac,
+            "type": "wlan" if is_wlan else "lan",
+            "active": index % 10 < 7,
+            "parent": {"name": self.model},
+            "port": "WLAN" if is_wlan else f"LAN {index % 4 + 1}",
+            "ipv4": {
+                "ip": f"{ipaddress.IPv4Network('10.0.0.0/16')[index + 2]}",
+                "lastused": int(self.start_time) - index
+            },
+            "properties": list()
+        }
+
+        if is_wlan:
+            frequency = "5" if index % 2 == 0 else "2,4"
+            host["properties"].append({"txt": f"{frequency} GHz, {866 - index % 400} / {866 - index % 300} Mbit/s"})
+        else:
+            host["properties"].append({"txt": "1 Gbit/s"})
+
+        if index % 50 == 1:
+            host["properties"].append({"txt": "Mesh"})
+
+        return host
+
+    def _generate_devices(self, num_devices: int) -> list:
+        """
+        generates home automation devices cycling through a set of common device types
+        """
+
+        device_types = ["switch", "thermostat", "hanfun", "light"]
+
+        devices = list()
+        for index in range(num_devices):
+            devices.append({
+                "type": device_types[index % len(device_types)],
+                "id": 16 + index,
+                "identifier": f"{11657 + index % 7} {index:07d}",
+                "name": f"device-{index:04d}",
+                "energy_base": self._random.randint(1000, 500000),
+                "power": self._random.randint(1000, 250000)
+            })
+
+        return devices
+
+    # TR-064 action values
+    def tr064_action_values(self, service_name: str, action_name: str) -> dict:
+        """
+        returns the out arguments of the given TR-064 action or None if the action is unknown
+        """
+
+        action = tr064_services.get(service_name, dict()).get("actions", dict()).get(action_name)
+
+        if action is None:
+            return None
+
+        return action(self)
+
+    def online_monitor_series(self, base: int) -> str:
+
+        return ",".join(f"{max(base + self.random_int(-base // 2, base // 2), 0)}" for _ in range(self.series_length))
+
+    # Lua pages
+    def lua_net_dev(self, xhr_id: str) -> dict:
+
+        active = [x for x in self.hosts if x.get("active") is True]
+        passive = [x for x in self.hosts if x.get("active") is False]
+
+        if xhr_id == "cleanup":
+            return {"data": {"passive": passive}}
+
+        return {"data": {"active": active, "passive": passive}}
+
+    def lua_eco_stat(self) -> dict:
+
+        def series(low, high):
+            return [self.random_int(low, high) for _ in range(self.series_length)]
+
+        return {
+            "data": {
+                "cputemp": {"series": [series(55, 75)]},
+                "cpuutil": {"series": [series(5, 40)]},
+                "ramusage": {"series": [series(30, 35), series(10, 30), series(35, 60)]}
+            }
+        }
+
+    def lua_energy(self) -> dict:
+
+        return {
+            "data": {
+                "drain": [
+                    {"name": "Gesamtsystem", "actPerc": self.random_int(30, 60)},
+                    {"name": "Hauptprozessor", "actPerc": self.random_int(10, 90)},
+                    {"name": "WLAN", "actPerc": self.random_int(20, 100)},
+                    {"name": self.link_type, "actPerc": 100},
+                    {"name": "Telefonie", "actPerc": self.random_int(0, 10)},
+                    {"name": "USB", "actPerc": 0},
+                    {"name": "LAN", "actPerc": self.random_int(10, 50), "lan": [
+                        {"name": f"LAN {x}", "class": "connected" if x % 2 else ""} for x in range(1, 5)
+                    ]}
+                ]
+            }
+        }
+
+    def lua_log(self, log_filter: str) -> dict:
+        """
+        returns log entries. A new entry appears every 'log_entry_spacing' seconds.
+        The format depends on the simulated FritzOS version.
+        """
+
+        log_groups = {
+            "1": "sys", "2": "net", "3": "fon", "4": "wlan", "5": "usb"
+        }
+        group = log_groups.get(log_filter, log_filter)
+
+        newest_entry = int(time.time() // self.log_entry_spacing)
+
+        entries = list()
+        for entry_number in range(newest_entry, newest_entry - self.num_log_lines, -1):
+            date_time = datetime.fromtimestamp(entry_number * self.log_entry_spacing)
+            message = f"{group} event {entry_number}: simulated log message"
+
+            if self.os_version >= (7, 39):
+                entries.append({
+                    "date": date_time.strftime("%d.%m.%y"),
+                    "time": date_time.strftime("%H:%M:%S"),
+                    "msg": message,
+                    "id": entry_number % 1000,
+                    "group": group,
+                    "noHelp": True
+                })
+            else:
+                entries.append([date_time.strftime("%d.%m.%y"), date_time.strftime("%H:%M:%S"),
+                                message, f"{entry_number % 1000}", log_filter, ""])
+
+        return {"data": {"log": entries}}
+
+    def lua_dsl_overview(self) -> dict:
+
+        return {
+            "data": {
+                "connectionData": {
+                    "lineLength": 420,
+                    "dslamId": "BDCM",
+                    "version": "B2pvfbH045k.d26w",
+                    "line": [{"mode": "VDSL2"}]
+                }
+            }
+        }
+
+    def cable_channels(self, direction: str) -> dict:
+
+        channels = {"docsis30": list(), "docsis31": list()}
+
+        num_channels = {"ds": (32, 2), "us": (4, 1)}.get(direction)
+
+        for channel_id in range(1, num_channels[0] + 1):
+            channels["docsis30"].append({
+                "channelID": channel_id,
+                "powerLevel": f"{self.random_int(30, 60) / 10}",
+                "modulation": "256QAM" if direction == "ds" else "64QAM",
+                "corrErrors": self.counter(channel_id * 10, 1),
+                "nonCorrErrors": self.counter(channel_id, 0),
+                "mse": "-36.6",
+                "latency": 0.32,
+                "frequency": f"{114 + channel_id * 8}",
+                "multiplex": "ATDMA"
+            })
+
+        for channel_id in range(num_channels[0] + 1, num_channels[0] + num_channels[1] + 1):
+            channels["docsis31"].append({
+                "channelID": channel_id,
+                "powerLevel": f"{self.random_int(30, 60) / 10}",
+                "modulation": "4096QAM" if direction == "ds" else "1024QAM",
+                "nonCorrErrors": self.counter(channel_id, 0),
+                "plc": "770",
+                "mer": "42",
+                "fft": "4K",
+                "activesub": "1880",
+                "frequency": f"{750 + channel_id}",
+                "multiplex": ""
+            })
+
+        # FritzOS versions before 7.58 use different keys for the channel number and modulation
+        if self.os_version < (7, 58):
+            for channel in channels["docsis30"] + channels["docsis31"]:
+                channel["channel"] = channel.get("channelID")
+                channel["type"] = channel.pop("modulation")
+
+        return channels
+
+    def lua_doc_overview(self) -> dict:
+
+        def frequencies(direction):
+            return {key: [x.get("frequency") for x in value] for key, value in self.cable_channels(direction).items()}
+
+        return {
+            "data": {
+                "connectionData": {
+                    "externApValue": "CASA",
+                    "version": "3.1",
+                    "line": [{"mode": "DOCSIS 3.1"}],
+                    "dsFreqs": {"values": frequencies("ds")},
+                    "usFreqs": {"values": frequencies("us")}
+                }
+            }
+        }
+
+    def lua_doc_info(self) -> dict:
+
+        return {"data": {"channelDs": self.cable_channels("ds"), "channelUs": self.cable_channels("us")}}
+
+    def lua_share_vpn(self) -> dict:
+
+        user_connections = dict()
+        for index in range(3):
+            user_connections[f"user{index}"] = {
+                "name": f"vpn-user-{index}",
+                "connected": index == 0,
+                "active": True,
+                "virtualAddress": f"192.168.178.{201 + index}",
+                "address": f"203.0.113.{10 + index}" if index == 0 else ""
+            }
+
+        vpn_info = {
+            "server": "simulator.myfritz.net",
+            "type": "IPSec Xauth PSK",
+            "userConnections": user_connections
+        }
+
+        if self.os_version >= (7, 39):
+            return {"data": {"init": vpn_info}}
+
+        return {"data": {"vpnInfo": vpn_info}}
+
+    def lua_share_wireguard(self) -> dict:
+
+        box_connections = dict()
+        for index in range(2):
+            box_connections[f"conn{index}"] = {
+                "name": f"wireguard-{index}",
+                "connected": index == 0,
+                "active": True,
+                "remoteNet": f"10.{100 + index}.0.0/24",
+                "remoteIp": f"198.51.100.{10 + index}"
+            }
+
+        return {"data": {"init": {"boxConnections": box_connections}}}
+
+    def home_automation_device_xml(self, device: dict) -> str:
+
+        device_type = device.get("type")
+        device_id = device.get("id")
+        identifier = device.get("identifier")
+        present = "<present>1</present><txbusy>0</txbusy>"
+        name = f"<name>{escape(device.get('name'))}</name>"
+        temperature = f"<temperature><celsius>{self.random_int(180, 240)}</celsius><offset>0</offset></temperature>"
+
+        if device_type == "switch":
+            energy = self.counter(device.get("energy_base"), 1)
+            return (
+                f'<device identifier="{identifier}" id="{device_id}" functionbitmask="35712" '
+                f'fwversion="04.25" manufacturer="AVM" productname="FRITZ!DECT 200">{present}{name}'
+                f'<switch><state>1</state><mode>manuell</mode><lock>0</lock><devicelock>0</devicelock></switch>'
+                f'<simpleonoff><state>1</state></simpleonoff>'
+                f'<powermeter><voltage>{self.random_int(225000, 234000)}</voltage>'
+                f'<power>{device.get("power") + self.random_int(-1000, 1000)}</power>'
+                f'<energy>{energy}</energy></powermeter>{temperature}</device>'
+            )
+
+        if device_type == "thermostat":
+            return (
+                f'<device identifier="{identifier}" id="{device_id}" functionbitmask="320" '
+                f'fwversion="05.08" manufacturer="AVM" productname="FRITZ!DECT 301">{present}{name}'
+                f'<battery>{self.random_int(40, 100)}</battery><batterylow>0</batterylow>{temperature}'
+                f'<hkr><tist>{self.random_int(36, 48)}</tist><tsoll>42</tsoll><absenk>34</absenk><komfort>42</komfort>'
+                f'<lock>0</lock><devicelock>0</devicelock><errorcode>0</errorcode><windowopenactiv>0</windowopenactiv>'
+                f'<windowopenactiveendtime>0</windowopenactiveendtime><boostactive>0</boostactive>'
+                f'<boostactiveendtime>0</boostactiveendtime><batterylow>0</batterylow><battery>80</battery>'
+                f'<nextchange><endperiod>{int(time.time()) + 3600}</endperiod><tchange>34</tchange></nextchange>'
+                f'<summeractive>0</summeractive><holidayactive>0</holidayactive></hkr></device>'
+            )
+
+        if device_type == "hanfun":
+            alert_state = int(time.time() / 600 + device_id) % 2
+            return (
+                f'<device identifier="{identifier}" id="{device_id}" functionbitmask="1" fwversion="31.35" '
+                f'manufacturer="0x0feb" productname="HAN-FUN">{present}{name}</device>'
+                f'<device identifier="{identifier}-1" id="{device_id + 2000}" functionbitmask="8208" '
+                f'fwversion="0.0" manufacturer="0x0feb" productname="HAN-FUN">{present}{name}'
+                f'<etsiunitinfo><etsideviceid>{device_id}</etsideviceid><unittype>514</unittype>'
+                f'<interfaces>256</interfaces></etsiunitinfo>'
+                f'<alert><state>{alert_state}</state><lastalertchgtimestamp>{int(self.start_time)}'
+                f'</lastalertchgtimestamp></alert></device>'
+            )
+
+        return (
+            f'<device identifier="{identifier}" id="{device_id}" functionbitmask="237572" '
+            f'fwversion="34.10.16.16.009" manufacturer="AVM" productname="FRITZ!DECT 500">{present}{name}'
+            f'<simpleonoff><state>1</state></simpleonoff>'
+            f'<levelcontrol><level>{self.random_int(0, 255)}</level>'
+            f'<levelpercentage>{self.random_int(0, 100)}</levelpercentage></levelcontrol>'
+            f'<colorcontrol supported_modes="5" current_mode="4"><hue>35</hue><saturation>214</saturation>'
+            f'<unmapped_hue>35</unmapped_hue><unmapped_saturation>214</unmapped_saturation>'
+            f'<temperature>2700</temperature></colorcontrol></device>'
+        )
+
+    def home_automation_device_value(self, command: str, identifier: str):
+        """
+        returns the value of a per device command or 'inval' if the device doesn't support the command
+        """
+
+        device = next((x for x in self.devices if x.get("identifier") == identifier), None)
+        device_type = device.get("type") if device is not None else None
+
+        if device_type == "switch" and command == "getswitchpower":
+            return f"{device.get('power') + self.random_int(-1000, 1000)}"
+        if device_type == "switch" and command == "getswitchenergy":
+            return f"{self.counter(device.get('energy_base'), 1)}"
+        if device_type == "switch" and command == "getswitchstate":
+            return "1"
+        if device_type in ["switch", "thermostat"] and command == "gettemperature":
+            return f"{self.random_int(180, 240)}"
+
+        return "inval"
+
+    def home_automation_device_list(self) -> str:
+
+        devices = "".join(self.home_automation_device_xml(x) for x in self.devices)
+
+        return f'<?xml version="1.0" encoding="UTF-8"?><devicelist version="1" fwversion="{self.fw_version}">' \
+               f'{devices}</devicelist>'
+
+    def call_list(self) -> str:
+        """
+        returns the call list as csv. A new call appears every 'call_spacing' seconds.
+        """
+
+        call_types = ["1", "2", "3", "4"]
+
+        lines = ["sep=;", "Typ;Datum;Name;Rufnummer;Nebenstelle;Eigene Rufnummer;Dauer"]
+
+        newest_call = int(time.time() // self.call_spacing)
+        for call_number in range(newest_call, newest_call - self.num_calls, -1):
+            date_time = datetime.fromtimestamp(call_number * self.call_spacing)
+            lines.append(";".join([
+                call_types[call_number % len(call_types)],
+                date_time.strftime("%d.%m.%y %H:%M"),
+                f"Caller {call_number % 97}",
+                f"0301234{call_number % 1000:03d}",
+                "Telefon",
+                "12345678",
+                f"{(call_number % 3)}:{call_number % 60:02d}"
+            ]))
+
+        return "\n".join(lines) + "\n"
+
+
+def action_device_info(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewManufacturerName": "AVM",
+        "NewModelName": data.model,
+        "NewDescription": f"{data.model} {data.software_version}",
+        "NewProductClass": "AVMFB",
+        "NewSerialNumber": data.serial_number,
+        "NewSoftwareVersion": data.software_version,
+        "NewHardwareVersion": data.model,
+        "NewSpecVersion": "1.0",
+        "NewProvisioningCode": "000.000.000.000",
+        "NewUpTime": data.uptime,
+        "NewDeviceLog": ""
+    }
+
+
+def action_common_link_properties(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewWANAccessType": data.link_type,
+        "NewLayer1UpstreamMaxBitRate": 46720000,
+        "NewLayer1DownstreamMaxBitRate": 116796000,
+        "NewPhysicalLinkStatus": "Up",
+        "NewX_AVM-DE_DownstreamCurrentUtilization": "",
+        "NewX_AVM-DE_UpstreamCurrentUtilization": "",
+        "NewX_AVM-DE_DownstreamCurrentMaxSpeed": 0,
+        "NewX_AVM-DE_UpstreamCurrentMaxSpeed": 0,
+        "NewX_AVM_DE_WANAccessType": "VDSL" if data.link_type == "DSL" else data.link_type
+    }
+
+
+def action_addon_infos(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewByteSendRate": data.random_int(1000, 500000),
+        "NewByteReceiveRate": data.random_int(1000, 5000000),
+        "NewPacketSendRate": data.random_int(10, 500),
+        "NewPacketReceiveRate": data.random_int(10, 5000),
+        "NewTotalBytesSent": data.counter(10 ** 9, 100000) % 2 ** 32,
+        "NewTotalBytesReceived": data.counter(10 ** 10, 1000000) % 2 ** 32,
+        "NewAutoDisconnectTime": 0,
+        "NewIdleDisconnectTime": 0,
+        "NewDNSServer1": "192.0.2.53",
+        "NewDNSServer2": "192.0.2.54",
+        "NewVoipDNSServer1": "192.0.2.53",
+        "NewVoipDNSServer2": "192.0.2.54",
+        "NewUpnpControlEnabled": False,
+        "NewRoutedBridgedModeBoth": 0,
+        "NewX_AVM_DE_TotalBytesSent64": f"{data.counter(10 ** 9, 100000)}",
+        "NewX_AVM_DE_TotalBytesReceived64": f"{data.counter(10 ** 10, 1000000)}",
+        "NewX_AVM_DE_WANAccessType": "VDSL" if data.link_type == "DSL" else data.link_type
+    }
+
+
+def action_online_monitor(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewTotalNumberSyncGroups": 1,
+        "NewSyncGroupName": "sync_dsl" if data.link_type == "DSL" else "sync_cable",
+        "NewSyncGroupMode": data.link_type.upper(),
+        "Newmax_ds": 14599500,
+        "Newmax_us": 5840000,
+        "Newds_current_bps": data.online_monitor_series(1000000),
+        "Newmc_current_bps": data.online_monitor_series(0),
+        "Newus_current_bps": data.online_monitor_series(100000),
+        "Newprio_realtime_bps": data.online_monitor_series(1000),
+        "Newprio_high_bps": data.online_monitor_series(10000),
+        "Newprio_default_bps": data.online_monitor_series(50000),
+        "Newprio_low_bps": data.online_monitor_series(1000)
+    }
+
+
+def action_dsl_info(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewEnable": True,
+        "NewStatus": "Up",
+        "NewDataPath": "Fast",
+        "NewUpstreamCurrRate": 46720,
+        "NewDownstreamCurrRate": 116796,
+        "NewUpstreamMaxRate": 48129,
+        "NewDownstreamMaxRate": 134914,
+        "NewUpstreamNoiseMargin": data.random_int(60, 100),
+        "NewDownstreamNoiseMargin": data.random_int(60, 100),
+        "NewUpstreamAttenuation": 80,
+        "NewDownstreamAttenuation": 140,
+        "NewATURVendor": "41564d00",
+        "NewATURCountry": "0400",
+        "NewUpstreamPower": 498,
+        "NewDownstreamPower": 513
+    }
+
+
+def action_dsl_statistics_total(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewReceiveBlocks": data.counter(10 ** 6, 100),
+        "NewTransmitBlocks": data.counter(10 ** 6, 100),
+        "NewCellDelin": 0,
+        "NewLinkRetrain": 1,
+        "NewInitErrors": 0,
+        "NewInitTimeouts": 0,
+        "NewLossOfFraming": 0,
+        "NewErroredSecs": data.counter(12, 0),
+        "NewSeverelyErroredSecs": data.counter(2, 0),
+        "NewFECErrors": data.counter(0, 1),
+        "NewATUCFECErrors": 0,
+        "NewHECErrors": 0,
+        "NewATUCHECErrors": 0,
+        "NewCRCErrors": data.counter(14, 0),
+        "NewATUCCRCErrors": 0
+    }
+
+
+def action_avm_dsl_info(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewSNRGds": 1,
+        "NewSNRGus": 1,
+        "NewSNRpsds": "",
+        "NewSNRpsus": "",
+        "NewSNRMTds": 0,
+        "NewSNRMTus": 0,
+        "NewLATNds": "14",
+        "NewLATNus": "8",
+        "NewFECErrors": data.counter(0, 1),
+        "NewCRCErrors": data.counter(14, 0)
+    }
+
+
+def action_user_interface(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewUpgradeAvailable": False,
+        "NewPasswordRequired": False,
+        "NewPasswordUserSelectable": True,
+        "NewWarrantyDate": "0001-01-01T00:00:00",
+        "NewX_AVM-DE_Version": "",
+        "NewX_AVM-DE_DownloadURL": "",
+        "NewX_AVM-DE_InfoURL": "",
+        "NewX_AVM-DE_UpdateState": "Stopped",
+        "NewX_AVM-DE_LaborVersion": ""
+    }
+
+
+def action_wan_connection(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewEnable": True,
+        "NewConnectionStatus": "Connected",
+        "NewPossibleConnectionTypes": "IP_Routed",
+        "NewConnectionType": "IP_Routed",
+        "NewName": "mstv",
+        "NewUptime": data.uptime,
+        "NewLastConnectionError": "ERROR_NONE",
+        "NewRSIPAvailable": False,
+        "NewNATEnabled": True,
+        "NewExternalIPAddress": "198.51.100.1",
+        "NewDNSServers": "192.0.2.53, 192.0.2.54",
+        "NewMACAddress": "02:00:00:00:00:01",
+        "NewConnectionTrigger": "AlwaysOn",
+        "NewLastAuthErrorInfo": "",
+        "NewPPPoEACName": "SIM-BRAS-01"
+    }
+
+
+def action_wan_ip_status_info(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewConnectionStatus": "Connected",
+        "NewLastConnectionError": "ERROR_NONE",
+        "NewUptime": data.uptime
+    }
+
+
+def action_external_ipv6_address(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewExternalIPv6Address": "2001:db8:0:1::1",
+        "NewPrefixLength": 64,
+        "NewValidLifetime": 86400,
+        "NewPreferedLifetime": 14400
+    }
+
+
+def action_ipv6_prefix(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewIPv6Prefix": "2001:db8:1::",
+        "NewPrefixLength": 56,
+        "NewValidLifetime": 86400,
+        "NewPreferedLifetime": 14400
+    }
+
+
+def action_lan_statistics(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewBytesSent": data.counter(10 ** 9, 2000000) % 2 ** 32,
+        "NewBytesReceived": data.counter(10 ** 9, 200000) % 2 ** 32,
+        "NewPacketsSent": data.counter(10 ** 6, 2000) % 2 ** 32,
+        "NewPacketsReceived": data.counter(10 ** 6, 200) % 2 ** 32
+    }
+
+
+def action_lan_host_config(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewDHCPServerConfigurable": True,
+        "NewDHCPRelay": False,
+        "NewMinAddress": "192.168.178.20",
+        "NewMaxAddress": "192.168.178.200",
+        "NewReservedAddresses": "192.168.178.1",
+        "NewDHCPServerEnable": True,
+        "NewDNSServers": "192.168.178.1",
+        "NewDomainName": "fritz.box",
+        "NewIPRouters": "192.168.178.1",
+        "NewSubnetMask": "255.255.255.0"
+    }
+
+
+def action_ddns_info(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewEnabled": False,
+        "NewProviderName": "",
+        "NewUpdateURL": "",
+        "NewDomain": "",
+        "NewStatusIPv4": "offline",
+        "NewStatusIPv6": "offline",
+        "NewUsername": "",
+        "NewMode": "ddns_v4",
+        "NewServerIPv4": "",
+        "NewServerIPv6": ""
+    }
+
+
+def action_user_list(data: FritzBoxSimulatorData) -> dict:
+
+    return {
+        "NewX_AVM-DE_UserList": '<List><Username last_user="1">fritzinfluxdb</Username></List>'
+    }
+
+
+def wlan_actions(wlan_index: int) -> dict:
+
+    frequencies = {1: ("n", 6), 2: ("ac", 36), 3: ("n", 11)}
+    standard, channel = frequencies.get(wlan_index)
+
+    def action_wlan_info(data: FritzBoxSimulatorData) -> dict:
+        return {
+            "NewEnable": True,
+            "NewStatus": "Up",
+            "NewMaxBitRate": "Auto",
+            "NewChannel": channel,
+            "NewSSID": f"simulator-wlan-{wlan_index}",
+            "NewBeaconType": "11i",
+            "NewMACAddressControlEnabled": False,
+            "NewStandard": standard,
+            "NewBSSID": f"02:00:00:00:01:0{wlan_index}",
+            "NewBasicEncryptionModes": "None",
+            "NewBasicAuthenticationMode": "None",
+            "NewMaxCharsSSID": 32,
+            "NewMinCharsSSID": 1,
+            "NewAllowedCharsSSID": "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+        }
+
+    def action_total_associations(data: FritzBoxSimulatorData) -> dict:
+        wlan_hosts = [x for x in data.hosts if x.get("active") is True and x.get("type") == "wlan"]
+        return {
+            "NewTotalAssociations": len(wlan_hosts[wlan_index - 1::3])
+        }
+
+    return {
+        "GetInfo": action_wlan_info,
+        "GetTotalAssociations": action_total_associations
+    }
+
+
+# TR-064 services served by the simulator. The service name is the last part of the serviceId,
+# 'description' defines in which description file the service is listed.
+tr064_services = {
+    "WANCommonIFC1": {
+        "description": "igddesc.xml",
+        "service_type": "urn:schemas-upnp-org:service:WANCommonInterfaceConfig:1",
+        "actions": {
+            "GetAddonInfos": action_addon_infos,
+            "GetCommonLinkProperties": action_common_link_properties
+        }
+    },
+    "WANIPConn1": {
+        "description": "igddesc.xml",
+        "service_type": "urn:schemas-upnp-org:service:WANIPConnection:1",
+        "actions": {
+            "GetStatusInfo": action_wan_ip_status_info,
+            "X_AVM_DE_GetExternalIPv6Address": action_external_ipv6_address,
+            "X_AVM_DE_GetIPv6Prefix": action_ipv6_prefix
+        }
+    },
+    "DeviceInfo1": {
+        "service_type": "urn:dslforum-org:service:DeviceInfo:1",
+        "actions": {
+            "GetInfo": action_device_info
+        }
+    },
+    "WANCommonInterfaceConfig1": {
+        "service_type": "urn:dslforum-org:service:WANCommonInterfaceConfig:1",
+        "actions": {
+            "GetCommonLinkProperties": action_common_link_properties,
+            "X_AVM-DE_GetOnlineMonitor": action_online_monitor
+        },
+        "in_arguments": {
+            "X_AVM-DE_GetOnlineMonitor": {"NewSyncGroupIndex": "ui4"}
+        }
+    },
+    "LANEthernetInterfaceConfig1": {
+        "service_type": "urn:dslforum-org:service:LANEthernetInterfaceConfig:1",
+        "actions": {
+            "GetStatistics": action_lan_statistics
+        }
+    },
+    "WANDSLInterfaceConfig1": {
+        "service_type": "urn:dslforum-org:service:WANDSLInterfaceConfig:1",
+        "link_type": "DSL",
+        "actions": {
+            "GetInfo": action_dsl_info,
+            "GetStatisticsTotal": action_dsl_statistics_total,
+            "X_AVM-DE_GetDSLInfo": action_avm_dsl_info
+        }
+    },
+    "UserInterface1": {
+        "service_type": "urn:dslforum-org:service:UserInterface:1",
+        "actions": {
+            "GetInfo": action_user_interface
+        }
+    },
+    "WANPPPConnection1": {
+        "service_type": "urn:dslforum-org:service:WANPPPConnection:1",
+        "link_type": "DSL",
+        "actions": {
+            "GetInfo": action_wan_connection
+        }
+    },
+    "WANIPConnection1": {
+        "service_type": "urn:dslforum-org:service:WANIPConnection:1",
+        "actions": {
+            "GetInfo": action_wan_connection
+        }
+    },
+    "LANHostConfigManagement1": {
+        "service_type": "urn:dslforum-org:service:LANHostConfigManagement:1",
+        "actions": {
+            "GetInfo": action_lan_host_config
+        }
+    },
+    "WLANConfiguration1": {
+        "service_type": "urn:dslforum-org:service:WLANConfiguration:1",
+        "actions": wlan_actions(1)
+    },
+    "WLANConfiguration2": {
+        "service_type": "urn:dslforum-org:service:WLANConfiguration:2",
+        "actions": wlan_actions(2)
+    },
+    "WLANConfiguration3": {
+        "service_type": "urn:dslforum-org:service:WLANConfiguration:3",
+        "actions": wlan_actions(3)
+    },
+    "X_AVM-DE_RemoteAccess1": {
+        "service_type": "urn:dslforum-org:service:X_AVM-DE_RemoteAccess:1",
+        "actions": {
+            "GetDDNSInfo": action_ddns_info
+        }
+    },
+    "LANConfigSecurity1": {
+        "service_type": "urn:dslforum-org:service:LANConfigSecurity:1",
+        "actions": {
+            "X_AVM-DE_GetUserList": action_user_list
+        }
+    }
+}
+
+
+def soap_data_type(value) -> str:
+
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "i4" if value < 2 ** 31 else "ui8"
+
+    return "string"
+
+
+def soap_value(value) -> str:
+
+    if isinstance(value, bool):
+        return "1" if value is True else "0"
+
+    return escape(f"{value}")
+
+
+class FritzBoxSimulator:
+    """
+        simulated FritzBox serving TR-064 and Lua endpoints on two ports
+    """
+
+    # seconds an unused Lua session stays valid, same as on a FritzBox
+    session_lifetime = 1200
+
+    def __init__(self, data: FritzBoxSimulatorData, fault_injection: FaultInjection = None,
+                 address: str = "127.0.0.1", tr064_port: int = 49000, http_port: int = 8080,
+                 username: str = "fritzinfluxdb", password: str = "fritzinfluxdb"):
+
+        self.data = data
+        self.fault_injection = fault_injection or FaultInjection()
+        self.address = address
+        self.ports = [tr064_port, http_port]
+        self.username = username
+        self.password = password
+
+        self.stats = SimulatorStats()
+        self.servers = list()
+        self.sessions = dict()
+        self.challenge = secrets.token_hex(4)
+        self._lock = threading.Lock()
+
+        # services which exist on the simulated FritzBox model
+        self.services = {
+            name: service for name, service in tr064_services.items()
+            if service.get("link_type") is None or service.get("link_type") == data.link_type
+        }
+
+    def start(self) -> None:
+
+        for port in self.ports:
+            server = SimulatorHTTPServer((self.address, port), FritzBoxRequestHandler, self)
+            threading.Thread(target=server.serve_forever, name=f"fritzbox-simulator-{port}", daemon=True).start()
+            self.servers.append(server)
+
+        # ports might have been assigned dynamically
+        self.ports = [x.server_address[1] for x in self.servers]
+
+        log.info(f"FritzBox simulator '{self.data.model}' (FritzOS {self.data.fw_version}) listening on "
+                 f"{self.address} TR-064 port {self.ports[0]}, http port {self.ports[1]}")
+
+    def stop(self) -> None:
+
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+        self.servers = list()
+
+    @property
+    def tr064_port(self):
+        return self.ports[0]
+
+    @property
+    def http_port(self):
+        return self.ports[1]
+
+    @staticmethod
+    def control_url(service_name: str) -> str:
+        return f"/upnp/control/{service_name.lower()}"
+
+    @staticmethod
+    def scpd_url(service_name: str) -> str:
+        return f"/{service_name.lower()}SCPD.xml"
+
+    def get_service_by_url(self, url: str, url_type: str):
+
+        for name in self.services.keys():
+            if getattr(self, url_type)(name) == url:
+                return name
+
+        return None
+
+    def description(self, file_name: str) -> str:
+        """
+        returns the igddesc.xml or tr64desc.xml content
+        """
+
+        service_list = list()
+        for name, service in self.services.items():
+            if service.get("description", "tr64desc.xml") != file_name:
+                continue
+
+            id_namespace = "upnp-org" if file_name == "igddesc.xml" else f"{name[:-1]}-com"
+            service_list.append(
+                f"<service><serviceType>{service.get('service_type')}</serviceType>"
+                f"<serviceId>urn:{id_namespace}:serviceId:{name}</serviceId>"
+                f"<controlURL>{self.control_url(name)}</controlURL>"
+                f"<eventSubURL>/upnp/control/event</eventSubURL>"
+                f"<SCPDURL>{self.scpd_url(name)}</SCPDURL></service>"
+            )
+
+        system_version = ""
+        if file_name == "tr64desc.xml":
+            system_version = "<systemVersion>" + \
+                             "".join(f"<{k}>{v}</{k}>" for k, v in self.data.system_version.items()) + \
+                             "</systemVersion>"
+
+        return (
+            f'<?xml version="1.0"?><root xmlns="urn:dslforum-org:device-1-0">'
+            f'<specVersion><major>1</major><minor>0</minor></specVersion>{system_version}'
+            f'<device><deviceType>urn:dslforum-org:device:InternetGatewayDevice:1</deviceType>'
+            f'<friendlyName>{escape(self.data.model)}</friendlyName><manufacturer>AVM</manufacturer>'
+            f'<modelName>{escape(self.data.model)}</modelName><UDN>uuid:simulator</UDN>'
+            f'<serviceList>{"".join(service_list)}</serviceList></device></root>'
+        )
+
+    def scpd(self, service_name: str) -> str:
+        """
+        returns the service description of a TR-064 service. Argument types are derived from the returned values.
+        """
+
+        service = self.services.get(service_name)
+
+        actions = list()
+        state_variables = dict()
+        for action_name in service.get("actions").keys():
+
+            arguments = list()
+            in_arguments = service.get("in_arguments", dict()).get(action_name, dict())
+            for argument_name, data_type in in_arguments.items():
+                state_variables[f"A_ARG_{argument_name}"] = data_type
+                arguments.append(f"<argument><name>{argument_name}</name><direction>in</direction>"
+                                 f"<relatedStateVariable>A_ARG_{argument_name}</relatedStateVariable></argument>")
+
+            for argument_name, value in self.data.tr064_action_values(service_name, action_name).items():
+                state_variables[f"X_{argument_name}"] = soap_data_type(value)
+                arguments.append(f"<argument><name>{argument_name}</name><direction>out</direction>"
+                                 f"<relatedStateVariable>X_{argument_name}</relatedStateVariable></argument>")
+
+            actions.append(f"<action><name>{action_name}</name>"
+                           f"<argumentList>{''.join(arguments)}</argumentList></action>")
+
+        variables = "".join(f'<stateVariable sendEvents="no"><name>{name}</name>'
+                            f'<dataType>{data_type}</dataType></stateVariable>'
+                            for name, data_type in state_variables.items())
+
+        return (
+            f'<?xml version="1.0"?><scpd xmlns="urn:dslforum-org:service-1-0">'
+            f'<specVersion><major>1</major><minor>0</minor></specVersion>'
+            f'<actionList>{"".join(actions)}</actionList>'
+            f'<serviceStateTable>{variables}</serviceStateTable></scpd>'
+        )
+
+    def box_info(self) -> str:
+
+        return (
+            f'<?xml version="1.0" encoding="utf-8"?><e:BoxInfo xmlns:e="http://jason.avm.de/updatecheck/">'
+            f'<e:Name>{escape(self.data.model)}</e:Name><e:HW>{self.data.system_version.get("HW")}</e:HW>'
+            f'<e:Version>{self.data.software_version}</e:Version><e:Revision>106391</e:Revision>'
+            f'<e:Serial>{self.data.serial_number}</e:Serial><e:OEM>avm</e:OEM><e:Lang>de</e:Lang>'
+            f'<e:Annex>B</e:Annex><e:Lab/><e:Country>049</e:Country><e:Flag>mesh_master</e:Flag>'
+            f'</e:BoxInfo>'
+        )
+
+    # Lua session handling
+    def login(self, username: str, response: str) -> str:
+        """
+        validates a login challenge response and returns a new session id or the invalid session id
+        """
+
+        md5 = hashlib.md5()
+        md5.update(self.challenge.encode('utf-16le'))
+        md5.update('-'.encode('utf-16le'))
+        md5.update(self.password.encode('utf-16le'))
+
+        if username != self.username or response != f"{self.challenge}-{md5.hexdigest()}":
+            return invalid_sid
+
+        sid = secrets.token_hex(8)
+        with self._lock:
+            self.sessions[sid] = time.monotonic()
+
+        return sid
+
+    def session_valid(self, sid: str) -> bool:
+
+        with self._lock:
+            last_used = self.sessions.get(sid)
+
+            if last_used is None:
+                return False
+
+            if time.monotonic() - last_used > self.session_lifetime:
+                del self.sessions[sid]
+                return False
+
+            self.sessions[sid] = time.monotonic()
+
+        return True
+
+    def lua_page(self, params: dict):
+        """
+        returns the data of a data.lua page or None if the page is unknown
+        """
+
+        page = params.get("page")
+
+        if page == "netDev":
+            return self.data.lua_net_dev(params.get("xhrId"))
+        if page == "ecoStat":
+            return self.data.lua_eco_stat()
+        if page == "energy":
+            return self.data.lua_energy()
+        if page == "log":
+            return self.data.lua_log(params.get("filter", "sys"))
+        if page == "dslOv" and self.data.link_type == "DSL":
+            return self.data.lua_dsl_overview()
+        if page == "docOv" and self.data.link_type == "Cable":
+            return self.data.lua_doc_overview()
+        if page == "docInfo" and self.data.link_type == "Cable":
+            return self.data.lua_doc_info()
+        if page == "shareVpn":
+            return self.data.lua_share_vpn()
+        if page == "shareWireguard" and self.data.os_version >= (7, 39):
+            return self.data.lua_share_wireguard()
+
+        return None
+
+
+class FritzBoxRequestHandler(SimulatorRequestHandler):
+    """
+        answers the requests to the simulated FritzBox
+    """
+
+    server_version = "FRITZ!Box"
+
+    def get_params(self) -> dict:
+
+        query = urlsplit(self.path).query
+
+        if self.command == "POST" and self.headers.get("Content-Type", "").startswith("application/x-www-form"):
+            query = self.request_body.decode("utf-8")
+
+        return {key: value[-1] for key, value in parse_qs(query, keep_blank_values=True).items()}
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+
+        self.read_body()
+        self.handle_request()
+
+    def do_POST(self):
+
+        self.read_body()
+        self.handle_request()
+
+    def handle_request(self):
+
+        simulator = self.simulator
+        path = urlsplit(self.path).path
+
+        simulator.fault_injection.delay()
+
+        # errors are only injected into data requests, descriptions and logins always succeed
+        is_data_request = path in data_paths or path.startswith("/upnp/control/")
+
+        if is_data_request is True and simulator.fault_injection.should_fail() is True:
+            if path.startswith("/upnp/control/"):
+                self.send_soap_fault(501, "Action Failed", status=500)
+            else:
+                self.send_content(500, "Internal Server Error")
+            return
+
+        if path in ["/tr64desc.xml", "/igddesc.xml"]:
+            self.send_content(200, simulator.description(path.lstrip("/")), "text/xml")
+        elif path == "/jason_boxinfo.xml":
+            self.send_content(200, simulator.box_info(), "text/xml")
+        elif path.endswith("SCPD.xml") and simulator.get_service_by_url(path, "scpd_url") is not None:
+            self.send_content(200, simulator.scpd(simulator.get_service_by_url(path, "scpd_url")), "text/xml")
+        elif path.startswith("/upnp/control/") and self.command == "POST":
+            self.handle_soap_request(path)
+        elif path == "/login_sid.lua":
+            self.handle_login()
+        elif path == "/data.lua":
+            self.handle_data_lua()
+        elif path == "/webservices/homeautoswitch.lua":
+            self.handle_home_automation()
+        elif path == "/fon_num/foncalls_list.lua":
+            self.handle_call_list()
+        else:
+            self.send_content(404, login_page, "text/html")
+
+    def send_soap_fault(self, error_code: int, description: str, status: int = 500):
+
+        self.send_content(status, (
+            '<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body><s:Fault>'
+            '<faultcode>s:Client</faultcode><faultstring>UPnPError</faultstring><detail>\n'
+            '<UPnPError xmlns="urn:dslforum-org:control-1-0">\n'
+            f'<errorCode>{error_code}</errorCode>\n<errorDescription>{description}</errorDescription>\n'
+            '</UPnPError>\n</detail></s:Fault></s:Body></s:Envelope>'
+        ), 'text/xml; charset="utf-8"')
+
+    def handle_soap_request(self, path):
+
+        simulator = self.simulator
+        service_name = simulator.get_service_by_url(path, "control_url")
+        soap_action = self.headers.get("soapaction", "").strip('"')
+        action_name = soap_action.split("#")[-1]
+
+        if service_name is None:
+            self.send_soap_fault(401, "Invalid Action")
+            return
+
+        # validate request body
+        try:
+            fromstring(self.request_body)
+        except Exception:
+            self.send_soap_fault(402, "Invalid Args")
+            return
+
+        values = simulator.data.tr064_action_values(service_name, action_name)
+        if values is None:
+            self.send_soap_fault(401, "Invalid Action")
+            return
+
+        service_type = simulator.services.get(service_name).get("service_type")
+        arguments = "".join(f"<{k}>{soap_value(v)}</{k}>" for k, v in values.items())
+
+        self.send_content(200, (
+            '<?xml version="1.0"?><s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+            f'<u:{action_name}Response xmlns:u="{service_type}">{arguments}</u:{action_name}Response>'
+            '</s:Body></s:Envelope>'
+        ), 'text/xml; charset="utf-8"')
+
+    def handle_login(self):
+
+        params = self.get_params()
+
+        sid = invalid_sid
+        if params.get("response") is not None:
+            sid = self.simulator.login(params.get("username"), params.get("response"))
+        elif params.get("sid") is not None and self.simulator.session_valid(params.get("sid")) is True:
+            sid = params.get("sid")
+
+        self.send_content(200, (
+            f'<?xml version="1.0" encoding="utf-8"?><SessionInfo><SID>{sid}</SID>'
+            f'<Challenge>{self.simulator.challenge}</Challenge><BlockTime>0</BlockTime>'
+            f'<Rights></Rights><Users><User last="1">{escape(self.simulator.username)}</User></Users>'
+            f'</SessionInfo>'
+        ), "text/xml")
+
+    def session_valid(self, params) -> bool:
+
+        if self.simulator.session_valid(params.get("sid")) is True:
+            return True
+
+        self.send_content(403, login_page, "text/html")
+
+        return False
+
+    def handle_data_lua(self):
+
+        params = self.get_params()
+
+        if self.session_valid(params) is False:
+            return
+
+        data = self.simulator.lua_page(params)
+        if data is None:
+            # the FritzBox returns its start page for unknown pages
+            self.send_content(200, login_page, "text/html")
+            return
+
+        data["sid"] = params.get("sid")
+        self.send_content(200, json.dumps(data), "application/json")
+
+    def handle_home_automation(self):
+
+        params = self.get_params()
+
+        if self.session_valid(params) is False:
+            return
+
+        command = params.get("switchcmd")
+
+        if command in ["getswitchpower", "getswitchenergy", "getswitchstate", "gettemperature"]:
+            value = self.simulator.data.home_automation_device_value(command, params.get("ain"))
+            self.send_content(200, f"{value}\n", "text/plain")
+            return
+
+        if command != "getdevicelistinfos":
+            self.send_content(400, "Bad Request")
+            return
+
+        self.send_content(200, self.simulator.data.home_automation_device_list(), "text/xml")
+
+    def handle_call_list(self):
+
+        params = self.get_params()
+
+        if self.session_valid(params) is False:
+            return
+
+        self.send_content(200, self.simulator.data.call_list(), "text/csv; charset=utf-8")
+
+
+def fixture_size(value) -> int:
+
+    size = int(value)
+    if not min_fixture_size <= size <= max_fixture_size:
+        raise ValueError(f"value must be between {min_fixture_size} and {max_fixture_size}")
+
+    return size
+
+
+def parse_command_line():
+    """
+    parse command line arguments of the FritzBox simulator
+
+    Returns
+    -------
+    ArgumentParser object: with parsed command line arguments
+    """
+
+    parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("--listen", default="127.0.0.1",
+                        help="address to listen on")
+    parser.add_argument("--tr064-port", default=49000, type=int,
+                        help="port to serve the TR-064 interface on")
+    parser.add_argument("--http-port", default=8080, type=int,
+                        help="port to serve the Lua interface on, fritzinfluxdb expects it on port 80")
+    parser.add_argument("--username", default="fritzinfluxdb",
+                        help="user name to accept for Lua logins")
+    parser.add_argument("--password", default="fritzinfluxdb",
+                        help="password to accept for Lua logins")
+    parser.add_argument("--fw-version", default="7.57",
+                        help="simulated FritzOS version")
+    parser.add_argument("--link-type", default="DSL", choices=["DSL", "Cable"],
+                        help="simulated internet connection type")
+    parser.add_argument("--hosts", default=20, type=fixture_size,
+                        help=f"number of network hosts ({min_fixture_size}-{max_fixture_size})")
+    parser.add_argument("--devices", default=10, type=fixture_size,
+                        help=f"number of home automation devices ({min_fixture_size}-{max_fixture_size})")
+    parser.add_argument("--log-lines", default=50, type=fixture_size,
+                        help=f"number of lines per log ({min_fixture_size}-{max_fixture_size})")
+    parser.add_argument("--calls", default=20, type=fixture_size,
+                        help=f"number of entries in the call list ({min_fixture_size}-{max_fixture_size})")
+    parser.add_argument("--latency", default=0, type=int,
+                        help="latency in milliseconds added to every request")
+    parser.add_argument("--latency-jitter", default=0, type=int,
+                        help="max random latency in milliseconds added on top of latency")
+    parser.add_argument("--error-rate", default=0.0, type=float,
+                        help="probability (0.0 - 1.0) of a request to be answered with an error")
+    parser.add_argument("--seed", default=None, type=int,
+                        help="seed for generated data and injected faults to get reproducible runs")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="log every request")
+
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse_command_line()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose is True else logging.INFO,
+                        format="%(asctime)s - %(levelname)s: %(message)s")
+
+    data = FritzBoxSimulatorData(hosts=args.hosts, devices=args.devices, log_lines=args.log_lines,
+                                 calls=args.calls, fw_version=args.fw_version, link_type=args.link_type,
+                                 seed=args.seed)
+
+    fault_injection = FaultInjection(latency=args.latency, latency_jitter=args.latency_jitter,
+                                     error_rate=args.error_rate, seed=args.seed)
+
+    run_simulator(FritzBoxSimulator(data, fault_injection, address=args.listen, tr064_port=args.tr064_port,
+                                    http_port=args.http_port, username=args.username, password=args.password))
+
+
+if __name__ == "__main__":
+    main()
+
+# EOF
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+"""
+    Local InfluxDB stand-in which accepts writes via the InfluxDB 1 (/write) and InfluxDB 2 (/api/v2/write) API.
+
+    Supports all requests fritzinfluxdb uses during setup (ping, databases/retention policies, buckets and
+    database mappings). Written points are only counted, not stored. Latency, server errors, dropped
+    connections and "points beyond retention policy" responses can be injected.
+
+    usage: python3 -m simulator.influxdb --port 8086 --latency 50 --error-rate 0.01 --retention 3600
+"""
+
+import gzip
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from urllib.parse import urlsplit, parse_qs
+
+from simulator.common import (
+    FaultInjection,
+    SimulatorHTTPServer,
+    SimulatorRequestHandler,
+    SimulatorStats,
+    run_simulator
+)
+
+log = logging.getLogger("fritzinfluxdb.simulator")
+
+# factor to convert a timestamp of the given write precision to seconds
+precision_factors = {
+    "ns": 1e-9, "n": 1e-9,
+    "us": 1e-6, "u": 1e-6,
+    "ms": 1e-3,
+    "s": 1
+}
+
+query_show_retention_policies = re.compile(r'SHOW RETENTION POLICIES ON "?([^"]+)"?', re.IGNORECASE)
+query_create_database = re.compile(r'CREATE DATABASE "?([^"]+)"?', re.IGNORECASE)
+query_create_retention_policy = re.compile(r'CREATE RETENTION POLICY "?([^"\s]+)"? ON "?([^"\s]+)"? '
+                                           r'DURATION (\S+)', re.IGNORECASE)
+
+
+class WriteStats:
+    """
+        counts accepted and rejected writes and points. The write rate is only calculated
+        if the writes span at least one second.
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self.writes_accepted = 0
+        self.writes_rejected = 0
+        self.points_accepted = 0
+        self.points_rejected = 0
+        self.bytes_accepted = 0
+        self.first_write = None
+        self.last_write = None
+
+    def add_write(self, points_accepted: int, points_rejected: int, num_bytes: int) -> None:
+
+        with self._lock:
+            if self.first_write is None:
+                self.first_write = time.monotonic()
+            self.last_write = time.monotonic()
+
+            if points_rejected > 0:
+                self.writes_rejected += 1
+            else:
+                self.writes_accepted += 1
+                self.bytes_accepted += num_bytes
+
+            self.points_accepted += points_accepted
+            self.points_rejected += points_rejected
+
+    def as_dict(self) -> dict:
+
+        with self._lock:
+            duration = 0
+            if self.first_write is not None:
+                duration = self.last_write - self.first_write
+
+            return {
+                "writes_accepted": self.writes_accepted,
+                "writes_rejected": self.writes_rejected,
+                "points_accepted": self.points_accepted,
+                "points_rejected": self.points_rejected,
+                "bytes_accepted": self.bytes_accepted,
+                "points_per_second": round(self.points_accepted / duration, 1) if duration >= 1 else None
+            }
+
+
+class InfluxDBSimulator:
+    """
+        simulated InfluxDB serving the InfluxDB 1 and 2 write and setup endpoints
+    """
+
+    def __init__(self, fault_injection: FaultInjection = None, address: str = "127.0.0.1", port: int = 8086,
+                 retention: int = None, version: str = "2.7.1", organisation: str = "fritzinfluxdb",
+                 keep_points: bool = False):
+        """
+        Parameters
+        ----------
+        fault_injection: FaultInjection
+            latency and errors to inject
+        address: str
+            address to listen on
+        port: int
+            port to listen on
+        retention: int
+            max age of points in seconds, older points are rejected
+        version: str
+            InfluxDB version to report
+        organisation: str
+            name of the InfluxDB 2 organisation
+        keep_points: bool
+            keep all accepted lines in memory
+        """
+
+        self.fault_injection = fault_injection or FaultInjection()
+        self.address = address
+        self.port = port
+        self.retention = retention
+        self.version = version
+        self.keep_points = keep_points
+
+        self.stats = SimulatorStats()
+        self.write_stats = WriteStats()
+        self.points = list()
+        self.server = None
+
+        self._lock = threading.Lock()
+
+        self.organisation = {"id": secrets.token_hex(8), "name": organisation}
+
+        # InfluxDB 1 databases and InfluxDB 2 buckets including the default system buckets
+        self.databases = {"_internal": list()}
+        self.buckets = list()
+        self.dbrps = list()
+
+        for bucket_name in ["_monitoring", "_tasks"]:
+            self.create_bucket({"name": bucket_name, "retentionRules": list()})
+
+    def start(self) -> None:
+
+        self.server = SimulatorHTTPServer((self.address, self.port), InfluxDBRequestHandler, self)
+        threading.Thread(target=self.server.serve_forever, name="influxdb-simulator", daemon=True).start()
+
+        self.port = self.server.server_address[1]
+
+        log.info(f"InfluxDB simulator (version {self.version}) listening on {self.address} port {self.port}")
+
+    def stop(self) -> None:
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+        log.info(f"InfluxDB simulator write stats: {self.write_stats.as_dict()}")
+
+    def create_bucket(self, bucket_data: dict) -> dict:
+
+        bucket = {
+            "id": secrets.token_hex(8),
+            "orgID": self.organisation.get("id"),
+            "name": bucket_data.get("name"),
+            "description": bucket_data.get("description"),
+            "retentionRules": bucket_data.get("retentionRules") or list(),
+            "type": "system" if f"{bucket_data.get('name')}".startswith("_") else "user"
+        }
+
+        with self._lock:
+            self.buckets.append(bucket)
+
+        return bucket
+
+    def bucket_exists(self, name: str) -> bool:
+
+        return name in [x.get("name") for x in self.buckets] + [x.get("id") for x in self.buckets]
+
+    def database_exists(self, name: str) -> bool:
+
+        # InfluxDB 2 maps databases to buckets
+        return name in self.databases or self.bucket_exists(name)
+
+    def split_points(self, body: bytes, precision: str):
+        """
+        split a line protocol body into lines which are within and beyond the retention period
+
+        Returns
+        -------
+        tuple: accepted lines, number of rejected lines
+        """
+
+        lines = [x for x in body.decode("utf-8").split("\n") if len(x.strip()) > 0 and not x.startswith("#")]
+
+        if self.retention is None:
+            return lines, 0
+
+        factor = precision_factors.get(precision, 1e-9)
+        oldest_permitted = time.time() - self.retention
+
+        accepted = list()
+        rejected = 0
+        for line in lines:
+            timestamp = line.rsplit(" ", 1)[-1]
+            if timestamp.isdigit() and int(timestamp) * factor < oldest_permitted:
+                rejected += 1
+            else:
+                accepted.append(line)
+
+        return accepted, rejected
+
+    def write(self, body: bytes, precision: str):
+        """
+        perform a write
+
+        Returns
+        -------
+        int: number of points dropped as they are beyond the retention period
+        """
+
+        accepted, rejected = self.split_points(body, precision)
+
+        self.write_stats.add_write(len(accepted), rejected, len(body))
+
+        if self.keep_points is True:
+            with self._lock:
+                self.points.extend(accepted)
+
+        return rejected
+
+    def query(self, query: str) -> dict:
+        """
+        answer the InfluxQL queries issued by the InfluxDB 1 client during setup
+        """
+
+        result = {"statement_id": 0}
+
+        if query.upper().startswith("SHOW DATABASES"):
+            result["series"] = [{
+                "name": "databases",
+                "columns": ["name"],
+                "values": [[x] for x in self.databases.keys()]
+            }]
+
+        elif query_show_retention_policies.match(query):
+            database = query_show_retention_policies.match(query).group(1)
+            if database not in self.databases:
+                return {"statement_id": 0, "error": f"database not found: {database}"}
+
+            result["series"] = [{
+                "columns": ["name", "duration", "shardGroupDuration", "replicaN", "default"],
+                "values": [[x.get("name"), x.get("duration"), "24h0m0s", 1, x.get("default")]
+                           for x in self.databases.get(database)]
+            }]
+
+        elif query_create_database.match(query):
+            with self._lock:
+                self.databases.setdefault(query_create_database.match(query).group(1), list())
+
+        elif query_create_retention_policy.match(query):
+            name, database, duration = query_create_retention_policy.match(query).groups()
+            if database not in self.databases:
+                return {"statement_id": 0, "error": f"database not found: {database}"}
+
+            with self._lock:
+                self.databases[database].append({
+                    "name": name, "duration": duration, "default": "DEFAULT" in query.upper()
+                })
+
+        return result
+
+
+class InfluxDBRequestHandler(SimulatorRequestHandler):
+    """
+        answers the requests to the simulated InfluxDB
+    """
+
+    server_version = "InfluxDB"
+
+    def get_params(self) -> dict:
+
+        query = urlsplit(self.path).query
+
+        if self.command == "POST" and self.headers.get("Content-Type", "").startswith("application/x-www-form"):
+            query = f"{query}&{self.request_body.decode('utf-8')}"
+
+        return {key: value[-1] for key, value in parse_qs(query, keep_blank_values=True).items()}
+
+    def get_json_body(self) -> dict:
+
+        # noinspection PyBroadException
+        try:
+            return json.loads(self.request_body)
+        except Exception:
+            return dict()
+
+    def send_json(self, status: int, data):
+
+        headers = {"X-Influxdb-Version": self.simulator.version}
+        self.send_content(status, json.dumps(data), "application/json; charset=utf-8", headers)
+
+    def send_no_content(self):
+
+        self.send_content(204, b"", "text/plain", {"X-Influxdb-Version": self.simulator.version})
+
+    def do_GET(self):
+
+        self.read_body()
+        self.handle_request()
+
+    def do_HEAD(self):
+
+        self.read_body()
+        self.handle_request()
+
+    def do_POST(self):
+
+        self.read_body()
+        self.handle_request()
+
+    def handle_request(self):
+
+        simulator = self.simulator
+        path = urlsplit(self.path).path
+
+        simulator.fault_injection.delay()
+
+        # faults are only injected into writes
+        if path in ["/write", "/api/v2/write"]:
+            if simulator.fault_injection.should_drop() is True:
+                self.drop_connection()
+                return
+
+            if simulator.fault_injection.should_fail() is True:
+                self.send_json(503, {"code": "unavailable", "message": "simulated server error",
+                                     "error": "simulated server error"})
+                return
+
+        if path in ["/ping", "/health"]:
+            self.send_no_content()
+        elif path == "/query":
+            self.handle_query()
+        elif path == "/write":
+            self.handle_write_v1()
+        elif path == "/api/v2/write":
+            self.handle_write_v2()
+        elif path == "/api/v2/orgs":
+            self.send_json(200, {"orgs": [simulator.organisation]})
+        elif path == "/api/v2/buckets":
+            self.handle_buckets()
+        elif path == "/api/v2/dbrps":
+            self.handle_dbrps()
+        else:
+            self.send_json(404, {"code": "not found", "message": "path not found"})
+
+    def handle_query(self):
+
+        params = self.get_params()
+
+        results = [self.simulator.query(x.strip()) for x in params.get("q", "").split(";") if len(x.strip()) > 0]
+
+        self.send_json(200, {"results": results})
+
+    def decompress_body(self) -> bytes:
+
+        if self.headers.get("Content-Encoding") == "gzip":
+            return gzip.decompress(self.request_body)
+
+        return self.request_body
+
+    def handle_write_v1(self):
+
+        params = self.get_params()
+        database = params.get("db")
+
+        if database is None or self.simulator.database_exists(database) is False:
+            self.send_json(404, {"error": f'database not found: "{database}"'})
+            return
+
+        dropped = self.simulator.write(self.decompress_body(), params.get("precision", "ns"))
+
+        if dropped > 0:
+            self.send_json(400, {"error": f"partial write: points beyond retention policy dropped={dropped}"})
+            return
+
+        self.send_no_content()
+
+    def handle_write_v2(self):
+
+        params = self.get_params()
+        bucket = params.get("bucket")
+
+        if bucket is None or self.simulator.bucket_exists(bucket) is False:
+            self.send_json(404, {"code": "not found", "message": f'bucket "{bucket}" not found'})
+            return
+
+        dropped = self.simulator.write(self.decompress_body(), params.get("precision", "ns"))
+
+        if dropped > 0:
+            self.send_json(422, {"code": "unprocessable entity",
+                                 "message": "failure writing points to database: "
+                                            f"partial write: points beyond retention policy dropped={dropped}"})
+            return
+
+        self.send_no_content()
+
+    def handle_buckets(self):
+
+        if self.command == "POST":
+            bucket_data = self.get_json_body()
+            if self.simulator.bucket_exists(bucket_data.get("name")):
+                self.send_json(422, {"code": "conflict", "message": "bucket with name already exists"})
+                return
+
+            self.send_json(201, self.simulator.create_bucket(bucket_data))
+            return
+
+        params = self.get_params()
+        buckets = self.simulator.buckets
+        if params.get("name") is not None:
+            buckets = [x for x in buckets if x.get("name") == params.get("name")]
+
+        self.send_json(200, {"buckets": buckets})
+
+    def handle_dbrps(self):
+
+        simulator = self.simulator
+
+        if self.command == "POST":
+            dbrp_data = self.get_json_body()
+            dbrp = {
+                "id": secrets.token_hex(8),
+                "orgID": simulator.organisation.get("id"),
+                "bucketID": dbrp_data.get("bucketID"),
+                "database": dbrp_data.get("database"),
+                "retention_policy": dbrp_data.get("retention_policy"),
+                "default": bool(dbrp_data.get("default")),
+                "virtual": False
+            }
+            simulator.dbrps.append(dbrp)
+            self.send_json(201, dbrp)
+            return
+
+        params = self.get_params()
+        dbrps = [x for x in simulator.dbrps if params.get("bucketID") in [None, x.get("bucketID")]]
+
+        self.send_json(200, {"content": dbrps})
+
+
+def parse_command_line():
+    """
+    parse command line arguments of the InfluxDB simulator
+
+    Returns
+    -------
+    ArgumentParser object: with parsed command line arguments
+    """
+
+    parser = ArgumentParser(description=__doc__, formatter_class=RawDescriptionHelpFormatter)
+
+    parser.add_argument("--listen", default="127.0.0.1",
+                        help="address to listen on")
+    parser.add_argument("--port", default=8086, type=int,
+                        help="port to listen on")
+    parser.add_argument("--version-string", default="2.7.1",
+                        help="InfluxDB version to report")
+    parser.add_argument("--organisation", default="fritzinfluxdb",
+                        help="name of the InfluxDB 2 organisation")
+    parser.add_argument("--retention", default=None, type=int,
+                        help="reject points older than this number of seconds as beyond retention policy")
+    parser.add_argument("--latency", default=0, type=int,
+                        help="latency in milliseconds added to every request")
+    parser.add_argument("--latency-jitter", default=0, type=int,
+                        help="max random latency in milliseconds added on top of latency")
+    parser.add_argument("--error-rate", default=0.0, type=float,
+                        help="probability (0.0 - 1.0) of a write to be answered with a 503 error")
+    parser.add_argument("--drop-rate", default=0.0, type=float,
+                        help="probability (0.0 - 1.0) of a write connection to be dropped without response")
+    parser.add_argument("--seed", default=None, type=int,
+                        help="seed for injected faults to get reproducible runs")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="log every request")
+
+    return parser.parse_args()
+
+
+def main():
+
+    args = parse_command_line()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose is True else logging.INFO,
+                        format="%(asctime)s - %(levelname)s: %(message)s")
+
+    fault_injection = FaultInjection(latency=args.latency, latency_jitter=args.latency_jitter,
+                                     error_rate=args.error_rate, drop_rate=args.drop_rate, seed=args.seed)
+
+    run_simulator(InfluxDBSimulator(fault_injection, address=args.listen, port=args.port, retention=args.retention,
+                                    version=args.version_string, organisation=args.organisation))
+
+
+if __name__ == "__main__":
+    main()
+
+# EOF
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import configparser
+import unittest
+from datetime import datetime
+
+import pytz
+
+from fritzinfluxdb.classes.fritzbox.handler import FritzBoxHandler
+
+
+class TestCounterRate(unittest.TestCase):
+
+    def test_rate_uses_request_time(self):
+        """
+        the rate of a counter has to be derived from the exact request times, not the truncated time stamps
+        """
+
+        config = configparser.ConfigParser()
+        config.read_dict({"fritzbox": {"hostname": "localhost", "username": "test", "password": "test",
+                                       "counter_deltas": "true"}})
+
+        handler = FritzBoxHandler(config)
+        service = next(x for x in handler.services if "NewBytesSent" in x.counters)
+
+        for timestamp, value in [(datetime(2023, 1, 1, 12, 0, 0, 900_000, tzinfo=pytz.utc), 1_000),
+                                 (datetime(2023, 1, 1, 12, 0, 10, 100_000, tzinfo=pytz.utc), 10_200)]:
+            handler.current_timestamp = timestamp
+            handler.extract_values(service, {"NewBytesSent": value})
+
+        values = {x.name: x.value for x in handler.current_result_list}
+
+        self.assertEqual(values.get("lan_totalbytessent_delta"), 9_200)
+        self.assertAlmostEqual(values.get("lan_totalbytessent_rate"), 1_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import configparser
+import tempfile
+import unittest
+
+from fritzinfluxdb.classes.fritzbox.config import FritzBoxConfig
+
+
+class TestFritzBoxConfig(unittest.TestCase):
+
+    @staticmethod
+    def get_config(**options):
+
+        config = configparser.ConfigParser()
+        config.read_dict({"fritzbox": {"hostname": "localhost", "username": "test", "password": "test",
+                                       "cache_enabled": "false", **options}})
+
+        return FritzBoxConfig(config)
+
+    def test_empty_replay_file(self):
+        """
+        an empty replay file must not enable the replay mode
+        """
+
+        config = self.get_config(replay_file="")
+
+        self.assertIsNone(config.replay_file)
+        self.assertFalse(config.parser_error)
+
+    def test_replay_file_exists(self):
+        """
+        a defined replay file has to exist
+        """
+
+        self.assertTrue(self.get_config(replay_file="/nonexistent/fritzbox.jsonl.gz").parser_error)
+
+        with tempfile.NamedTemporaryFile() as replay_file:
+            config = self.get_config(replay_file=replay_file.name)
+
+            self.assertEqual(config.replay_file, replay_file.name)
+            self.assertFalse(config.parser_error)
+
+
+if __name__ == "__main__":
+    unittest.main()
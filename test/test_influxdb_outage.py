@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import configparser
+import unittest
+from datetime import datetime
+
+import pytz
+
+from fritzinfluxdb.classes.common import FritzMeasurement, BoundedQueue
+from fritzinfluxdb.classes.influxdb.handler import InfluxHandler
+
+
+class TestInfluxDBOutage(unittest.TestCase):
+
+    def test_buffer_absorbs_outage(self):
+        """
+        measurements queued while the writer waits for the next write retry have to end up in the buffer
+        """
+
+        config = configparser.ConfigParser()
+        config.read_dict({"influxdb": {"version": "2", "token": "test", "organisation": "test", "bucket": "test"}})
+
+        handler = InfluxHandler(config)
+        handler.write_interval = 0.01
+
+        async def failed_write():
+            # InfluxDB is unavailable, the next retry is far in the future
+            handler.last_write_retry = datetime.now(pytz.utc)
+            handler.current_retry_interval = handler.max_retry_interval
+
+        handler.write_data = failed_write
+
+        async def run():
+            queue = BoundedQueue("measurements", 1_000, "drop_oldest")
+            task = asyncio.ensure_future(handler.task_loop(queue))
+
+            for batch in range(15):
+                queue.put_nowait([FritzMeasurement(f"value_{batch}_{x}", x, box_tag="test") for x in range(1_000)])
+                await asyncio.sleep(0.05)
+
+            await asyncio.sleep(0.05)
+            task.cancel()
+
+            return queue.qsize()
+
+        queue_size = asyncio.run(run())
+
+        self.assertEqual(queue_size, 0)
+        self.assertEqual(len(handler.buffer), 15_000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import configparser
+import unittest
+from datetime import datetime
+
+import pytz
+
+from fritzinfluxdb.classes.fritzbox.handler import FritzBoxHandler
+from fritzinfluxdb.classes.influxdb.rollup import RollupEngine
+from fritzinfluxdb.classes.metrics import get_metrics
+
+
+class TestOnlineMonitorRollup(unittest.TestCase):
+
+    def test_expanded_series_rollup(self):
+        """
+        all samples of an expanded online monitor history have to be aggregated, none of them is late
+        """
+
+        config = configparser.ConfigParser()
+        config.read_dict({"fritzbox": {"hostname": "localhost", "username": "test", "password": "test"}})
+
+        handler = FritzBoxHandler(config)
+        service = next(x for x in handler.services if x.series is not None)
+
+        # 20 samples, newest first, from 12:00:40 to 12:02:15 spanning two complete and one open 60 second window
+        handler.current_timestamp = datetime(2023, 1, 1, 12, 2, 15, tzinfo=pytz.utc)
+        handler.extract_series(service, {"Newds_current_bps": ",".join(f"{x}" for x in range(20, 0, -1))})
+
+        measurements = [x for x in handler.current_result_list if x.name == "online_monitor_downstream_bps"]
+        self.assertEqual([x.value for x in measurements], list(range(1, 21)))
+
+        late_key = get_metrics().key("rollup_late_measurements_total", {"tier": "1m"})
+        late_before = get_metrics().counters.get(late_key, 0)
+
+        rollup = RollupEngine("fritzbox", [("1m", 60)])
+        rollup.grace_period = 0
+        completed = rollup.add(measurements)
+
+        self.assertEqual(get_metrics().counters.get(late_key, 0), late_before)
+
+        aggregates = {(x.timestamp, x.name.split("_")[-1]): x.value for x in completed}
+        for minute, minimum, maximum in [(0, 1, 4), (1, 5, 16)]:
+            window_start = datetime(2023, 1, 1, 12, minute, 0, tzinfo=pytz.utc)
+            self.assertEqual(aggregates.get((window_start, "min")), minimum)
+            self.assertEqual(aggregates.get((window_start, "max")), maximum)
+
+        self.assertEqual(sum(x.count for x in rollup.windows.values()), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
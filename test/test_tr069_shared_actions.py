@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2022 - 2023 Ricardo Bartels. All rights reserved.
+#
+#  fritzinfluxdb.py
+#
+#  This work is licensed under the terms of the MIT license.
+#  For a copy, see file LICENSE.txt included in this
+#  repository or visit: <https://opensource.org/licenses/MIT>.
+
+import asyncio
+import configparser
+import unittest
+from datetime import datetime, timedelta
+
+import pytz
+
+from fritzinfluxdb.classes.fritzbox.handler import FritzBoxHandler
+
+
+class TestTR069SharedActions(unittest.TestCase):
+
+    def test_linked_services_share_scheduling_pass(self):
+        """
+        services sharing an action have to be due in the same scheduling pass and the action
+        has to be requested only once per pass
+        """
+
+        config = configparser.ConfigParser()
+        config.read_dict({"fritzbox": {"hostname": "localhost", "username": "test", "password": "test",
+                                       "cache_enabled": "false"}})
+
+        handler = FritzBoxHandler(config)
+        handler.services = [x for x in handler.services
+                            if x.name in ["WANCommonInterfaceConfig", "WANCommonInterfaceConfig1"]]
+
+        self.assertEqual(len(handler.services), 2)
+        self.assertEqual(len(set(x.schedule_group for x in handler.services)), 1)
+
+        # passes in which the FritzBox has been requested
+        requested_passes = list()
+
+        class FakeSession:
+            @staticmethod
+            def call_action(*_, **__):
+                requested_passes.append(handler.current_pass)
+                return {"NewTotalNumberSyncGroups": 1}
+
+        # passes in which each service has been queried
+        queried_passes = {x.name: set() for x in handler.services}
+
+        query_service_data = handler.query_service_data
+
+        def record_query(service):
+            queried_passes[service.name].add(handler.current_pass)
+            query_service_data(service)
+
+        handler.session = FakeSession()
+        handler.query_service_data = record_query
+        handler.discovery_done = True
+
+        for service, interval in zip(handler.services, [1, 3]):
+            service.interval = interval
+            service.last_query = datetime.now(pytz.utc) - timedelta(seconds=interval)
+
+        class FakeQueue:
+            async def put_batch(self, _):
+                pass
+
+        async def run():
+            task = asyncio.ensure_future(handler.task_loop(FakeQueue()))
+            await asyncio.sleep(6.5)
+            task.cancel()
+
+        asyncio.run(run())
+
+        passes_short_interval, passes_long_interval = [queried_passes[x.name] for x in handler.services]
+
+        self.assertGreaterEqual(len(passes_short_interval), 5)
+        self.assertGreaterEqual(len(passes_long_interval), 2)
+        self.assertTrue(passes_long_interval.issubset(passes_short_interval))
+
+        # one request per pass, the service with the longer interval always gets the shared result
+        self.assertEqual(sorted(requested_passes), sorted(passes_short_interval))
+
+
+if __name__ == "__main__":
+    unittest.main()